@@ -0,0 +1,286 @@
+"""命令行批量分析：无需图形界面，直接调用 DeepseekAnalyzer 分析一个或多个聊天记录文件（CSV、JSONL 及其压缩文件）
+
+用法示例：
+    python batch_analyze.py data/*.csv -o results.jsonl
+    python batch_analyze.py "exports/**/*.csv" --model deepseek-reasoner --mode chunked
+    python batch_analyze.py data/*.csv --estimate
+    python batch_analyze.py data/*.csv --mode timeline --window week --since 2024-01-01 --until 2024-03-31
+    python batch_analyze.py data/*.csv --mode focused --query "登录 支付" --authors 张三,李四
+    python batch_analyze.py data/*.csv --metrics metrics.json --profile profiles
+    python batch_analyze.py exports/*.jsonl.gz legacy/*.csv --encoding gbk
+
+本模块及其依赖均不导入 PyQt5，可在服务器或定时任务中运行。
+"""
+
+import argparse
+import codecs
+import glob
+import json
+import os
+import sys
+import time
+from datetime import date
+
+from chat_import import iter_chat_chunks, IMPORTERS
+from chat_log import ChatLog
+from deepseek_analyzer import create_analyzer
+from incremental import make_watermark, resume_position, latest_analysis
+from metrics import METRICS, maybe_profile, format_summary
+from progress import ProgressTracker, format_progress
+from search_index import SearchIndex
+from timeline import TimeIndex, DAY, day_start, format_timeline
+from token_estimate import estimate_tokens, estimate_log_tokens
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ESTIMATE_MODELS = ("deepseek-chat", "deepseek-reasoner")
+
+
+def expand_paths(patterns):
+    """展开文件路径或通配符（支持 ** 递归匹配），按出现顺序去重"""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def load_chat_log(file_path, encoding=None, format=None):
+    """读取整个聊天记录文件，encoding / format 为 None 时自动识别"""
+    chat_log = ChatLog()
+    with METRICS.timer("stage_seconds", stage="import"):
+        for chunk, _, _ in iter_chat_chunks(file_path, encoding=encoding, format=format):
+            chat_log.extend(chunk)
+    return chat_log
+
+
+def iter_previous_records(output_file):
+    """从新到旧读取输出文件中已有的结果记录"""
+    if not os.path.exists(output_file):
+        return
+    with open(output_file, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    for line in reversed(lines):
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+def analyze_file(analyzer, path, system_prompt, mode, incremental, output_file, compress=False, progress=None,
+                 window="day", date_range=None, query=None, authors=None, import_options=None):
+    """分析单个文件，返回要写入输出文件的结果记录
+
+    date_range 为 (开始, 结束) 秒数，任一端可为 None；指定时只分析该范围内的消息，且不进行增量分析。
+    focused 模式按 query 检索（可限定作者 authors 和 date_range），只分析命中的消息及其上下文。
+    import_options 为传给 load_chat_log 的 encoding / format。
+    """
+    progress = progress or ProgressTracker()
+    chat_log = load_chat_log(path, **(import_options or {}))
+    source = os.path.abspath(path)
+    record = {"file": path, "messages": len(chat_log), "watermark": make_watermark(chat_log, source)}
+
+    if mode == "focused":
+        hits = search_file(chat_log, query, authors, date_range)
+        record.update({"watermark": None, "query": query, "hits": len(hits)})
+        if not len(hits):
+            raise ValueError(f"没有找到与“{query}”相关的消息")
+        record["result"] = analyzer.analyze_focused(chat_log, query, hits.rows.tolist(), system_prompt,
+                                                    progress=progress)
+        return record
+
+    if date_range:
+        chat_log = TimeIndex(chat_log).select(*date_range)
+        # 只分析了部分消息，不作为之后增量分析的起点
+        record.update({"watermark": None, "selected_messages": len(chat_log)})
+    elif incremental:
+        previous = latest_analysis(iter_previous_records(output_file), source)
+        start = resume_position(chat_log, previous["watermark"]) if previous else None
+        if start is not None:
+            record["new_messages"] = len(chat_log) - start
+            if start >= len(chat_log):
+                # 没有新增消息，沿用上次的结果
+                record["result"] = previous["result"]
+            else:
+                lines = analyzer.build_lines(chat_log.slice(start, len(chat_log)), compress)
+                record["result"] = analyzer.analyze_incremental(previous["result"], lines, system_prompt,
+                                                                progress=progress)
+            return record
+
+    if mode == "timeline":
+        windows = TimeIndex(chat_log).windows(window)
+        summaries = analyzer.analyze_windows(windows, system_prompt, compress, progress=progress)
+        record["windows"] = [
+            {"window": window.label, "messages": len(window.chat_log), "result": summary}
+            for window, summary in zip(windows, summaries)
+        ]
+        record["result"] = format_timeline(windows, summaries)
+        return record
+
+    record["result"] = analyzer.analyze_log(chat_log, system_prompt, mode, compress=compress, progress=progress)
+    return record
+
+
+def search_file(chat_log, query, authors=None, date_range=None):
+    """在完整的聊天记录上检索，日期范围作为检索条件（上下文仍取自原始相邻消息）"""
+    start, end = date_range or (None, None)
+    return SearchIndex.build(chat_log).search(chat_log, query, authors, start, end)
+
+
+def parse_date_range(since, until):
+    """--since / --until（YYYY-MM-DD，包含当天）转换为 [开始, 结束) 秒数，均未指定时返回 None"""
+    if not since and not until:
+        return None
+    start = day_start(date.fromisoformat(since)) if since else None
+    end = day_start(date.fromisoformat(until)) + DAY if until else None
+    return start, end
+
+
+def print_progress(snapshot):
+    """在终端同一行刷新进度"""
+    print("\r" + format_progress(snapshot).ljust(60), end="", file=sys.stderr, flush=True)
+
+
+def estimate_file(analyzer, path, mode, compress=False, query=None, authors=None, date_range=None,
+                  import_options=None):
+    """本地预估单个文件在各模型下的消耗，不发送任何请求"""
+    chat_log = load_chat_log(path, **(import_options or {}))
+    if mode == "focused":
+        hits = search_file(chat_log, query, authors, date_range)
+        tokens = sum(estimate_tokens(line) for line in analyzer.build_focused_lines(chat_log, hits.rows.tolist()))
+        lines = [f"{path}: 命中 {len(hits)} 条消息，连同上下文发送约 {tokens} tokens"]
+        for model in ESTIMATE_MODELS:
+            lines.append("  " + analyzer.describe_plan({"estimate": analyzer.estimate(tokens, "single", model)}))
+        return "\n".join(lines)
+    # 按时间窗口分析发送的内容与自动模式相同，只是按窗口拆分为多次请求
+    mode = "auto" if mode == "timeline" else mode
+    lines = [f"{path}: {len(chat_log)} 条消息，全部发送约 {estimate_log_tokens(chat_log)} tokens"]
+    measured = {}
+    for model in ESTIMATE_MODELS:
+        lines.append("  " + analyzer.describe_plan(analyzer.plan(chat_log, mode, compress, model, measured)))
+    return "\n".join(lines)
+
+
+def load_config(config_file):
+    if config_file and os.path.exists(config_file):
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批量分析聊天记录文件（CSV、JSONL，可为 gzip/bz2/zstd 压缩），结果写入 JSONL")
+    parser.add_argument("paths", nargs="+", help="聊天记录文件路径或通配符")
+    parser.add_argument("--format", choices=sorted(IMPORTERS), help="文件格式，默认按扩展名和内容识别")
+    parser.add_argument("--encoding", help="文件编码，如 gbk，默认自动识别（UTF-8、UTF-16 或 GBK）")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="结果输出文件（JSONL，追加写入）")
+    parser.add_argument("--config", default=os.path.join(BASE_DIR, "config.json"), help="配置文件路径")
+    parser.add_argument("--api-key", help="DeepSeek API Key（默认读取配置文件或 DEEPSEEK_API_KEY 环境变量）")
+    parser.add_argument("--model", help="模型名称，如 deepseek-chat 或 deepseek-reasoner")
+    parser.add_argument("--base-url", help="OpenAI 兼容接口地址，如本地模拟服务 http://127.0.0.1:8765")
+    parser.add_argument("--system-prompt", help="系统提示词")
+    parser.add_argument("--mode", choices=["auto", "single", "chunked", "stats", "timeline", "focused"],
+                        default="auto", help="分析模式，timeline 按时间窗口分别分析，focused 只分析检索到的相关消息")
+    parser.add_argument("--window", default="day", help="timeline 模式的时间窗口：day、week 或 6h、3d 等长度")
+    parser.add_argument("--query", help="focused 模式的检索主题，多个关键词用空格分隔")
+    parser.add_argument("--authors", help="focused 模式只检索这些作者的消息，逗号分隔")
+    parser.add_argument("--since", help="只分析该日期（YYYY-MM-DD）及之后的消息")
+    parser.add_argument("--until", help="只分析该日期（YYYY-MM-DD）及之前的消息")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量分析：只发送输出文件中上次结果之后新增的消息")
+    parser.add_argument("--compress", action="store_true", help="合并重复和近似重复的消息后再发送")
+    parser.add_argument("--metrics", help="结束后将性能指标写入该 JSON 文件，并写入同名 .prom 文件（Prometheus 文本格式）")
+    parser.add_argument("--profile", metavar="DIR", help="对每个文件的分析进行 CPU 与内存采样，结果写入该目录")
+    parser.add_argument("--estimate", action="store_true",
+                        help="只在本地预估各模型的 token、耗时和费用，不调用 API")
+    args = parser.parse_args(argv)
+    if args.mode == "focused" and not (args.query or "").strip():
+        parser.error("--mode focused 需要提供 --query")
+    args.authors = [name.strip() for name in args.authors.split(",") if name.strip()] if args.authors else None
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config)
+
+    api_key = args.api_key or os.environ.get("DEEPSEEK_API_KEY") or config.get("api_key")
+    if not api_key and not args.estimate:
+        print("错误: 未提供 API Key", file=sys.stderr)
+        return 2
+    model = args.model or config.get("model") or "deepseek-chat"
+    if args.base_url:
+        config["base_url"] = args.base_url
+    system_prompt = args.system_prompt or config.get("system_prompt") or None
+
+    try:
+        date_range = parse_date_range(args.since, args.until)
+    except ValueError as e:
+        print(f"错误: 日期格式应为 YYYY-MM-DD（{e}）", file=sys.stderr)
+        return 2
+
+    if args.encoding:
+        try:
+            codecs.lookup(args.encoding)
+        except LookupError:
+            print(f"错误: 未知的编码 {args.encoding}", file=sys.stderr)
+            return 2
+    import_options = {"encoding": args.encoding, "format": args.format}
+    paths = expand_paths(args.paths)
+    if not paths:
+        print("错误: 没有匹配的文件", file=sys.stderr)
+        return 2
+
+    # 仅预估时不会发出请求，API Key 可以为空
+    analyzer = create_analyzer(api_key or "unused", model, config, os.path.join(BASE_DIR, "cache"))
+    if args.estimate:
+        for path in paths:
+            print(estimate_file(analyzer, path, args.mode, args.compress, args.query, args.authors, date_range,
+                                import_options))
+        return 0
+
+    # 批量分析多个文件时，预热与首个文件的读取同时进行
+    analyzer.warm_up()
+    failures = 0
+    with open(args.output, 'a', encoding='utf-8') as out:
+        for path in paths:
+            started = time.monotonic()
+            # 仅在终端中显示实时进度，输出重定向到文件时不刷屏
+            progress = ProgressTracker(print_progress if sys.stderr.isatty() else None, interval=0.5)
+            try:
+                with maybe_profile(args.profile, os.path.splitext(os.path.basename(path))[0]), \
+                        METRICS.timer("stage_seconds", stage="analysis"):
+                    record = analyze_file(analyzer, path, system_prompt, args.mode, args.incremental, args.output,
+                                          args.compress, progress, args.window, date_range, args.query, args.authors,
+                                          import_options)
+            except Exception as e:
+                failures += 1
+                record = {"file": path, "error": str(e), "error_type": type(e).__name__}
+            if progress.callback:
+                print("\r".ljust(61), end="\r", file=sys.stderr)
+
+            telemetry = progress.snapshot()
+            record.update({
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "model": model,
+                "mode": args.mode,
+                "seconds": round(time.monotonic() - started, 3),
+                "input_tokens": telemetry["input_tokens"],
+                "cached_tokens": telemetry["cached_tokens"],
+                "output_tokens": telemetry["output_tokens"]
+            })
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            print(f"{path}: {'失败' if 'error' in record else '完成'} ({record['seconds']}s)", file=sys.stderr)
+
+    pool = analyzer.pool_stats()
+    print(f"连接池: {pool['requests']} 次请求，新建 {pool['opened']} 个连接，复用 {pool['reused']} 次", file=sys.stderr)
+    if args.metrics:
+        METRICS.export(args.metrics)
+        print(format_summary(METRICS.snapshot()), file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""端到端基准测试：CSV 导入、手动输入解析、提示词构建、分析往返和历史记录读写
+
+分析请求发送到本地模拟服务（mock_server.py），无需 API Key。每种规模在单独的进程中运行，
+峰值内存（RSS）互不影响。
+
+用法示例：
+    python benchmark.py --sizes 1k,10k,100k
+    python benchmark.py --sizes 1m,10m --latency 0.05 --json bench.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chat_import import ChatTextParser, iter_csv_chunks
+from chat_log import ChatLog
+from chunking import split_chat_lines
+from deepseek_analyzer import DeepseekAnalyzer
+from generate_sample_data import GeneratorOptions, write_chat_csv
+from history_store import HistoryStore
+from mock_server import start_mock_server
+
+DEFAULT_SIZES = "1k,10k,100k,1m"
+
+
+def parse_size(text):
+    """解析 1000、10k、1m 形式的规模"""
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def percentile(values, q):
+    """线性插值的百分位数，values 为空时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），无法获取时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / 1048576, 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return round(peak / (1048576 if sys.platform == "darwin" else 1024), 1)
+
+
+def latency_summary(latencies):
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None
+    }
+
+
+def bench_import(path, count):
+    started = time.perf_counter()
+    chat_log = ChatLog()
+    for chunk, _, _ in iter_csv_chunks(path):
+        chat_log.extend(chunk)
+    seconds = time.perf_counter() - started
+    return chat_log, {
+        "seconds": round(seconds, 3),
+        "messages_per_second": round(count / seconds) if seconds else None,
+        "mb_per_second": round(os.path.getsize(path) / 1048576 / seconds, 1) if seconds else None
+    }
+
+
+def bench_manual_parse(chat_log):
+    """将聊天记录还原为粘贴的文本，测量 ChatTextParser 的解析速度"""
+    text = "\n".join(chat_log.iter_lines())
+    parser = ChatTextParser()
+    started = time.perf_counter()
+    parsed = sum(len(chunk) for chunk, _, _ in parser.iter_chunks(text))
+    seconds = time.perf_counter() - started
+    return {
+        "seconds": round(seconds, 3),
+        "lines_per_second": round(parsed / seconds) if seconds else None,
+        "mchars_per_second": round(len(text) / 1e6 / seconds, 1) if seconds else None,
+        "messages": parsed,
+        "unparsed": parser.unparsed
+    }
+
+
+def bench_prompt(chat_log):
+    started = time.perf_counter()
+    lines = DeepseekAnalyzer.build_lines(chat_log)
+    chunks = split_chat_lines(lines, DeepseekAnalyzer.CHUNK_TOKEN_BUDGET)
+    seconds = time.perf_counter() - started
+    return {
+        "seconds": round(seconds, 3),
+        "lines_per_second": round(len(lines) / seconds) if seconds else None,
+        "chunks": len(chunks)
+    }
+
+
+def bench_roundtrip(chat_log, base_url, concurrency):
+    """通过模拟服务完成一次完整分析（自动选择单次或分块），统计每个请求的耗时"""
+    analyzer = DeepseekAnalyzer("benchmark", max_concurrency=concurrency, base_url=base_url)
+    latencies = []
+    request = analyzer._request
+
+    def timed_request(func, can_retry=None):
+        started = time.perf_counter()
+        try:
+            return request(func, can_retry)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    analyzer._request = timed_request
+    started = time.perf_counter()
+    analyzer.analyze_log(chat_log)
+    seconds = time.perf_counter() - started
+    result = {"seconds": round(seconds, 3), "messages_per_second": round(len(chat_log) / seconds) if seconds else None}
+    result.update(latency_summary(latencies))
+    result["pool"] = analyzer.pool_stats()
+    return result
+
+
+def bench_history(directory, records):
+    """追加写入（每次同步到磁盘）并随机读取 records 条历史记录"""
+    store = HistoryStore(os.path.join(directory, "history.jsonl"))
+    result_text = "分析结果" * 500
+    append_times = []
+    for i in range(records):
+        started = time.perf_counter()
+        store.append({"id": i, "timestamp": "", "type": "analysis", "source": f"file{i % 10}", "result": result_text})
+        append_times.append(time.perf_counter() - started)
+    store.close()
+
+    # 重新打开以包含加载索引的耗时，并清空正文缓存
+    started = time.perf_counter()
+    store = HistoryStore(os.path.join(directory, "history.jsonl"))
+    open_seconds = time.perf_counter() - started
+    rng = random.Random(0)
+    get_times = []
+    for _ in range(records):
+        position = rng.randrange(len(store))
+        started = time.perf_counter()
+        store.get(position)
+        get_times.append(time.perf_counter() - started)
+    store.close()
+
+    return {
+        "records": records,
+        "open_ms": round(open_seconds * 1000, 2),
+        "append_p50_ms": round(percentile(append_times, 50) * 1000, 3),
+        "append_p99_ms": round(percentile(append_times, 99) * 1000, 3),
+        "get_p50_ms": round(percentile(get_times, 50) * 1000, 3),
+        "get_p99_ms": round(percentile(get_times, 99) * 1000, 3)
+    }
+
+
+def run_size(size, base_url, options):
+    """在当前进程中运行一种规模的全部基准测试"""
+    directory = tempfile.mkdtemp(prefix="chat_bench_")
+    try:
+        path = os.path.join(directory, "chat.csv")
+        started = time.perf_counter()
+        # 固定起始时间，相同种子生成相同的数据
+        write_chat_csv(path, GeneratorOptions(size, authors=20, days=365, start=1700000000, seed=options["seed"]))
+        result = {"size": size, "generate_seconds": round(time.perf_counter() - started, 3)}
+
+        chat_log, result["import"] = bench_import(path, size)
+        result["manual_parse"] = bench_manual_parse(chat_log)
+        result["prompt"] = bench_prompt(chat_log)
+        if size <= options["max_roundtrip"]:
+            result["roundtrip"] = bench_roundtrip(chat_log, base_url, options["concurrency"])
+        result["history"] = bench_history(directory, options["history_records"])
+        result["peak_rss_mb"] = peak_rss_mb()
+        return result
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def format_report(results):
+    lines = []
+    for result in results:
+        lines.append(f"== {result['size']} 条消息（峰值内存 {result['peak_rss_mb']} MB）")
+        imported = result["import"]
+        lines.append(f"  导入:     {imported['seconds']}s，{imported['messages_per_second']} 条/秒，"
+                     f"{imported['mb_per_second']} MB/秒")
+        parsed = result["manual_parse"]
+        lines.append(f"  解析输入: {parsed['seconds']}s，{parsed['lines_per_second']} 条/秒，"
+                     f"{parsed['mchars_per_second']} 百万字符/秒，无法解析 {parsed['unparsed']} 行")
+        prompt = result["prompt"]
+        lines.append(f"  构建提示: {prompt['seconds']}s，{prompt['lines_per_second']} 行/秒，{prompt['chunks']} 块")
+        if "roundtrip" in result:
+            trip = result["roundtrip"]
+            lines.append(f"  分析往返: {trip['seconds']}s，{trip['requests']} 次请求，"
+                         f"p50 {trip['p50_ms']}ms，p99 {trip['p99_ms']}ms，"
+                         f"新建连接 {trip['pool']['opened']} 个，复用 {trip['pool']['reused']} 次")
+        history = result["history"]
+        lines.append(f"  历史记录: 打开 {history['open_ms']}ms，追加 p50 {history['append_p50_ms']}ms / "
+                     f"p99 {history['append_p99_ms']}ms，读取 p50 {history['get_p50_ms']}ms / "
+                     f"p99 {history['get_p99_ms']}ms")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="端到端基准测试（使用本地模拟服务，无需 API Key）")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="消息条数，逗号分隔，支持 k/m 后缀，如 1k,10k,10m")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟服务的首字延迟（秒）")
+    parser.add_argument("--output-tokens", type=int, default=200, help="模拟服务每次回复的输出 token 数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务随机返回错误的比例")
+    parser.add_argument("--concurrency", type=int, default=4, help="分析请求的并发数")
+    parser.add_argument("--max-roundtrip", type=parse_size, default=parse_size("10m"),
+                        help="超过该规模时跳过分析往返测试")
+    parser.add_argument("--history-records", type=int, default=200, help="历史记录测试的记录数")
+    parser.add_argument("--seed", type=int, default=0, help="合成数据的随机种子")
+    parser.add_argument("--json", help="将结果以 JSON 写入该文件")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [parse_size(size) for size in args.sizes.split(",") if size.strip()]
+    options = {
+        "seed": args.seed,
+        "concurrency": args.concurrency,
+        "max_roundtrip": args.max_roundtrip,
+        "history_records": args.history_records
+    }
+
+    server = start_mock_server(latency=args.latency, output_tokens=args.output_tokens, error_rate=args.error_rate,
+                               seed=args.seed)
+    results = []
+    try:
+        for size in sizes:
+            # 每种规模使用新进程，峰值内存只反映该规模
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(run_size, size, server.url, options).result()
+            results.append(result)
+            print(format_report([result]), flush=True)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    summary = {"results": results, "server": server.stats.snapshot()}
+    print(f"模拟服务共处理 {summary['server']['requests']} 次请求，其中 {summary['server']['errors']} 次注入错误")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
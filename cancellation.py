@@ -0,0 +1,80 @@
+"""取消进行中的任务：CancelToken 在任务线程及其派生的请求线程中生效，取消时中断进行中的 HTTP 请求
+
+任务线程通过 with token.activate(): 将令牌设为当前上下文的取消令牌，RequestDispatcher 派生的
+并发请求线程会复制该上下文。http_pool 的传输层在令牌上登记中断请求的回调，cancel() 时关闭
+请求所用连接的套接字，等待响应的请求立即返回连接错误；resilience.call_with_retry 发现令牌
+已取消后抛出 CancelledError，不再重试。
+"""
+
+import contextvars
+import socket
+import threading
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("cancel_token", default=None)
+
+
+def current_token():
+    """当前上下文的取消令牌，不在任何任务中时为 None"""
+    return _current.get()
+
+
+class CancelToken:
+    """一个任务的取消状态；register 的回调在取消时调用，用于中断进行中的请求"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        """标记为已取消并调用登记的全部回调，可重复调用"""
+        with self.lock:
+            self.event.set()
+            callbacks = list(self.callbacks)
+            self.callbacks.clear()
+        for callback in callbacks:
+            callback()
+
+    def wait(self, seconds):
+        """等待 seconds 秒，期间被取消时提前返回；返回是否已取消"""
+        return self.event.wait(seconds)
+
+    def register(self, callback):
+        """登记取消时调用的回调，已取消时立即调用"""
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.add(callback)
+                return
+        callback()
+
+    def unregister(self, callback):
+        """请求结束后取消登记，如连接归还连接池后可能被其他任务使用"""
+        with self.lock:
+            self.callbacks.discard(callback)
+
+    @contextmanager
+    def activate(self):
+        """在 with 代码块内将本令牌设为当前上下文的取消令牌"""
+        reset = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(reset)
+
+
+def abort_stream(stream):
+    """中断 httpcore 的网络连接：shutdown 能唤醒其他线程中阻塞的读取，close 则不能"""
+    sock = stream.get_extra_info("socket")
+    if sock is None:
+        stream.close()
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        # 连接已经关闭
+        pass
@@ -1,91 +1,282 @@
 import sys
 import os
-import pandas as pd
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                             QLabel, QLineEdit, QPushButton, QTextEdit, QFileDialog, 
                             QComboBox, QTabWidget, QProgressBar, QMessageBox, QGroupBox,
-                            QListWidget, QListWidgetItem)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QFont, QIcon, QDesktopServices
+                            QListView, QCheckBox, QSpinBox, QDateEdit, QSplitter)
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, QDate
+from PyQt5.QtGui import QFont, QIcon, QDesktopServices, QTextCursor
 from PyQt5.QtCore import QUrl
 import csv
-from openai import OpenAI
 import json
 import time
+from contextlib import nullcontext
+from deepseek_analyzer import FeedbackSession, create_analyzer
+from http_pool import close_shared_clients
+from metrics import METRICS, maybe_profile, format_summary
+from resilience import AnalysisError, CancelledError
+from history_store import HistoryStore
+from chat_import import ChatTextParser, iter_chat_chunks
+from chat_log import ChatLog
+from incremental import make_watermark, resume_position, latest_analysis
+from token_estimate import estimate_tokens, estimate_log_tokens
+from progress import ProgressTracker, STAGE_IMPORT, format_progress
+from list_models import HistoryListModel, ChatLogModel, TimelineModel, JobListModel
+from timeline import TimeIndex, DAY, day_start, format_timeline
+from search_index import SearchIndex
+from job_queue import (JobQueue, Job, PRIORITY_NAMES, PRIORITY_NORMAL, QUEUED, DONE, FAILED,
+                       CANCELLED, DEFAULT_MAX_RUNNING)
 
-class DeepseekAnalyzer:
-    def __init__(self, api_key, model="deepseek-chat"):
-        self.api_key = api_key
-        self.model = model
-        self.client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
+class StreamingWorker(QThread):
+    """支持流式输出的工作线程基类：增量文本先在线程内缓冲，按固定间隔批量发出；
+    进度快照（见 progress.ProgressTracker）同样节流后通过 progress 信号发出。
+    设置 token（cancellation.CancelToken）后可被取消，取消时发出 cancelled
+    """
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    progress = pyqtSignal(object)
+    partial = pyqtSignal(str)
+    notice = pyqtSignal(str)
     
-    def set_model(self, model):
-        self.model = model
+    # 增量文本的最短发送间隔（秒），避免大量信号挤占界面事件循环
+    PARTIAL_INTERVAL = 0.05
+    # 进度快照的最短发送间隔（秒）
+    PROGRESS_INTERVAL = 0.1
+    # 整个运行的耗时记录为 stage_seconds{stage=METRIC_STAGE}
+    METRIC_STAGE = "analysis"
     
-    def analyze_chat(self, chat_data, system_prompt=None):
-        if not system_prompt:
-            system_prompt = "你是一个专业的聊天记录分析助手。请分析以下聊天记录，提取关键信息，并生成简洁的摘要。"
-        
+    def __init__(self, stream=False):
+        super().__init__()
+        self.stream = stream
+        self.partial_buffer = []
+        self.last_partial_time = 0.0
+        self.tracker = ProgressTracker(self.progress.emit, self.PROGRESS_INTERVAL)
+        # 设置后对本次运行进行 CPU 和内存采样，结果写入该目录
+        self.profile_dir = None
+        # 所属任务的取消令牌，取消时中断进行中的请求
+        self.token = None
+    
+    def on_delta(self, text):
+        self.partial_buffer.append(text)
+        now = time.monotonic()
+        if now - self.last_partial_time >= self.PARTIAL_INTERVAL:
+            self.flush_partial()
+            self.last_partial_time = now
+    
+    def flush_partial(self):
+        if self.partial_buffer:
+            self.partial.emit("".join(self.partial_buffer))
+            self.partial_buffer = []
+    
+    def delta_callback(self):
+        return self.on_delta if self.stream else None
+    
+    def run(self):
+        """调用子类的 execute()，成功时发出 finished，失败时发出 failed，被取消时发出 cancelled（均不产生结果）"""
         try:
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"请分析以下聊天记录并提取关键信息：\n\n{chat_data}"}
-            ]
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                stream=False
-            )
-            
-            return response.choices[0].message.content
+            with self.token.activate() if self.token else nullcontext(), \
+                    maybe_profile(self.profile_dir, self.METRIC_STAGE), \
+                    METRICS.timer("stage_seconds", stage=self.METRIC_STAGE):
+                result = self.execute()
+        except CancelledError:
+            self.flush_partial()
+            self.cancelled.emit()
+            return
+        except AnalysisError as e:
+            self.flush_partial()
+            self.failed.emit(str(e))
+            return
         except Exception as e:
-            return f"分析失败: {str(e)}"
+            self.flush_partial()
+            self.failed.emit(f"{type(e).__name__}: {e}")
+            return
+        self.flush_partial()
+        self.tracker.finish()
+        self.finished.emit(result)
+
+class AnalysisWorker(StreamingWorker):
+    def __init__(self, analyzer, chat_log, system_prompt=None, mode="auto", stream=False, previous_summary=None, compress=False):
+        super().__init__(stream)
+        self.analyzer = analyzer
+        self.chat_log = chat_log
+        self.system_prompt = system_prompt
+        self.mode = mode
+        self.previous_summary = previous_summary
+        self.compress = compress
+        # 记录最终请求，之后的反馈改进以它为固定前缀
+        self.session = FeedbackSession()
+    
+    def execute(self):
+        # 在工作线程中构建提示词，避免大型聊天记录阻塞界面
+        if self.previous_summary is not None:
+            chat_lines = self.analyzer.build_lines(self.chat_log, self.compress)
+            return self.analyzer.analyze_incremental(self.previous_summary, chat_lines, self.system_prompt,
+                                                     self.delta_callback(), self.tracker, self.session)
+        return self.analyzer.analyze_log(self.chat_log, self.system_prompt, self.mode, self.delta_callback(),
+                                         self.compress, self.on_plan, self.tracker, self.session)
+
+    def on_plan(self, plan):
+        self.notice.emit(self.analyzer.describe_plan(plan))
+
+class AnalysisImproveWorker(StreamingWorker):
+    METRIC_STAGE = "improve"
+    
+    def __init__(self, analyzer, original_analysis, feedback, stream=False, session=None):
+        super().__init__(stream)
+        self.analyzer = analyzer
+        self.original_analysis = original_analysis
+        self.feedback = feedback
+        self.session = session
+    
+    def execute(self):
+        return self.analyzer.improve_analysis(self.original_analysis, self.feedback, self.delta_callback(),
+                                              self.tracker, self.session)
+
+class TimelineWorker(StreamingWorker):
+    """按时间窗口划分聊天记录并并发分析，每完成一个窗口发出 window_done"""
+    METRIC_STAGE = "timeline"
+    windows_ready = pyqtSignal(object)
+    window_done = pyqtSignal(int, str)
+    
+    def __init__(self, analyzer, chat_log, window, system_prompt=None, compress=False):
+        super().__init__(False)
+        self.analyzer = analyzer
+        self.chat_log = chat_log
+        self.window = window
+        self.system_prompt = system_prompt
+        self.compress = compress
+        # 时间线结果由多次请求拼接而成，改进时不使用反馈会话
+        self.session = None
+    
+    def execute(self):
+        windows = TimeIndex(self.chat_log).windows(self.window)
+        if not windows:
+            raise AnalysisError("聊天记录中没有可解析的时间，无法按时间窗口划分")
+        self.windows_ready.emit(windows)
+        results = self.analyzer.analyze_windows(windows, self.system_prompt, self.compress, self.window_done.emit,
+                                                self.tracker)
+        return format_timeline(windows, results)
+
+class FocusedAnalysisWorker(StreamingWorker):
+    """聚焦分析：只发送检索命中的消息及其上下文"""
+    METRIC_STAGE = "focused"
+    
+    def __init__(self, analyzer, chat_log, query, rows, system_prompt=None, stream=False):
+        super().__init__(stream)
+        self.analyzer = analyzer
+        self.chat_log = chat_log
+        self.query = query
+        self.rows = rows
+        self.system_prompt = system_prompt
+        self.session = FeedbackSession()
+    
+    def execute(self):
+        return self.analyzer.analyze_focused(self.chat_log, self.query, self.rows, self.system_prompt,
+                                             self.delta_callback(), self.tracker, self.session)
+
+class CsvImportWorker(QThread):
+    """后台分块导入聊天记录文件（CSV、JSONL 及其压缩文件，见 chat_import），按已读取字节数报告进度，支持取消
+
+    导入的同时在工作线程中为已读取的分块建立检索索引，结束（含取消）时通过 index_ready 发出。
+    """
+    chunk_loaded = pyqtSignal(object)
+    index_ready = pyqtSignal(object)
+    progress = pyqtSignal(object)
+    finished = pyqtSignal(bool)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, file_path, chunk_size=10000):
+        super().__init__()
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.cancelled = False
+        self.search_index = SearchIndex()
+    
+    def cancel(self):
+        self.cancelled = True
     
-    def improve_analysis(self, original_analysis, feedback):
+    def run(self):
+        tracker = ProgressTracker(self.progress.emit, StreamingWorker.PROGRESS_INTERVAL)
         try:
-            messages = [
-                {"role": "system", "content": "你是一个专业的聊天记录分析助手。请根据用户的反馈改进你的分析。"},
-                {"role": "user", "content": f"原始分析：\n\n{original_analysis}\n\n用户反馈：\n\n{feedback}\n\n请根据反馈改进分析结果。"}
-            ]
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                stream=False
-            )
-            
-            return response.choices[0].message.content
+            tracker.set_stage(STAGE_IMPORT, os.path.getsize(self.file_path))
+            last_read = 0
+            with METRICS.timer("stage_seconds", stage="import"):
+                for chunk, bytes_read, total_bytes in iter_chat_chunks(self.file_path, self.chunk_size):
+                    if self.cancelled:
+                        break
+                    if chunk:
+                        self.search_index.add(chunk)
+                        self.chunk_loaded.emit(chunk)
+                    tracker.advance(bytes_read - last_read, nbytes=bytes_read - last_read)
+                    last_read = bytes_read
         except Exception as e:
-            return f"改进分析失败: {str(e)}"
+            self.failed.emit(str(e))
+            return
+        if not self.cancelled:
+            tracker.finish()
+        self.index_ready.emit(self.search_index)
+        self.finished.emit(not self.cancelled)
 
-class AnalysisWorker(QThread):
-    finished = pyqtSignal(str)
-    progress = pyqtSignal(int)
+class ManualParseWorker(QThread):
+    """后台解析粘贴的聊天记录文本（见 ChatTextParser），解析结果分块发出，结束时报告无法解析的行数"""
+    chunk_loaded = pyqtSignal(object)
+    progress = pyqtSignal(object)
+    finished = pyqtSignal(int)
+    failed = pyqtSignal(str)
     
-    def __init__(self, analyzer, chat_data, system_prompt=None):
+    def __init__(self, text):
         super().__init__()
-        self.analyzer = analyzer
-        self.chat_data = chat_data
-        self.system_prompt = system_prompt
+        self.text = text
+        self.cancelled = False
+    
+    def cancel(self):
+        self.cancelled = True
     
     def run(self):
-        result = self.analyzer.analyze_chat(self.chat_data, self.system_prompt)
-        self.finished.emit(result)
+        tracker = ProgressTracker(self.progress.emit, StreamingWorker.PROGRESS_INTERVAL)
+        parser = ChatTextParser()
+        try:
+            tracker.set_stage(STAGE_IMPORT, len(self.text))
+            parsed = 0
+            with METRICS.timer("stage_seconds", stage="manual_parse"):
+                for chunk, position, _ in parser.iter_chunks(self.text):
+                    if self.cancelled:
+                        return
+                    if chunk:
+                        self.chunk_loaded.emit(chunk)
+                    tracker.advance(position - parsed)
+                    parsed = position
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        tracker.finish()
+        self.finished.emit(parser.unparsed)
 
-class AnalysisImproveWorker(QThread):
+class EstimateWorker(QThread):
+    """后台进行请求前预估：超出预算时的压缩和统计摘要需处理全部聊天记录，不阻塞界面"""
     finished = pyqtSignal(str)
-    progress = pyqtSignal(int)
+    failed = pyqtSignal(str)
     
-    def __init__(self, analyzer, original_analysis, feedback):
+    def __init__(self, analyzer, chat_log, mode, compress):
         super().__init__()
         self.analyzer = analyzer
-        self.original_analysis = original_analysis
-        self.feedback = feedback
+        self.chat_log = chat_log
+        self.mode = mode
+        self.compress = compress
     
     def run(self):
-        result = self.analyzer.improve_analysis(self.original_analysis, self.feedback)
-        self.finished.emit(result)
+        try:
+            # 两种模型共用与模型无关的计算结果
+            measured = {}
+            lines = [f"共 {len(self.chat_log)} 条消息，全部发送约 {estimate_log_tokens(self.chat_log)} tokens"]
+            for model in ("deepseek-chat", "deepseek-reasoner"):
+                plan = self.analyzer.plan(self.chat_log, self.mode, self.compress, model, measured)
+                lines.append(self.analyzer.describe_plan(plan))
+        except Exception as e:
+            self.failed.emit(f"{type(e).__name__}: {e}")
+            return
+        self.finished.emit("\n".join(lines))
 
 class ChatAnalyzerApp(QMainWindow):
     def __init__(self):
@@ -93,11 +284,34 @@ class ChatAnalyzerApp(QMainWindow):
         self.setWindowTitle("聊天记录分析工具")
         self.setGeometry(100, 100, 1200, 800)
         self.analyzer = None
-        self.chat_data = []
+        self.chat_data = ChatLog()
+        self.chat_source = ""
         self.analysis_result = ""
+        # analysis_result 所属的反馈会话，改进时以首次分析的请求为固定前缀
+        self.feedback_session = None
         self.config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
-        self.results_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json")
-        self.analysis_history = []
+        self.results_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+        self.legacy_results_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json")
+        self.cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+        # 性能指标在每次运行后导出到此文件（JSON）及同名 .prom 文件（Prometheus 文本格式），可在配置文件中修改
+        self.metrics_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics.json")
+        self.profile_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+        self.history = HistoryStore(self.results_file)
+        self.import_worker = None
+        self.parse_worker = None
+        self.estimate_worker = None
+        # 聊天记录的时间索引，按日期范围分析时使用，聊天记录变化后重新建立
+        self.time_index = None
+        # 聊天记录的检索索引，导入时在后台建立，手动输入等情况在首次检索时建立
+        self.search_index = None
+        # 最近一次检索命中的行号，用于在预览中定位
+        self.search_rows = []
+        # 分析和改进任务的队列：按优先级排队，同时运行的任务数可在任务标签页调整
+        self.jobs = JobQueue(self.start_job, DEFAULT_MAX_RUNNING, self.job_changed, self.job_cancelled)
+        # 结果面板正在显示其流式输出的任务、进度条跟随的任务、时间线标签页对应的任务
+        self.display_job = None
+        self.progress_job = None
+        self.timeline_job = None
         
         self.init_ui()
         self.load_config()
@@ -114,10 +328,14 @@ class ChatAnalyzerApp(QMainWindow):
         settings_tab = self.create_settings_tab()
         analysis_tab = self.create_analysis_tab()
         results_tab = self.create_results_tab()
+        timeline_tab = self.create_timeline_tab()
+        jobs_tab = self.create_jobs_tab()
         
         self.tabs.addTab(settings_tab, "设置")
         self.tabs.addTab(analysis_tab, "分析")
         self.tabs.addTab(results_tab, "结果")
+        self.tabs.addTab(timeline_tab, "时间线")
+        self.tabs.addTab(jobs_tab, "任务")
         
         # 添加Deepseek友情链接
         link_layout = QHBoxLayout()
@@ -181,8 +399,23 @@ class ChatAnalyzerApp(QMainWindow):
         prompt_layout.addWidget(self.system_prompt)
         prompt_group.setLayout(prompt_layout)
         
+        # 性能指标与采样
+        perf_group = QGroupBox("性能")
+        perf_layout = QHBoxLayout()
+        
+        self.profile_checkbox = QCheckBox("分析时记录 CPU 与内存采样（cProfile / tracemalloc）")
+        self.profile_checkbox.setToolTip("每次分析的采样结果写入 profiles 目录，采样会使分析变慢")
+        metrics_btn = QPushButton("导出性能指标")
+        metrics_btn.clicked.connect(self.show_metrics)
+        
+        perf_layout.addWidget(self.profile_checkbox)
+        perf_layout.addStretch()
+        perf_layout.addWidget(metrics_btn)
+        perf_group.setLayout(perf_layout)
+        
         layout.addWidget(api_group)
         layout.addWidget(prompt_group)
+        layout.addWidget(perf_group)
         layout.addStretch()
         
         tab.setLayout(layout)
@@ -196,12 +429,21 @@ class ChatAnalyzerApp(QMainWindow):
         import_group = QGroupBox("导入聊天记录")
         import_layout = QVBoxLayout()
         
-        import_btn = QPushButton("导入CSV文件")
-        import_btn.clicked.connect(self.import_csv)
+        import_btn_layout = QHBoxLayout()
+        
+        self.import_btn = QPushButton("导入聊天记录文件")
+        self.import_btn.clicked.connect(self.import_csv)
+        
+        self.cancel_import_btn = QPushButton("取消导入")
+        self.cancel_import_btn.clicked.connect(self.cancel_import)
+        self.cancel_import_btn.setEnabled(False)
+        
+        import_btn_layout.addWidget(self.import_btn)
+        import_btn_layout.addWidget(self.cancel_import_btn)
         
         self.file_label = QLabel("未选择文件")
         
-        import_layout.addWidget(import_btn)
+        import_layout.addLayout(import_btn_layout)
         import_layout.addWidget(self.file_label)
         import_group.setLayout(import_layout)
         
@@ -209,25 +451,30 @@ class ChatAnalyzerApp(QMainWindow):
         manual_group = QGroupBox("手动输入聊天记录")
         manual_layout = QVBoxLayout()
         
-        format_label = QLabel("请按照以下格式输入聊天记录：\n[时间] 作者: 消息\n例如：[2023-01-01 12:00:00] 张三: 你好！")
+        format_label = QLabel("请按照以下格式输入聊天记录（冒号可为全角，消息可跨多行）：\n[时间] 作者: 消息\n例如：[2023-01-01 12:00:00] 张三: 你好！")
         
         self.manual_input = QTextEdit()
         self.manual_input.setPlaceholderText("在此输入聊天记录...")
         
-        parse_btn = QPushButton("解析输入内容")
-        parse_btn.clicked.connect(self.parse_manual_input)
+        self.parse_btn = QPushButton("解析输入内容")
+        self.parse_btn.clicked.connect(self.parse_manual_input)
         
         manual_layout.addWidget(format_label)
         manual_layout.addWidget(self.manual_input)
-        manual_layout.addWidget(parse_btn)
+        manual_layout.addWidget(self.parse_btn)
         manual_group.setLayout(manual_layout)
         
         # 聊天记录预览
         preview_group = QGroupBox("聊天记录预览")
         preview_layout = QVBoxLayout()
         
-        self.chat_preview = QTextEdit()
-        self.chat_preview.setReadOnly(True)
+        # 按需绘制可见行，导入数百万条记录后仍可流畅滚动浏览全部内容
+        self.preview_model = ChatLogModel(self.chat_data, self)
+        self.chat_preview = QListView()
+        self.chat_preview.setModel(self.preview_model)
+        self.chat_preview.setUniformItemSizes(True)
+        self.chat_preview.setLayoutMode(QListView.Batched)
+        self.chat_preview.setBatchSize(200)
         
         preview_layout.addWidget(self.chat_preview)
         preview_group.setLayout(preview_layout)
@@ -239,17 +486,116 @@ class ChatAnalyzerApp(QMainWindow):
         self.analyze_btn.clicked.connect(self.start_analysis)
         self.analyze_btn.setEnabled(False)
         
+        self.mode_selector = QComboBox()
+        self.mode_selector.addItem("自动", "auto")
+        self.mode_selector.addItem("单次分析", "single")
+        self.mode_selector.addItem("分块分析", "chunked")
+        self.mode_selector.addItem("增量分析", "incremental")
+        self.mode_selector.addItem("统计摘要+抽样", "stats")
+        self.mode_selector.addItem("按时间窗口", "timeline")
+        self.mode_selector.addItem("聚焦分析", "focused")
+        
         self.progress_bar = QProgressBar()
         self.progress_bar.setRange(0, 100)
         self.progress_bar.setValue(0)
-        
+        self.progress_label = QLabel()
+        
+        self.stream_checkbox = QCheckBox("流式输出")
+        self.stream_checkbox.setChecked(True)
+        
+        self.compress_checkbox = QCheckBox("压缩重复消息")
+        self.compress_checkbox.setToolTip("将重复和近似重复的消息合并为带次数、作者和时间范围的条目，减少发送的 token")
+        
+        control_layout.addWidget(QLabel("分析模式:"))
+        control_layout.addWidget(self.mode_selector)
+        control_layout.addWidget(self.stream_checkbox)
+        control_layout.addWidget(self.compress_checkbox)
+        self.estimate_btn = QPushButton("预估消耗")
+        self.estimate_btn.clicked.connect(self.show_estimate)
+        
+        # 新提交的分析和改进任务的优先级
+        self.priority_selector = QComboBox()
+        for priority, name in PRIORITY_NAMES.items():
+            self.priority_selector.addItem(name, priority)
+        self.priority_selector.setCurrentIndex(self.priority_selector.findData(PRIORITY_NORMAL))
+        
+        control_layout.addWidget(self.estimate_btn)
+        control_layout.addWidget(QLabel("优先级:"))
+        control_layout.addWidget(self.priority_selector)
         control_layout.addWidget(self.analyze_btn)
         control_layout.addWidget(self.progress_bar)
+        control_layout.addWidget(self.progress_label)
+        
+        # 时间窗口与日期范围
+        time_layout = QHBoxLayout()
+        
+        self.window_selector = QComboBox()
+        self.window_selector.addItem("按天", "day")
+        self.window_selector.addItem("按周", "week")
+        self.window_selector.addItem("自定义", "custom")
+        self.window_hours = QSpinBox()
+        self.window_hours.setRange(1, 24 * 90)
+        self.window_hours.setValue(6)
+        self.window_hours.setSuffix(" 小时")
+        self.window_hours.setEnabled(False)
+        self.window_selector.currentIndexChanged.connect(
+            lambda: self.window_hours.setEnabled(self.window_selector.currentData() == "custom"))
+        
+        self.range_checkbox = QCheckBox("仅分析日期范围")
+        self.range_checkbox.setToolTip("只分析所选日期范围内的消息，适用于除增量分析外的所有模式")
+        self.start_date = QDateEdit()
+        self.end_date = QDateEdit()
+        for date_edit in (self.start_date, self.end_date):
+            date_edit.setCalendarPopup(True)
+            date_edit.setDisplayFormat("yyyy-MM-dd")
+            date_edit.setDate(QDate.currentDate())
+        
+        time_layout.addWidget(QLabel("时间窗口:"))
+        time_layout.addWidget(self.window_selector)
+        time_layout.addWidget(self.window_hours)
+        time_layout.addWidget(self.range_checkbox)
+        time_layout.addWidget(self.start_date)
+        time_layout.addWidget(QLabel("至"))
+        time_layout.addWidget(self.end_date)
+        time_layout.addStretch()
+        
+        # 检索：按主题查找相关消息，聚焦分析只发送命中的消息及其上下文
+        search_group = QGroupBox("检索")
+        search_layout = QVBoxLayout()
+        search_bar = QHBoxLayout()
+        
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("检索主题，多个关键词用空格分隔")
+        self.search_input.returnPressed.connect(self.run_search)
+        self.search_authors = QLineEdit()
+        self.search_authors.setPlaceholderText("作者（可选，逗号分隔）")
+        search_btn = QPushButton("搜索")
+        search_btn.clicked.connect(self.run_search)
+        self.search_label = QLabel()
+        
+        search_bar.addWidget(self.search_input, 3)
+        search_bar.addWidget(self.search_authors, 1)
+        search_bar.addWidget(search_btn)
+        search_bar.addWidget(self.search_label)
+        
+        # 命中的消息，双击在预览中定位到该消息
+        self.search_model = ChatLogModel(ChatLog(), self)
+        self.search_results = QListView()
+        self.search_results.setModel(self.search_model)
+        self.search_results.setUniformItemSizes(True)
+        self.search_results.setMaximumHeight(150)
+        self.search_results.doubleClicked.connect(self.locate_search_hit)
+        
+        search_layout.addLayout(search_bar)
+        search_layout.addWidget(self.search_results)
+        search_group.setLayout(search_layout)
         
         layout.addWidget(import_group)
         layout.addWidget(manual_group)
         layout.addWidget(preview_group)
+        layout.addWidget(search_group)
         layout.addLayout(control_layout)
+        layout.addLayout(time_layout)
         
         tab.setLayout(layout)
         return tab
@@ -262,8 +608,11 @@ class ChatAnalyzerApp(QMainWindow):
         history_group = QGroupBox("历史分析记录")
         history_layout = QVBoxLayout()
         
-        self.history_list = QListWidget()
-        self.history_list.itemClicked.connect(self.show_history_item)
+        self.history_model = HistoryListModel(self.history, self)
+        self.history_list = QListView()
+        self.history_list.setModel(self.history_model)
+        self.history_list.setUniformItemSizes(True)
+        self.history_list.clicked.connect(self.show_history_item)
         
         history_layout.addWidget(self.history_list)
         history_group.setLayout(history_layout)
@@ -305,88 +654,109 @@ class ChatAnalyzerApp(QMainWindow):
         tab.setLayout(layout)
         return tab
 
-    def show_history_item(self, item):
-        index = self.history_list.row(item)
-        history_item = self.analysis_history[index]
-        self.results_text.setText(history_item["result"])
-        self.feedback_text.clear()
-
-    def update_history_list(self):
-        self.history_list.clear()
-        for item in self.analysis_history:
-            timestamp = item["timestamp"]
-            type_text = "分析" if item["type"] == "analysis" else "改进"
-            list_item = QListWidgetItem(f"{timestamp} - {type_text}结果")
-            self.history_list.addItem(list_item)
-        # 选中最新的记录
-        if self.history_list.count() > 0:
-            self.history_list.setCurrentRow(self.history_list.count() - 1)
-
-    def analysis_completed(self, result):
-        self.progress_bar.setValue(100)
-        self.analyze_btn.setEnabled(True)
-        self.analysis_result = result
-        self.results_text.setText(result)
+    def create_timeline_tab(self):
+        """时间线：按时间窗口分析的各窗口结果，点击查看该窗口的完整分析"""
+        tab = QWidget()
+        layout = QVBoxLayout()
         
-        # 保存分析结果到历史记录
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        self.analysis_history.append({
-            "timestamp": timestamp,
-            "result": result,
-            "type": "analysis"
-        })
+        self.timeline_model = TimelineModel(self)
+        self.timeline_list = QListView()
+        self.timeline_list.setModel(self.timeline_model)
+        self.timeline_list.setUniformItemSizes(True)
+        self.timeline_list.clicked.connect(self.show_timeline_item)
         
-        # 保存到文件
-        with open(self.results_file, 'w', encoding='utf-8') as f:
-            json.dump(self.analysis_history, f, ensure_ascii=False, indent=4)
+        self.timeline_detail = QTextEdit()
+        self.timeline_detail.setReadOnly(True)
         
-        # 更新历史记录列表
-        self.update_history_list()
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.timeline_list)
+        splitter.addWidget(self.timeline_detail)
+        layout.addWidget(splitter)
         
-        # 自动切换到结果标签页
-        self.tabs.setCurrentIndex(2)  # 结果标签页的索引是2
-
-    def improve_analysis(self):
-        feedback = self.feedback_text.toPlainText().strip()
-        if not feedback:
-            QMessageBox.warning(self, "提示", "请先输入反馈内容")
-            return
+        tab.setLayout(layout)
+        return tab
+    
+    def create_jobs_tab(self):
+        """任务：排队中、运行中和已结束的分析任务，可取消任务或调整排队任务的优先级"""
+        tab = QWidget()
+        layout = QVBoxLayout()
         
-        # 获取当前选中的历史记录
-        current_row = self.history_list.currentRow()
-        if current_row < 0:
-            QMessageBox.warning(self, "提示", "请先选择一条历史记录")
-            return
+        self.job_model = JobListModel(self.jobs, self)
+        self.job_list = QListView()
+        self.job_list.setModel(self.job_model)
+        self.job_list.setUniformItemSizes(True)
+        self.job_list.setSelectionMode(QListView.ExtendedSelection)
+        self.job_summary = QLabel("没有任务")
         
-        current_item = self.analysis_history[current_row]
+        control_layout = QHBoxLayout()
+        cancel_btn = QPushButton("取消所选任务")
+        cancel_btn.clicked.connect(self.cancel_selected_jobs)
+        cancel_all_btn = QPushButton("取消全部任务")
+        cancel_all_btn.clicked.connect(self.jobs.cancel_all)
+        clear_btn = QPushButton("清除已结束的任务")
+        clear_btn.clicked.connect(self.clear_finished_jobs)
+        
+        self.job_priority_selector = QComboBox()
+        for priority, name in PRIORITY_NAMES.items():
+            self.job_priority_selector.addItem(name, priority)
+        priority_btn = QPushButton("修改优先级")
+        priority_btn.setToolTip("只对排队中的任务生效")
+        priority_btn.clicked.connect(self.change_selected_priority)
+        
+        self.max_jobs_spin = QSpinBox()
+        self.max_jobs_spin.setRange(1, 8)
+        self.max_jobs_spin.setValue(self.jobs.max_running)
+        self.max_jobs_spin.setToolTip("各任务的请求仍共用同一并发限制，同时运行更多任务不会增加 API 压力")
+        self.max_jobs_spin.valueChanged.connect(self.jobs.set_max_running)
+        
+        control_layout.addWidget(cancel_btn)
+        control_layout.addWidget(cancel_all_btn)
+        control_layout.addWidget(clear_btn)
+        control_layout.addStretch()
+        control_layout.addWidget(self.job_priority_selector)
+        control_layout.addWidget(priority_btn)
+        control_layout.addWidget(QLabel("同时运行的任务数:"))
+        control_layout.addWidget(self.max_jobs_spin)
+        
+        layout.addWidget(self.job_summary)
+        layout.addWidget(self.job_list)
+        layout.addLayout(control_layout)
         
-        # 调用分析器进行改进
-        if self.analyzer:
-            self.progress_bar.setValue(0)
-            self.analyze_btn.setEnabled(False)
-            self.analyzer.improve_analysis(current_item["result"], feedback, self.improvement_completed)
+        tab.setLayout(layout)
+        return tab
+    
+    def show_timeline_item(self, index):
+        summary = self.timeline_model.summary(index)
+        self.timeline_detail.setText(summary if summary is not None else "该时间窗口尚未分析完成")
+    
+    def show_history_item(self, index):
+        # 按需从历史记录存储中读取正文
+        history_item = self.history.get(self.history_model.position(index))
+        self.results_text.setText(history_item["result"])
+        self.feedback_text.clear()
 
-    def improvement_completed(self, result):
-        self.progress_bar.setValue(100)
-        self.analyze_btn.setEnabled(True)
-        self.analysis_result = result
-        self.results_text.setText(result)
-        
-        # 保存改进结果到历史记录
+    def update_history_list(self):
+        self.history_model.reload()
+        self.select_latest_history()
+
+    def select_latest_history(self):
+        # 最新的记录显示在第一行
+        if self.history_model.rowCount() > 0:
+            self.history_list.setCurrentIndex(self.history_model.index(0))
+
+    def save_history(self, result, type_, extra=None):
+        """追加一条历史记录，并在列表末尾加入对应条目"""
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        self.analysis_history.append({
+        record = {
             "timestamp": timestamp,
             "result": result,
-            "type": "improvement"
-        })
-        
-        # 保存到文件
-        with open(self.results_file, 'w', encoding='utf-8') as f:
-            json.dump(self.analysis_history, f, ensure_ascii=False, indent=4)
-        
-        # 更新历史记录列表
-        self.update_history_list()
-        self.feedback_text.clear()
+            "type": type_
+        }
+        if extra:
+            record.update(extra)
+        self.history.append(record)
+        self.history_model.record_appended()
+        self.select_latest_history()
 
     def save_api_settings(self):
         api_key = self.api_key_input.text().strip()
@@ -398,14 +768,20 @@ class ChatAnalyzerApp(QMainWindow):
         system_prompt = self.system_prompt.toPlainText().strip()
         
         try:
-            self.analyzer = DeepseekAnalyzer(api_key, model)
+            # 保留配置文件中的其他设置（如并发与限流参数）
+            config = {}
+            if os.path.exists(self.config_file):
+                with open(self.config_file, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            
+            self.analyzer = self.create_analyzer(api_key, model, config)
             
             # 保存配置到文件
-            config = {
+            config.update({
                 "api_key": api_key,
                 "model": model,
                 "system_prompt": system_prompt
-            }
+            })
             
             with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(config, f, ensure_ascii=False, indent=4)
@@ -414,34 +790,95 @@ class ChatAnalyzerApp(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "错误", f"API设置失败: {str(e)}")
     
+    def create_analyzer(self, api_key, model, config):
+        """根据配置创建分析器，并发、限流和缓存参数可在配置文件中设置"""
+        analyzer = create_analyzer(api_key, model, config, self.cache_dir)
+        if "metrics_file" in config:
+            self.metrics_file = config["metrics_file"]
+        if "profile" in config:
+            self.profile_checkbox.setChecked(bool(config["profile"]))
+        # 加载 API Key 后在后台建立连接，第一次分析无需等待握手
+        if config.get("warm_up", True):
+            analyzer.warm_up()
+        return analyzer
+    
     def import_csv(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "选择CSV文件", "", "CSV Files (*.csv)")
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "选择聊天记录文件", "",
+            "聊天记录 (*.csv *.jsonl *.ndjson *.gz *.bz2 *.zst);;CSV Files (*.csv);;JSONL Files (*.jsonl *.ndjson);;All Files (*)")
         
         if not file_path:
             return
         
-        try:
-            self.chat_data = []
-            with open(file_path, 'r', encoding='utf-8') as file:
-                csv_reader = csv.reader(file)
-                headers = next(csv_reader)  # 读取标题行
-                
-                for row in csv_reader:
-                    if len(row) >= 3:  # 确保至少有时间、作者和消息
-                        self.chat_data.append({
-                            'time': row[0],
-                            'author': row[1],
-                            'message': row[2]
-                        })
-            
-            self.file_label.setText(f"已导入: {os.path.basename(file_path)}")
-            
-            # 使用公共方法更新预览
-            self.update_chat_preview()
+        # 导入文件会替换当前数据，停止尚未完成的手动输入解析
+        if self.is_parsing():
+            self.parse_worker.cancel()
+            self.parse_worker = None
+            self.parse_btn.setEnabled(True)
+        
+        # 在后台线程中分块导入，导入过程中即可预览已读取的内容
+        self.chat_data = ChatLog()
+        self.search_index = None
+        self.chat_source = os.path.abspath(file_path)
+        self.import_file_name = os.path.basename(file_path)
+        self.file_label.setText(f"正在导入: {self.import_file_name}")
+        self.update_chat_preview()
+        self.progress_bar.setValue(0)
+        self.progress_label.clear()
+        self.import_btn.setEnabled(False)
+        self.cancel_import_btn.setEnabled(True)
+        
+        self.import_worker = CsvImportWorker(file_path)
+        self.import_worker.chunk_loaded.connect(self.import_chunk_loaded)
+        self.import_worker.index_ready.connect(self.import_index_ready)
+        self.import_worker.progress.connect(self.update_progress)
+        self.import_worker.finished.connect(self.import_finished)
+        self.import_worker.failed.connect(self.import_failed)
+        self.import_worker.start()
+    
+    def cancel_import(self):
+        if self.import_worker:
+            self.import_worker.cancel()
+    
+    def is_importing(self):
+        return self.import_worker is not None and self.import_worker.isRunning()
+    
+    def import_chunk_loaded(self, chunk):
+        # 忽略已被取代（如改为手动输入）的导入任务
+        if self.sender() is not self.import_worker:
+            return
+        first_chunk = not self.chat_data
+        # 通过预览模型追加，视图只需处理新增的行
+        self.preview_model.extend(chunk)
+        self.file_label.setText(f"正在导入: {self.import_file_name}（已读取 {len(self.chat_data)} 条）")
+        
+        if first_chunk:
             self.analyze_btn.setEnabled(True)
-            
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"导入CSV文件失败: {str(e)}")
+    
+    def import_index_ready(self, index):
+        if self.sender() is not self.import_worker:
+            return
+        self.search_index = index
+    
+    def import_finished(self, completed):
+        if self.sender() is not self.import_worker:
+            return
+        self.import_btn.setEnabled(True)
+        self.cancel_import_btn.setEnabled(False)
+        
+        status = "已导入" if completed else "已取消导入"
+        self.file_label.setText(f"{status}: {self.import_file_name}（共 {len(self.chat_data)} 条）")
+        self.analyze_btn.setEnabled(bool(self.chat_data))
+        self.update_date_range()
+        self.export_metrics()
+    
+    def import_failed(self, error):
+        if self.sender() is not self.import_worker:
+            return
+        self.import_btn.setEnabled(True)
+        self.cancel_import_btn.setEnabled(False)
+        self.file_label.setText(f"导入失败: {self.import_file_name}")
+        QMessageBox.critical(self, "错误", f"导入聊天记录文件失败: {error}")
     
     def start_analysis(self):
         if not self.analyzer:
@@ -452,58 +889,412 @@ class ChatAnalyzerApp(QMainWindow):
             QMessageBox.warning(self, "警告", "请先导入聊天记录")
             return
         
-        # 准备聊天数据
-        chat_text = ""
-        for item in self.chat_data:
-            chat_text += f"[{item['time']}] {item['author']}: {item['message']}\n"
+        if self.is_importing():
+            reply = QMessageBox.question(
+                self, "提示",
+                f"导入尚未完成，是否仅分析已导入的 {len(self.chat_data)} 条消息？"
+            )
+            if reply != QMessageBox.Yes:
+                return
+        
+        # 记录本次分析到达的位置，供之后的增量分析续接
+        watermark = make_watermark(self.chat_data, self.chat_source)
+        
+        # 增量模式：只发送上次分析之后新增的消息，并附上上次的分析结果
+        mode = self.mode_selector.currentData()
+        date_range = None
+        if self.range_checkbox.isChecked() and mode != "incremental":
+            date_range = self.selected_date_range()
+            if date_range is None:
+                QMessageBox.warning(self, "警告", "结束日期不能早于开始日期")
+                return
+            # 只分析了部分消息，不能作为之后增量分析的起点
+            watermark = None
+        start = 0
+        previous_summary = None
+        if mode == "incremental":
+            record = latest_analysis(self.history.iter_reversed(source=self.chat_source), self.chat_source)
+            position = resume_position(self.chat_data, record["watermark"]) if record else None
+            if position is None:
+                QMessageBox.information(self, "提示", "未找到可续接的上次分析记录，将分析全部聊天记录")
+                mode = "auto"
+            elif position >= len(self.chat_data):
+                QMessageBox.information(self, "提示", "自上次分析以来没有新增消息")
+                return
+            else:
+                start = position
+                previous_summary = record["result"]
+        
+        if mode == "focused":
+            self.start_focused_analysis(date_range)
+            return
+        
+        # 准备聊天数据（复制一份，导入仍在进行或任务排队期间不受后续修改影响）
+        with METRICS.timer("stage_seconds", stage="snapshot"):
+            if date_range:
+                # 在时间索引上二分查找日期范围，无需扫描全部消息
+                chat_log = self.chat_time_index().select(*date_range)
+            else:
+                chat_log = self.chat_data.slice(start, len(self.chat_data))
+        if date_range and not chat_log:
+            QMessageBox.information(self, "提示", "所选日期范围内没有消息")
+            return
         
         system_prompt = self.system_prompt.toPlainText().strip()
         if not system_prompt:
             system_prompt = None
         
-        # 创建并启动工作线程
+        if mode == "timeline":
+            self.start_timeline_analysis(chat_log, system_prompt)
+            return
+        
+        stream = self.stream_checkbox.isChecked()
+        compress = self.compress_checkbox.isChecked()
+        analyzer = self.analyzer
+        
+        def make_worker(job):
+            worker = AnalysisWorker(analyzer, chat_log, system_prompt, mode, stream, previous_summary, compress)
+            worker.notice.connect(self.statusBar().showMessage)
+            return worker
+        
+        title = f"{self.mode_selector.currentText()}：{self.source_name()}（{len(chat_log)} 条消息）"
+        self.submit_job("analysis", title, make_worker, self.analysis_completed,
+                        source=self.chat_source, watermark=watermark)
+    
+    def start_timeline_analysis(self, chat_log, system_prompt):
+        window = self.window_selector.currentData()
+        if window == "custom":
+            window = self.window_hours.value() * 3600
+        analyzer = self.analyzer
+        compress = self.compress_checkbox.isChecked()
+        
+        def make_worker(job):
+            # 开始运行时才清空时间线，排队期间仍显示上一次的结果
+            self.timeline_job = job
+            self.timeline_model.set_windows([])
+            self.timeline_detail.clear()
+            self.tabs.setCurrentIndex(3)  # 时间线标签页的索引是3
+            worker = TimelineWorker(analyzer, chat_log, window, system_prompt, compress)
+            worker.windows_ready.connect(lambda windows: self.timeline_windows_ready(job, windows))
+            worker.window_done.connect(lambda index, summary: self.timeline_window_done(job, index, summary))
+            return worker
+        
+        def on_result(payload, result):
+            self.analysis_completed(payload, result)
+            self.tabs.setCurrentIndex(3)
+        
+        title = f"按时间窗口：{self.source_name()}（{len(chat_log)} 条消息）"
+        self.submit_job("timeline", title, make_worker, on_result, source=self.chat_source, watermark=None)
+    
+    def timeline_windows_ready(self, job, windows):
+        if job is self.timeline_job:
+            self.timeline_model.set_windows(windows)
+    
+    def timeline_window_done(self, job, index, summary):
+        if job is self.timeline_job:
+            self.timeline_model.set_summary(index, summary)
+    
+    def start_focused_analysis(self, date_range):
+        """检索与主题相关的消息，只发送命中的消息及其上下文进行分析"""
+        query = self.search_input.text().strip()
+        if not query:
+            QMessageBox.warning(self, "警告", "聚焦分析需要先输入检索主题")
+            return
+        result = self.search(query, date_range)
+        if not len(result):
+            QMessageBox.information(self, "提示", "没有找到与该主题相关的消息")
+            return
+        
+        system_prompt = self.system_prompt.toPlainText().strip() or None
+        stream = self.stream_checkbox.isChecked()
+        analyzer = self.analyzer
+        rows = result.rows.tolist()
+        
+        # 复制一份，导入仍在进行或任务排队期间不受后续修改影响
+        chat_log = self.chat_data.slice(0, len(self.chat_data))
+        make_worker = lambda job: FocusedAnalysisWorker(analyzer, chat_log, query, rows, system_prompt, stream)
+        self.submit_job("focused", f"聚焦分析：{query}（{len(rows)} 条命中）", make_worker, self.analysis_completed,
+                        source=self.chat_source, watermark=None)
+    
+    def source_name(self):
+        return os.path.basename(self.chat_source) if self.chat_source not in ("", "manual") else "手动输入"
+    
+    def submit_job(self, kind, title, make_worker, on_result, group=None, **payload):
+        """以所选优先级提交任务：make_worker(job) 在任务开始时创建工作线程，
+        on_result(payload, result) 处理结果，payload 中还有工作线程（worker）和其余关键字参数
+        """
+        payload.update(make_worker=make_worker, on_result=on_result, worker=None)
+        job = self.jobs.submit(Job(kind, title, self.priority_selector.currentData(), group, payload))
+        if job.state == QUEUED:
+            self.statusBar().showMessage(f"任务 #{job.id} 已加入队列，前面还有 {len(self.jobs.queued()) - 1} 个任务")
+        return job
+    
+    def start_job(self, job):
+        """由任务队列调用：创建并启动任务的工作线程，信号都带上所属任务再处理"""
+        worker = job.payload["make_worker"](job)
+        worker.token = job.token
+        worker.profile_dir = self.run_profile_dir()
+        job.payload["worker"] = worker
+        worker.finished.connect(lambda result: self.job_finished(job, result))
+        worker.failed.connect(lambda error: self.job_failed(job, error))
+        worker.cancelled.connect(lambda: self.job_cancelled(job))
+        worker.progress.connect(lambda snapshot: self.job_progress(job, snapshot))
+        worker.partial.connect(lambda text: self.job_partial(job, text))
+        
+        # 进度条和结果面板跟随最近开始的任务
+        self.progress_job = job
         self.progress_bar.setValue(0)
-        self.analyze_btn.setEnabled(False)
+        self.progress_label.clear()
+        if worker.stream:
+            self.display_job = job
+            self.begin_streaming()
+        worker.start()
+    
+    def job_changed(self, job):
+        self.job_model.job_changed(job)
+        running, queued = len(self.jobs.running), len(self.jobs.queued())
+        self.job_summary.setText(f"运行中 {running} 个，排队中 {queued} 个" if running or queued else "没有进行中的任务")
+    
+    def job_progress(self, job, snapshot):
+        self.jobs.update_progress(job, snapshot)
+        if job is self.progress_job:
+            self.update_progress(snapshot)
+    
+    def job_partial(self, job, text):
+        if job is self.display_job:
+            self.append_partial_result(text)
+    
+    def job_finished(self, job, result):
+        self.jobs.finish(job, DONE)
+        if job is self.progress_job:
+            self.progress_bar.setValue(100)
+        payload = job.payload
+        self.release_job(job)
+        payload["on_result"](payload, result)
+    
+    def job_failed(self, job, error):
+        """任务失败时不保存历史记录，结果面板恢复为上一次的分析结果"""
+        self.jobs.finish(job, FAILED, error)
+        if job.state == CANCELLED:
+            self.job_cancelled(job)
+            return
+        self.end_job(job)
+        QMessageBox.critical(self, "错误", f"{job.title} 失败: {error}")
+    
+    def job_cancelled(self, job):
+        """任务被取消（运行中的任务由工作线程报告，排队中的任务由队列直接报告）：不保存结果，结果面板恢复为上一次的分析结果"""
+        self.jobs.finish(job, CANCELLED)
+        self.end_job(job)
+        self.statusBar().showMessage(f"任务 #{job.id} 已取消")
+    
+    def end_job(self, job):
+        """任务未产生结果而结束时还原进度条和结果面板"""
+        if job is self.progress_job:
+            self.progress_bar.setValue(0)
+        if job is self.display_job:
+            self.results_text.setText(self.analysis_result)
+        # 未完成的改进任务将反馈放回输入框，便于修改后重试
+        feedback = job.payload.get("feedback")
+        if feedback and not self.feedback_text.toPlainText().strip():
+            self.feedback_text.setText(feedback)
+        self.release_job(job)
+        self.export_metrics()
+    
+    def release_job(self, job):
+        """等待工作线程退出并释放任务持有的聊天记录副本，已结束的任务只保留状态供列表展示"""
+        worker = job.payload["worker"]
+        if worker is not None:
+            worker.wait()
+            worker.deleteLater()
+        job.payload = None
+        if job is self.display_job:
+            self.display_job = None
+        if job is self.progress_job:
+            self.progress_job = None
+        if job is self.timeline_job:
+            self.timeline_job = None
+    
+    def selected_jobs(self):
+        return [self.job_model.job(index) for index in self.job_list.selectionModel().selectedIndexes()]
+    
+    def cancel_selected_jobs(self):
+        for job in self.selected_jobs():
+            self.jobs.cancel(job)
+    
+    def change_selected_priority(self):
+        priority = self.job_priority_selector.currentData()
+        for job in self.selected_jobs():
+            self.jobs.set_priority(job, priority)
+    
+    def clear_finished_jobs(self):
+        self.jobs.clear_finished()
+        self.job_model.reload()
+    
+    def chat_search_index(self):
+        """当前聊天记录的检索索引，尚未建立或与聊天记录条数不一致时重新建立"""
+        if self.search_index is None or self.search_index.size != len(self.chat_data):
+            self.search_index = SearchIndex.build(self.chat_data)
+        return self.search_index
+    
+    def search(self, query, date_range=None):
+        """按检索框中的作者和给定的日期范围检索，并在检索结果列表中显示命中的消息"""
+        authors = [name.strip() for name in self.search_authors.text().replace("，", ",").split(",") if name.strip()]
+        start, end = date_range or (None, None)
+        result = self.chat_search_index().search(self.chat_data, query, authors or None, start, end)
+        self.search_rows = result.rows.tolist()
+        self.search_model.set_log(self.chat_data.take(self.search_rows))
+        self.search_label.setText(f"命中 {len(result)} 条（{result.seconds * 1000:.1f} ms）")
+        return result
+    
+    def run_search(self):
+        query = self.search_input.text().strip()
+        if not query or not self.chat_data:
+            return
+        date_range = None
+        if self.range_checkbox.isChecked():
+            date_range = self.selected_date_range()
+            if date_range is None:
+                QMessageBox.warning(self, "警告", "结束日期不能早于开始日期")
+                return
+        self.search(query, date_range)
+    
+    def locate_search_hit(self, index):
+        """在聊天记录预览中定位并选中检索命中的消息"""
+        row = self.search_rows[index.row()]
+        target = self.preview_model.index(row)
+        self.chat_preview.scrollTo(target, QListView.PositionAtCenter)
+        self.chat_preview.setCurrentIndex(target)
+    
+    def chat_time_index(self):
+        """当前聊天记录的时间索引，聊天记录替换或追加后重新建立"""
+        index = self.time_index
+        if index is None or index.chat_log is not self.chat_data or index.size != len(self.chat_data):
+            index = self.time_index = TimeIndex(self.chat_data)
+        return index
+    
+    def update_date_range(self):
+        """将日期范围设为聊天记录的首尾日期"""
+        index = self.chat_time_index()
+        if index.first is None:
+            return
+        for date_edit, timestamp in ((self.start_date, index.first), (self.end_date, index.last)):
+            date_edit.setDate(QDate.fromString(time.strftime("%Y-%m-%d", time.gmtime(timestamp)), "yyyy-MM-dd"))
+    
+    def selected_date_range(self):
+        """所选日期范围对应的 [开始, 结束) 秒数，结束日期包含在内；范围无效时返回 None"""
+        start = day_start(self.start_date.date().toPyDate())
+        end = day_start(self.end_date.date().toPyDate()) + DAY
+        return (start, end) if end > start else None
+    
+    def show_estimate(self):
+        """请求前预估：按当前分析模式估算两种模型的 token、耗时和费用，不调用 API"""
+        if not self.analyzer:
+            QMessageBox.warning(self, "警告", "请先设置API Key")
+            return
         
-        self.worker = AnalysisWorker(self.analyzer, chat_text, system_prompt)
-        self.worker.finished.connect(self.analysis_completed)
-        self.worker.progress.connect(self.update_progress)
-        self.worker.start()
+        if not self.chat_data:
+            QMessageBox.warning(self, "警告", "请先导入聊天记录")
+            return
+        
+        mode = self.mode_selector.currentData()
+        if mode == "incremental":
+            mode = "auto"
+        if mode == "focused":
+            self.show_focused_estimate()
+            return
         
-        # 模拟进度条
-        self.progress_timer = self.startTimer(100)
+        # 复制一份，导入仍在进行时不受后续追加影响
+        chat_log = self.chat_data.slice(0, len(self.chat_data))
+        self.estimate_btn.setEnabled(False)
+        self.estimate_worker = EstimateWorker(self.analyzer, chat_log, mode, self.compress_checkbox.isChecked())
+        self.estimate_worker.finished.connect(self.estimate_finished)
+        self.estimate_worker.failed.connect(self.estimate_failed)
+        self.estimate_worker.start()
     
-    def timerEvent(self, event):
-        current = self.progress_bar.value()
-        if current < 95:  # 保留最后5%给实际完成
-            self.progress_bar.setValue(current + 1)
-        else:
-            self.killTimer(self.progress_timer)
+    def estimate_finished(self, text):
+        self.estimate_btn.setEnabled(True)
+        QMessageBox.information(self, "预估消耗", text)
     
-    def update_progress(self, value):
-        self.progress_bar.setValue(value)
+    def estimate_failed(self, error):
+        self.estimate_btn.setEnabled(True)
+        QMessageBox.critical(self, "错误", f"预估消耗失败: {error}")
     
-    def analysis_completed(self, result):
-        self.progress_bar.setValue(100)
-        self.analyze_btn.setEnabled(True)
+    def show_focused_estimate(self):
+        """聚焦分析只发送检索命中的消息及其上下文，按实际发送的内容预估"""
+        query = self.search_input.text().strip()
+        if not query:
+            QMessageBox.warning(self, "警告", "聚焦分析需要先输入检索主题")
+            return
+        result = self.search(query, self.selected_date_range() if self.range_checkbox.isChecked() else None)
+        chat_lines = self.analyzer.build_focused_lines(self.chat_data, result.rows.tolist())
+        tokens = sum(estimate_tokens(line) for line in chat_lines)
+        lines = [f"命中 {len(result)} 条消息，连同上下文发送约 {tokens} tokens"]
+        for model in ("deepseek-chat", "deepseek-reasoner"):
+            lines.append(self.analyzer.describe_plan({"estimate": self.analyzer.estimate(tokens, "single", model)}))
+        QMessageBox.information(self, "预估消耗", "\n".join(lines))
+    
+    def update_progress(self, snapshot):
+        """显示工作线程发来的进度快照：阶段、完成数、token 数和预计剩余时间"""
+        self.progress_bar.setValue(snapshot["percent"])
+        self.progress_label.setText(format_progress(snapshot))
+    
+    def begin_streaming(self):
+        """清空结果面板并切换到结果标签页，准备接收流式输出"""
+        self.results_text.clear()
+        self.tabs.setCurrentIndex(2)  # 结果标签页的索引是2
+    
+    def append_partial_result(self, text):
+        """将流式输出的增量文本追加到结果面板末尾"""
+        self.results_text.moveCursor(QTextCursor.End)
+        self.results_text.insertPlainText(text)
+    
+    def analysis_completed(self, payload, result):
         self.analysis_result = result
         self.results_text.setText(result)
+        self.feedback_session = payload["worker"].session
         
         # 保存分析结果到历史记录
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        self.analysis_history.append({
-            "timestamp": timestamp,
-            "result": result,
-            "type": "analysis"
+        self.save_history(result, "analysis", {
+            "source": payload["source"],
+            "watermark": payload["watermark"]
         })
         
-        # 保存到文件
-        with open(self.results_file, 'w', encoding='utf-8') as f:
-            json.dump(self.analysis_history, f, ensure_ascii=False, indent=4)
+        self.show_cache_stats()
+        self.export_metrics()
         
         # 自动切换到结果标签页
         self.tabs.setCurrentIndex(2)  # 结果标签页的索引是2
     
+    def run_profile_dir(self):
+        """勾选性能采样时返回采样结果目录，否则返回 None"""
+        return self.profile_dir if self.profile_checkbox.isChecked() else None
+    
+    def export_metrics(self):
+        """将性能指标写入 metrics_file 及同名 .prom 文件，返回写入的文件路径；未设置文件时不导出"""
+        if not self.metrics_file:
+            return None
+        try:
+            return METRICS.export(self.metrics_file)
+        except OSError as e:
+            print(f"导出性能指标失败: {str(e)}")
+            return None
+    
+    def show_metrics(self):
+        """导出并显示各阶段耗时的 p50/p95/p99 和 API 用量"""
+        files = self.export_metrics()
+        text = format_summary(METRICS.snapshot()) or "尚未记录性能指标"
+        if files:
+            text += "\n\n已导出到:\n" + "\n".join(files)
+        QMessageBox.information(self, "性能指标", text)
+    
+    def show_cache_stats(self):
+        """在状态栏显示响应缓存的命中统计"""
+        if self.analyzer and self.analyzer.cache:
+            stats = self.analyzer.cache.stats()
+            self.statusBar().showMessage(
+                f"缓存命中 {stats['hits']} 次，未命中 {stats['misses']} 次（命中率 {stats['hit_rate']:.0%}）"
+            )
+    
     def improve_analysis(self):
         if not self.analyzer or not self.analysis_result:
             QMessageBox.warning(self, "警告", "请先完成分析")
@@ -514,52 +1305,27 @@ class ChatAnalyzerApp(QMainWindow):
             QMessageBox.warning(self, "警告", "请输入反馈内容")
             return
         
-        # 创建并启动工作线程
-        self.progress_bar.setValue(0)
-        
-        # 禁用提交按钮，防止重复提交
-        sender = self.sender()
-        if sender:
-            sender.setEnabled(False)
+        stream = self.stream_checkbox.isChecked()
+        analyzer = self.analyzer
         
-        self.improve_worker = AnalysisImproveWorker(self.analyzer, self.analysis_result, feedback)
-        self.improve_worker.finished.connect(self.improve_analysis_completed)
-        self.improve_worker.progress.connect(self.update_progress)
-        self.improve_worker.start()
+        def make_worker(job):
+            # 开始运行时才读取当前的分析结果，依次改进的反馈都基于前一次改进的结果
+            return AnalysisImproveWorker(analyzer, self.analysis_result, feedback, stream, self.feedback_session)
         
-        # 模拟进度条
-        self.progress_timer = self.startTimer(100)
+        # 同组任务依次运行，已提交的反馈从输入框移入任务
+        self.submit_job("improve", f"改进分析：{feedback[:20]}", make_worker, self.improve_analysis_completed,
+                        group="feedback", feedback=feedback)
+        self.feedback_text.clear()
     
-    def improve_analysis_completed(self, result):
-        self.progress_bar.setValue(100)
-        
-        # 停止定时器
-        if hasattr(self, 'progress_timer'):
-            try:
-                self.killTimer(self.progress_timer)
-            except:
-                pass
-        
-        # 重新启用提交按钮
-        for widget in self.findChildren(QPushButton):
-            if widget.text() == "提交反馈并改进":
-                widget.setEnabled(True)
-        
+    def improve_analysis_completed(self, payload, result):
         self.analysis_result = result
         self.results_text.setText(result)
-        self.feedback_text.clear()
         
         # 保存改进后的分析结果到历史记录
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        self.analysis_history.append({
-            "timestamp": timestamp,
-            "result": result,
-            "type": "improvement"
-        })
+        self.save_history(result, "improvement")
         
-        # 保存到文件
-        with open(self.results_file, 'w', encoding='utf-8') as f:
-            json.dump(self.analysis_history, f, ensure_ascii=False, indent=4)
+        self.show_cache_stats()
+        self.export_metrics()
         
         # 自动切换到结果标签页
         self.tabs.setCurrentIndex(2)  # 结果标签页的索引是2
@@ -586,118 +1352,120 @@ class ChatAnalyzerApp(QMainWindow):
             QMessageBox.critical(self, "错误", f"导出结果失败: {str(e)}")
     
     def parse_manual_input(self):
-        """解析用户手动输入的聊天记录"""
+        """在后台解析用户手动输入的聊天记录，解析结果逐块显示在预览中"""
         text = self.manual_input.toPlainText().strip()
         if not text:
             QMessageBox.warning(self, "警告", "请输入聊天记录")
             return
         
-        self.chat_data = []
-        lines = text.split('\n')
-        
-        # 解析每一行
-        for line in lines:
-            line = line.strip()
-            if not line:  # 跳过空行
-                continue
-                
-            # 尝试解析标准格式: [时间] 作者: 消息
-            standard_format = False
-            if line.startswith('[') and ']' in line:
-                try:
-                    time_part = line[1:line.index(']')]
-                    rest_part = line[line.index(']')+1:].strip()
-                    
-                    if ':' in rest_part:
-                        author = rest_part[:rest_part.index(':')].strip()
-                        message = rest_part[rest_part.index(':')+1:].strip()
-                        
-                        self.chat_data.append({
-                            'time': time_part,
-                            'author': author,
-                            'message': message
-                        })
-                        standard_format = True
-                except:
-                    standard_format = False
-            
-            # 如果不是标准格式，尝试简化格式: 作者: 消息
-            if not standard_format:
-                if ':' in line:
-                    author = line[:line.index(':')].strip()
-                    message = line[line.index(':')+1:].strip()
-                    
-                    # 使用当前时间作为时间戳
-                    current_time = time.strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    self.chat_data.append({
-                        'time': current_time,
-                        'author': author,
-                        'message': message
-                    })
-                else:
-                    # 如果连简化格式都不是，将整行作为消息，作者为"未知"
-                    current_time = time.strftime("%Y-%m-%d %H:%M:%S")
-                    self.chat_data.append({
-                        'time': current_time,
-                        'author': "未知",
-                        'message': line
-                    })
-        
+        # 手动输入会替换当前数据，停止尚未完成的导入和解析
+        if self.is_importing():
+            self.import_worker.cancel()
+            self.import_worker = None
+            self.import_btn.setEnabled(True)
+            self.cancel_import_btn.setEnabled(False)
+        if self.is_parsing():
+            self.parse_worker.cancel()
+        
+        self.chat_data = ChatLog()
+        self.chat_source = "manual"
+        self.search_index = None
+        self.update_chat_preview()
+        self.analyze_btn.setEnabled(False)
+        self.parse_btn.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.progress_label.clear()
+        
+        self.parse_worker = ManualParseWorker(text)
+        self.parse_worker.chunk_loaded.connect(self.parse_chunk_loaded)
+        self.parse_worker.progress.connect(self.update_progress)
+        self.parse_worker.finished.connect(self.parse_finished)
+        self.parse_worker.failed.connect(self.parse_failed)
+        self.parse_worker.start()
+    
+    def is_parsing(self):
+        return self.parse_worker is not None and self.parse_worker.isRunning()
+    
+    def parse_chunk_loaded(self, chunk):
+        # 忽略已被取代（如重新解析或改为导入文件）的解析任务
+        if self.sender() is not self.parse_worker:
+            return
+        self.preview_model.extend(chunk)
+        self.file_label.setText(f"正在解析手动输入（已解析 {len(self.chat_data)} 条）")
+    
+    def parse_finished(self, unparsed):
+        if self.sender() is not self.parse_worker:
+            return
+        self.parse_btn.setEnabled(True)
         if not self.chat_data:
+            self.file_label.setText("未选择文件")
             QMessageBox.warning(self, "警告", "无法解析聊天记录，请检查格式")
             return
         
-        # 更新预览
-        self.update_chat_preview()
+        self.update_date_range()
         self.analyze_btn.setEnabled(True)
-        QMessageBox.information(self, "成功", f"已解析 {len(self.chat_data)} 条聊天记录")
+        self.file_label.setText(f"手动输入（共 {len(self.chat_data)} 条）")
+        message = f"已解析 {len(self.chat_data)} 条聊天记录"
+        if unparsed:
+            message += f"，{unparsed} 行无法解析（位于第一条消息之前）"
+        self.export_metrics()
+        QMessageBox.information(self, "成功", message)
+    
+    def parse_failed(self, error):
+        if self.sender() is not self.parse_worker:
+            return
+        self.parse_btn.setEnabled(True)
+        QMessageBox.critical(self, "错误", f"解析聊天记录失败: {error}")
+    
+    def closeEvent(self, event):
+        """关闭窗口时取消全部任务，等待工作线程中断请求后退出"""
+        self.jobs.cancel_all()
+        for job in list(self.jobs.running):
+            if job.payload and job.payload["worker"] is not None:
+                job.payload["worker"].wait()
+        super().closeEvent(event)
     
     def update_chat_preview(self):
-        """更新聊天记录预览"""
-        preview_text = ""
-        for i, item in enumerate(self.chat_data[:10]):  # 只显示前10条
-            preview_text += f"[{item['time']}] {item['author']}: {item['message']}\n\n"
-        
-        if len(self.chat_data) > 10:
-            preview_text += f"... 还有 {len(self.chat_data) - 10} 条消息 ..."
-        
-        self.chat_preview.setText(preview_text)
+        """更新聊天记录预览（列表视图只绘制可见的行）"""
+        self.preview_model.set_log(self.chat_data)
         
     def load_config(self):
         """从配置文件加载设置和历史记录"""
         try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
+            # 加载历史分析记录（首次运行时从旧版 results.json 迁移）
+            self.history.migrate_from_json(self.legacy_results_file)
+            self.update_history_list()
             
-            # 加载历史分析记录
-            if os.path.exists(self.results_file):
-                with open(self.results_file, 'r', encoding='utf-8') as f:
-                    self.analysis_history = json.load(f)
-                # 更新历史记录列表
-                self.update_history_list()
-                
-                # 设置API密钥
-                if "api_key" in config and config["api_key"]:
-                    self.api_key_input.setText(config["api_key"])
-                
-                # 设置模型
-                if "model" in config and config["model"]:
-                    index = self.model_selector.findData(config["model"])
-                    if index >= 0:
-                        self.model_selector.setCurrentIndex(index)
-                
-                # 设置系统提示词
-                if "system_prompt" in config and config["system_prompt"]:
-                    self.system_prompt.setText(config["system_prompt"])
-                
-                # 如果有API密钥，自动初始化分析器
-                if "api_key" in config and config["api_key"] and "model" in config and config["model"]:
-                    try:
-                        self.analyzer = DeepseekAnalyzer(config["api_key"], config["model"])
-                    except Exception as e:
-                        print(f"初始化分析器失败: {str(e)}")
+            if not os.path.exists(self.config_file):
+                return
+            
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            
+            # 设置API密钥
+            if "api_key" in config and config["api_key"]:
+                self.api_key_input.setText(config["api_key"])
+            
+            # 设置模型
+            if "model" in config and config["model"]:
+                index = self.model_selector.findData(config["model"])
+                if index >= 0:
+                    self.model_selector.setCurrentIndex(index)
+            
+            # 设置系统提示词
+            if "system_prompt" in config and config["system_prompt"]:
+                self.system_prompt.setText(config["system_prompt"])
+            
+            # 同时运行的分析任务数
+            if "max_jobs" in config:
+                self.max_jobs_spin.setValue(int(config["max_jobs"]))
+            
+            # 如果有API密钥，自动初始化分析器
+            if "api_key" in config and config["api_key"] and "model" in config and config["model"]:
+                try:
+                    self.analyzer = self.create_analyzer(config["api_key"], config["model"], config)
+                except Exception as e:
+                    print(f"初始化分析器失败: {str(e)}")
         except Exception as e:
             print(f"加载配置失败: {str(e)}")
 
@@ -753,6 +1521,7 @@ def main():
     
     window = ChatAnalyzerApp()
     window.show()
+    app.aboutToQuit.connect(close_shared_clients)
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
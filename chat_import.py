@@ -0,0 +1,369 @@
+"""聊天记录导入：以生成器方式分块读取聊天记录文件，内存占用只与块大小有关
+
+支持的格式通过 register_importer 注册（内置 CSV 和 JSONL），各格式的解析函数接收逐块解码的文本，
+产出相同结构的 ChatLog 分块。gzip / bz2 / zstd 压缩的文件按文件头识别并边读边解压，
+未压缩的文件通过 mmap 读取，原始字节直接交给增量解码器，无需先读入缓冲区。
+未指定编码时按文件开头的内容识别 UTF-8（含 BOM）、UTF-16 或 GBK（按 GB18030 解码）。
+"""
+
+import bz2
+import codecs
+import csv
+import gzip
+import io
+import json
+import mmap
+import os
+import re
+import time
+
+from chat_log import ChatLog
+from metrics import METRICS
+
+# 每次从文件读取并解码的字节数
+BLOCK_SIZE = 1 << 22
+# 识别编码和格式时检查的文件开头字节数
+SNIFF_SIZE = 1 << 16
+# 依次尝试的编码，GB18030 兼容 GBK 和 GB2312
+FALLBACK_ENCODINGS = ("utf-8", "gb18030")
+
+
+def _open_zstd(raw):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("读取 zstd 压缩文件需要安装 zstandard（pip install zstandard）") from None
+    return zstandard.ZstdDecompressor().stream_reader(raw)
+
+
+# 压缩格式：文件头魔数 -> 打开解压流的函数
+COMPRESSIONS = {
+    "gzip": (b"\x1f\x8b", lambda raw: gzip.GzipFile(fileobj=raw)),
+    "bz2": (b"BZh", lambda raw: bz2.BZ2File(raw)),
+    "zstd": (b"\x28\xb5\x2f\xfd", _open_zstd),
+}
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".zst")
+
+
+class ChatSource:
+    """聊天记录文件的原始字节来源，position 为已读取的原始（压缩）字节数，用于报告进度
+
+    压缩文件边读边解压；未压缩的文件通过 mmap 按块取 memoryview，不复制数据。
+    head 为文件（解压后）开头的内容，用于识别编码和格式。
+    """
+
+    def __init__(self, file_path, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self.raw = open(file_path, 'rb')
+        self.total_bytes = os.fstat(self.raw.fileno()).st_size
+        self.position = 0
+        self.mmap = None
+        self.stream = None
+        self.pending = b""
+
+        magic = self.raw.read(4)
+        self.raw.seek(0)
+        self.compression = next((name for name, (prefix, _) in COMPRESSIONS.items() if magic.startswith(prefix)), None)
+        try:
+            if self.compression:
+                self.stream = COMPRESSIONS[self.compression][1](self.raw)
+                # 已解压但尚未产出的开头部分
+                self.pending = self.stream.read(SNIFF_SIZE)
+                self.head = self.pending
+            elif self.total_bytes:
+                self.mmap = mmap.mmap(self.raw.fileno(), 0, access=mmap.ACCESS_READ)
+                self.head = self.mmap[:SNIFF_SIZE]
+            else:
+                self.head = b""
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def blocks(self):
+        """逐块产出原始（解压后）字节，mmap 时为 memoryview"""
+        if self.mmap is not None:
+            view = memoryview(self.mmap)
+            try:
+                for start in range(0, len(view), self.block_size):
+                    block = view[start:start + self.block_size]
+                    self.position = start + len(block)
+                    yield block
+                    block.release()
+            finally:
+                view.release()
+        elif self.stream is not None:
+            if self.pending:
+                yield self.pending
+                self.pending = b""
+            while True:
+                block = self.stream.read(self.block_size)
+                self.position = self.raw.tell()
+                if not block:
+                    break
+                yield block
+
+    def text_blocks(self, encoding):
+        """逐块产出解码后的文本，每块以完整的行结束（最后一块除外），无法解码的字节替换为 U+FFFD"""
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        rest = ""
+        for block in self.blocks():
+            text = rest + decoder.decode(block)
+            cut = text.rfind("\n") + 1
+            if cut:
+                yield text[:cut]
+            rest = text[cut:]
+        rest += decoder.decode(b"", final=True)
+        if rest:
+            yield rest
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+        if self.mmap is not None:
+            self.mmap.close()
+        self.raw.close()
+
+
+def detect_encoding(head):
+    """根据文件开头的字节识别编码：BOM 优先，其次依次尝试 UTF-8 和 GB18030"""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            # 开头片段可能在多字节字符中间截断，不视为错误
+            codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "utf-8"
+
+
+# 已注册的导入格式：格式名 -> 解析函数，扩展名 -> 格式名
+IMPORTERS = {}
+EXTENSIONS = {}
+
+
+def register_importer(name, extensions=()):
+    """注册导入格式的装饰器
+
+    解析函数接收 (text_blocks, chunk_size)：text_blocks 为逐块产出、以完整行结束的文本，
+    函数逐块产出最多 chunk_size 条记录的 ChatLog，最后总是产出剩余的（可能为空的）一块。
+    """
+    def decorator(func):
+        IMPORTERS[name] = func
+        for extension in extensions:
+            EXTENSIONS[extension] = name
+        return func
+    return decorator
+
+
+def detect_format(file_path, head=b""):
+    """按扩展名（忽略压缩后缀）识别格式，无法识别时以 "{" 开头的内容视为 JSONL，其余视为 CSV"""
+    name = file_path.lower()
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    extension = os.path.splitext(name)[1]
+    if extension in EXTENSIONS:
+        return EXTENSIONS[extension]
+    return "jsonl" if head.lstrip(codecs.BOM_UTF8 + b" \t\r\n").startswith(b"{") else "csv"
+
+
+def iter_chat_chunks(file_path, chunk_size=10000, encoding=None, format=None):
+    """逐块读取任意已注册格式的聊天记录文件
+
+    每次产出 (chunk, bytes_read, total_bytes)，chunk 为最多 chunk_size 条记录组成的
+    ChatLog，bytes_read 为已读取的原始（压缩文件为压缩后）字节数，用于报告进度。
+    encoding / format 为 None 时自动识别。每块的解析耗时（不含调用方处理该块的时间）
+    记录为 stage_seconds{stage="<格式>_parse"}。
+    """
+    with ChatSource(file_path) as source:
+        encoding = encoding or detect_encoding(source.head)
+        format = format or detect_format(file_path, source.head)
+        if format not in IMPORTERS:
+            raise ValueError(f"不支持的聊天记录格式: {format}")
+        stage = f"{format}_parse"
+
+        started = time.perf_counter()
+        for chunk in IMPORTERS[format](source.text_blocks(encoding), chunk_size):
+            METRICS.observe("stage_seconds", time.perf_counter() - started, stage=stage)
+            yield chunk, source.position, source.total_bytes
+            started = time.perf_counter()
+
+
+def iter_csv_chunks(file_path, chunk_size=10000, encoding=None):
+    """逐块读取 CSV 聊天记录（见 iter_chat_chunks），encoding 为 None 时自动识别"""
+    return iter_chat_chunks(file_path, chunk_size, encoding, "csv")
+
+
+def _iter_lines(text_blocks):
+    for text in text_blocks:
+        yield from io.StringIO(text, newline='')
+
+
+@register_importer("csv", (".csv",))
+def parse_csv(text_blocks, chunk_size):
+    """CSV：第一行视为标题行并跳过，依次为时间、作者、消息三列，列数不足 3 的行会被忽略"""
+    csv_reader = csv.reader(_iter_lines(text_blocks))
+    next(csv_reader, None)  # 跳过标题行
+
+    chunk = ChatLog()
+    for row in csv_reader:
+        if len(row) >= 3:  # 确保至少有时间、作者和消息
+            chunk.append(row[0], row[1], row[2])
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = ChatLog()
+    yield chunk
+
+
+# JSONL 各字段可使用的键名
+JSON_FIELDS = {
+    "time": ("time", "timestamp", "date", "datetime"),
+    "author": ("author", "sender", "user", "name", "from"),
+    "message": ("message", "content", "text", "msg"),
+}
+
+
+def _json_field(record, field):
+    for key in JSON_FIELDS[field]:
+        value = record.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+@register_importer("jsonl", (".jsonl", ".ndjson"))
+def parse_jsonl(text_blocks, chunk_size):
+    """JSONL：每行一个 JSON 对象，字段名见 JSON_FIELDS；时间可为字符串或 Unix 秒数，
+    无法解析的行和缺少消息的行会被忽略
+    """
+    chunk = ChatLog()
+    for line in _iter_lines(text_blocks):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(record, dict):
+            continue
+        message = _json_field(record, "message")
+        if message is None:
+            continue
+        time_value = _json_field(record, "time")
+        if isinstance(time_value, (int, float)) and not isinstance(time_value, bool):
+            time_value = ChatLog.format_time(int(time_value))
+        author = _json_field(record, "author")
+        chunk.append("" if time_value is None else str(time_value), "未知" if author is None else str(author),
+                     message if isinstance(message, str) else str(message))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = ChatLog()
+    yield chunk
+
+
+# 带时间的消息开头：行首的 [时间] 作者: （冒号可为全角），消息正文到下一个消息开头为止，可跨多行
+TIMED_HEADER = r"[ \t]*\[([^\]\n]*)\][ \t]*([^:：\n]*?)[ \t]*[:：][ \t]*"
+# 不带时间的消息开头：行首的 作者: ，作者名不超过 32 个字符且不含方括号
+PLAIN_HEADER = r"[ \t]*([^:：\[\]\n]{1,32}?)[ \t]*[:：][ \t]*"
+# 判断一行是否为消息开头，与上面的模式匹配同样的行，但不捕获分组、尽量不回溯
+TIMED_BOUNDARY = r"[ \t]*\[[^\]\n]*\][^:：\n]*[:：]"
+PLAIN_BOUNDARY = r"[ \t]*[^:：\[\]\n]{1,32}?[ \t]*[:：]"
+# 粘贴文本每次解析的字符数，每块在消息开头处切分并产出一个分块
+TEXT_BLOCK_SIZE = 1 << 20
+
+
+def _record_pattern(header, boundary):
+    """整条消息的模式：消息开头及其后直到下一个消息开头之前的各行，正文为最后一个分组"""
+    return re.compile(rf"^{header}(.*(?:\n(?!{boundary}).*)*)", re.M)
+
+
+TIMED_RECORD = _record_pattern(TIMED_HEADER, TIMED_BOUNDARY)
+PLAIN_RECORD = _record_pattern(PLAIN_HEADER, PLAIN_BOUNDARY)
+
+
+class ChatTextParser:
+    """解析粘贴的聊天记录文本，每条消息以 "[时间] 作者: 消息" 或省略时间的 "作者: 消息" 开头
+
+    每块文本用一个编译好的正则表达式一次取出全部消息（findall），消息开头之后直到下一个消息开头
+    之前的内容即为正文，因此消息可以跨多行。文本中出现带时间的开头时只按带时间的格式划分
+    （正文中的 "xx: " 不会被误认为新消息），否则按不带时间的格式划分，时间统一使用解析开始时的当前时间。
+    第一条消息之前无法归属任何消息的非空行计入 unparsed。
+    """
+
+    def __init__(self):
+        self.unparsed = 0
+
+    def iter_rows(self, text, block_size=TEXT_BLOCK_SIZE):
+        """逐块产出 (times, authors, messages, position, total) 三列内容及已解析的字符数
+
+        最后总是产出剩余的（可能为空的）一块，此时 position 等于 total。
+        """
+        self.unparsed = 0
+        total = len(text)
+        record = TIMED_RECORD
+        first = record.search(text)
+        if first is None:
+            record = PLAIN_RECORD
+            first = record.search(text)
+        if first is None:
+            self.unparsed = _count_lines(text)
+            yield (), (), [], total, total
+            return
+        timed = record is TIMED_RECORD
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.unparsed = _count_lines(text[:first.start()])
+
+        start = first.start()
+        while True:
+            # 在 block_size 之后的第一个消息开头处切分，保证每块都从消息开头开始
+            cut = record.search(text, start + block_size) if start + block_size < total else None
+            end = cut.start() if cut else total
+            rows = record.findall(text, start, end)
+            if timed:
+                times, authors, bodies = zip(*rows)
+            else:
+                authors, bodies = zip(*rows)
+                times = (now,) * len(rows)
+            yield times, authors, [_clean_message(body) for body in bodies], end, total
+            if cut is None:
+                return
+            start = end
+
+    def iter_chunks(self, text, block_size=TEXT_BLOCK_SIZE):
+        """逐块产出 (chunk, position, total)，chunk 为 ChatLog，其余同 iter_rows"""
+        for times, authors, messages, position, total in self.iter_rows(text, block_size):
+            chunk = ChatLog()
+            chunk.extend_rows(times, authors, messages)
+            yield chunk, position, total
+
+
+def _clean_message(body):
+    """去掉消息首尾的空白；多行消息再去掉各行首尾的空白和空行"""
+    message = body.strip()
+    if "\n" in message:
+        message = "\n".join(line.strip() for line in message.split("\n") if line.strip())
+    return message
+
+
+def _count_lines(text):
+    """非空行数"""
+    return sum(1 for line in text.split("\n") if line.strip())
+
+
+def parse_chat_text(text):
+    """解析手动输入的聊天记录文本（见 ChatTextParser），返回 ChatLog"""
+    chat_log = ChatLog()
+    for times, authors, messages, _, _ in ChatTextParser().iter_rows(text):
+        chat_log.extend_rows(times, authors, messages)
+    return chat_log
@@ -0,0 +1,329 @@
+"""紧凑的列式聊天记录容器"""
+
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timezone
+from functools import lru_cache
+import hashlib
+import time
+
+import numpy as np
+
+
+# 标准时间格式 "YYYY-MM-DD HH:MM:SS" 中分隔符的位置，其余位置均为数字
+_SEPARATORS = {4: "-", 7: "-", 10: " ", 13: ":", 16: ":"}
+_DIGITS = [i for i in range(19) if i not in _SEPARATORS]
+
+
+def _parse_standard_times(times):
+    """批量解析标准格式的时间字符串，返回 (秒数数组, 是否为标准格式的布尔数组)
+
+    与 ChatLog._parse_standard_time 逐条解析的结果一致：格式、月份天数和时分秒范围都有效才算标准格式。
+    """
+    count = len(times)
+    lengths = np.fromiter(map(len, times), dtype=np.int64, count=count)
+    codes = np.array(times, dtype="U19").view(np.uint32).reshape(count, 19)
+    valid = lengths == 19
+    for position, separator in _SEPARATORS.items():
+        valid &= codes[:, position] == ord(separator)
+    # 无符号减法使小于 "0" 的字符变为很大的数，一次比较即可判断是否为数字
+    digits = codes[:, _DIGITS] - np.uint32(ord("0"))
+    valid &= (digits <= 9).all(axis=1)
+    digits = np.where(valid[:, None], digits, 0).astype(np.int64)
+
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month, day = digits[:, 4] * 10 + digits[:, 5], digits[:, 6] * 10 + digits[:, 7]
+    hour, minute, second = (digits[:, 8] * 10 + digits[:, 9], digits[:, 10] * 10 + digits[:, 11],
+                            digits[:, 12] * 10 + digits[:, 13])
+    valid &= (year >= 1) & (month >= 1) & (month <= 12) & (hour <= 23) & (minute <= 59) & (second <= 59)
+
+    # 当月第一天及下月第一天距 1970-01-01 的天数，用于检查日期并换算秒数
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0)
+    first = months.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+    following = (months + 1).astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+    valid &= (day >= 1) & (day <= following - first)
+    seconds = (first + day - 1) * 86400 + hour * 3600 + minute * 60 + second
+    return seconds, valid
+
+
+@lru_cache(maxsize=4096)
+def _day_seconds(date_text):
+    """"YYYY-MM-DD" 当天零点对应的秒数，格式不符时返回 None"""
+    try:
+        day = date.fromisoformat(date_text)
+    except ValueError:
+        return None
+    if day.isoformat() != date_text:
+        return None
+    return (day.toordinal() - 719163) * 86400
+
+
+class ChatLog:
+    """按列存储聊天记录
+
+    时间戳存为 int64 数组（按原始时间字符串的字面时间换算的秒数），作者存为
+    分类编码数组，消息以 UTF-8 连续存放在同一块缓冲区中并用偏移数组定位。
+    支持 len()、下标、切片和迭代，下标与迭代返回 {'time', 'author', 'message'} 字典，
+    与原先的每行字典列表兼容。
+    """
+
+    # 无法解析的时间使用的占位时间戳
+    MISSING_TIME = -2 ** 63
+    TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self):
+        self.timestamps = array('q')
+        self.author_codes = array('i')
+        self.authors = []
+        self.author_index = {}
+        self.buffer = bytearray()
+        self.offsets = array('q', [0])
+        # 与标准格式不一致的原始时间字符串，以便原样还原：raw_rows 为升序的行号，
+        # 对应的字符串以 UTF-8 连续存放在 raw_buffer 中，用 raw_offsets 定位
+        self.raw_rows = array('q')
+        self.raw_buffer = bytearray()
+        self.raw_offsets = array('q', [0])
+
+    @classmethod
+    def from_rows(cls, rows):
+        log = cls()
+        for row in rows:
+            log.append(row['time'], row['author'], row['message'])
+        return log
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __bool__(self):
+        return len(self.timestamps) > 0
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self.slice(start, stop)
+            return ChatLog.from_rows(self[i] for i in range(start, stop, step))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ChatLog index out of range")
+        return {
+            'time': self.time(index),
+            'author': self.author(index),
+            'message': self.message(index)
+        }
+
+    def _author_code(self, author):
+        code = self.author_index.get(author)
+        if code is None:
+            code = len(self.authors)
+            self.authors.append(author)
+            self.author_index[author] = code
+        return code
+
+    @classmethod
+    def parse_time(cls, text):
+        """将时间字符串解析为字面时间对应的秒数，无法解析时返回 MISSING_TIME"""
+        try:
+            dt = datetime.fromisoformat(text.strip())
+        except ValueError:
+            return cls.MISSING_TIME
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp())
+
+    @classmethod
+    def format_time(cls, timestamp):
+        if timestamp == cls.MISSING_TIME:
+            return ""
+        return time.strftime(cls.TIME_FORMAT, time.gmtime(timestamp))
+
+    @staticmethod
+    def _parse_standard_time(text):
+        """快速解析标准格式 "YYYY-MM-DD HH:MM:SS"，不符合时返回 None"""
+        if len(text) != 19 or text[10] != ' ' or text[13] != ':' or text[16] != ':':
+            return None
+        day = _day_seconds(text[:10])
+        hour, minute, second = text[11:13], text[14:16], text[17:19]
+        if day is None or not (hour.isdigit() and minute.isdigit() and second.isdigit()):
+            return None
+        hour, minute, second = int(hour), int(minute), int(second)
+        if hour > 23 or minute > 59 or second > 59:
+            return None
+        return day + hour * 3600 + minute * 60 + second
+
+    def append(self, time_text, author, message):
+        timestamp = self._parse_standard_time(time_text)
+        if timestamp is None:
+            # 非标准格式：解析后保留原始字符串，保证原样还原
+            timestamp = self.parse_time(time_text)
+            self._add_raw_time(len(self.timestamps), time_text)
+
+        self.timestamps.append(timestamp)
+        self.author_codes.append(self._author_code(author))
+        self.buffer += message.encode('utf-8')
+        self.offsets.append(len(self.buffer))
+
+    def extend_rows(self, times, authors, messages):
+        """批量追加等长的时间、作者、消息三列，结果与逐条 append 相同
+
+        标准格式的时间用 numpy 批量换算，其余逐条解析并保留原始字符串；消息一次编码后整体追加。
+        """
+        if not times:
+            return
+        base_index = len(self)
+        seconds, valid = _parse_standard_times(times)
+        if not valid.all():
+            for index in np.flatnonzero(~valid).tolist():
+                seconds[index] = self.parse_time(times[index])
+                self._add_raw_time(base_index + index, times[index])
+        self.timestamps.frombytes(seconds.astype(np.int64).tobytes())
+        self.author_codes.extend([self._author_code(author) for author in authors])
+
+        encoded = [message.encode('utf-8') for message in messages]
+        base_offset = len(self.buffer)
+        self.buffer += b"".join(encoded)
+        ends = np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))) + base_offset
+        self.offsets.frombytes(ends.tobytes())
+
+    def extend(self, other):
+        """追加另一个 ChatLog（按列整体拼接）或若干行字典"""
+        if not isinstance(other, ChatLog):
+            for row in other:
+                self.append(row['time'], row['author'], row['message'])
+            return
+
+        base_index = len(self)
+        base_offset = len(self.buffer)
+        code_map = array('i', (self._author_code(author) for author in other.authors))
+
+        self.timestamps.extend(other.timestamps)
+        self.author_codes.extend(code_map[code] for code in other.author_codes)
+        self.buffer += other.buffer
+        self.offsets.extend(offset + base_offset for offset in other.offsets[1:])
+        self._extend_raw_times(other, 0, len(other.raw_rows), base_index)
+
+    def slice(self, start, stop):
+        """返回 [start, stop) 范围内记录组成的新 ChatLog"""
+        log = ChatLog()
+        if stop <= start:
+            return log
+        begin, end = self.offsets[start], self.offsets[stop]
+
+        log.timestamps = self.timestamps[start:stop]
+        log.buffer = bytearray(memoryview(self.buffer)[begin:end])
+        log.offsets = array('q', (offset - begin for offset in self.offsets[start:stop + 1]))
+
+        # 只保留切片中出现的作者，重新编码
+        log.author_codes = array('i', (log._author_code(self.authors[code])
+                                       for code in self.author_codes[start:stop]))
+        log._extend_raw_times(self, *self._raw_range(start, stop), -start)
+        return log
+
+    def take(self, indices):
+        """返回按 indices 顺序取出的记录组成的新 ChatLog（用于按时间重新排序后取子集）"""
+        log = ChatLog()
+        indices = [int(index) for index in indices]
+        offsets = self.offsets
+        buffer = memoryview(self.buffer)
+
+        log.timestamps = array('q', (self.timestamps[i] for i in indices))
+        log.author_codes = array('i', (log._author_code(self.authors[self.author_codes[i]]) for i in indices))
+        log.buffer = bytearray(b"".join(buffer[offsets[i]:offsets[i + 1]] for i in indices))
+        position = 0
+        for i in indices:
+            position += offsets[i + 1] - offsets[i]
+            log.offsets.append(position)
+        if self.raw_rows:
+            rows = np.frombuffer(self.raw_rows, dtype=np.int64)
+            positions = np.searchsorted(rows, indices)
+            found = positions < len(rows)
+            found[found] = rows[positions[found]] == np.asarray(indices, dtype=np.int64)[found]
+            for new in np.flatnonzero(found).tolist():
+                log._add_raw_time(new, self._raw_text(int(positions[new])))
+        return log
+
+    def _add_raw_time(self, index, text):
+        """记录第 index 行的原始时间字符串，index 须大于已记录的行号"""
+        self.raw_rows.append(index)
+        self.raw_buffer += text.encode('utf-8')
+        self.raw_offsets.append(len(self.raw_buffer))
+
+    def _extend_raw_times(self, other, lo, hi, shift):
+        """整段追加 other 中第 lo 到 hi 个原始时间字符串，行号加上 shift"""
+        if lo >= hi:
+            return
+        begin, end = other.raw_offsets[lo], other.raw_offsets[hi]
+        base = len(self.raw_buffer)
+        rows = np.frombuffer(other.raw_rows, dtype=np.int64)[lo:hi] + shift
+        ends = np.frombuffer(other.raw_offsets, dtype=np.int64)[lo + 1:hi + 1] - begin + base
+        self.raw_rows.frombytes(rows.tobytes())
+        self.raw_buffer += memoryview(other.raw_buffer)[begin:end]
+        self.raw_offsets.frombytes(ends.tobytes())
+
+    def _raw_range(self, start, stop):
+        """行号在 [start, stop) 内的原始时间字符串在 raw_rows 中的位置区间，二分查找"""
+        return bisect_left(self.raw_rows, start), bisect_left(self.raw_rows, stop)
+
+    def _raw_text(self, position):
+        return self.raw_buffer[self.raw_offsets[position]:self.raw_offsets[position + 1]].decode('utf-8')
+
+    def raw_time(self, index):
+        """第 index 行的原始时间字符串，时间为标准格式时返回 None"""
+        position = bisect_left(self.raw_rows, index)
+        if position < len(self.raw_rows) and self.raw_rows[position] == index:
+            return self._raw_text(position)
+        return None
+
+    def time(self, index):
+        raw = self.raw_time(index) if self.raw_rows else None
+        if raw is not None:
+            return raw
+        return self.format_time(self.timestamps[index])
+
+    def author(self, index):
+        return self.authors[self.author_codes[index]]
+
+    def message(self, index):
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+
+    def format_line(self, index):
+        return f"[{self.time(index)}] {self.author(index)}: {self.message(index)}"
+
+    def iter_lines(self, start=0, stop=None):
+        """按 "[时间] 作者: 消息" 格式逐行生成聊天文本"""
+        if stop is None:
+            stop = len(self)
+        for i in range(start, stop):
+            yield self.format_line(i)
+
+    def fingerprint(self, stop=None):
+        """计算前 stop 条记录的内容摘要（SHA-256），用于判断聊天记录是否在原有内容之后追加"""
+        if stop is None:
+            stop = len(self)
+        digest = hashlib.sha256()
+        digest.update(memoryview(self.buffer)[:self.offsets[stop]])
+        digest.update(memoryview(self.offsets)[:stop + 1])
+        digest.update(memoryview(self.timestamps)[:stop])
+        digest.update(memoryview(self.author_codes)[:stop])
+        # 作者编码按首次出现顺序分配，相同前缀对应相同的编码表
+        used = max(self.author_codes[:stop], default=-1) + 1
+        digest.update("\x00".join(self.authors[:used]).encode('utf-8'))
+        for position in range(self._raw_range(0, stop)[1]):
+            digest.update(f"{self.raw_rows[position]}\x00{self._raw_text(position)}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def nbytes(self):
+        """估算容器占用的内存字节数"""
+        return (self.timestamps.itemsize * len(self.timestamps)
+                + self.author_codes.itemsize * len(self.author_codes)
+                + self.offsets.itemsize * len(self.offsets)
+                + len(self.buffer)
+                + self.raw_rows.itemsize * len(self.raw_rows)
+                + self.raw_offsets.itemsize * len(self.raw_offsets)
+                + len(self.raw_buffer)
+                + sum(len(author.encode('utf-8')) + 49 for author in self.authors))
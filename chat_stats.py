@@ -0,0 +1,105 @@
+"""聊天记录本地统计：用 pandas 向量化计算统计信息，以紧凑的统计摘要代替完整聊天记录发送"""
+
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from chat_log import ChatLog
+
+WEEKDAYS = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+LATIN_WORD = re.compile(r"[A-Za-z][A-Za-z0-9_\-]+")
+CJK_RUN = re.compile(r"[\u4e00-\u9fff]{2,}")
+# 含有这些常见虚词/代词的双字组合不作为关键词
+STOP_CHARS = set("的了是在我你他她它们这那和与就都也很要有个一不吗呢吧啊已经可能需什么没")
+
+
+def to_dataframe(chat_log):
+    """将 ChatLog 的列直接转换为 DataFrame（时间戳和作者编码零拷贝）"""
+    timestamps = np.frombuffer(chat_log.timestamps, dtype=np.int64)
+    codes = np.frombuffer(chat_log.author_codes, dtype=np.int32)
+    return pd.DataFrame({
+        "ts": timestamps,
+        "author": pd.Categorical.from_codes(codes, categories=chat_log.authors)
+    })
+
+
+def tokenize(message):
+    """关键词切分：中文按双字切分，英文按单词"""
+    tokens = [word.lower() for word in LATIN_WORD.findall(message)]
+    for run in CJK_RUN.findall(message):
+        tokens.extend(bigram for bigram in (run[i:i + 2] for i in range(len(run) - 1))
+                      if not STOP_CHARS.intersection(bigram))
+    return tokens
+
+
+def top_keywords(chat_log, limit=20):
+    # 先按消息内容计数，重复消息只切分一次
+    messages = pd.Series([chat_log.message(i) for i in range(len(chat_log))], dtype=object)
+    counter = Counter()
+    for message, count in messages.value_counts().items():
+        for token in set(tokenize(message)):
+            counter[token] += count
+    return counter.most_common(limit), int(messages.nunique())
+
+
+def compute_chat_stats(chat_log, keyword_limit=20):
+    """计算作者消息数、按小时/星期的活跃分布、回复间隔和高频关键词"""
+    df = to_dataframe(chat_log)
+    stats = {
+        "total_messages": len(df),
+        "author_counts": df["author"].value_counts().to_dict()
+    }
+
+    timed = df[df["ts"] != ChatLog.MISSING_TIME].sort_values("ts", kind="stable")
+    if len(timed):
+        seconds = timed["ts"].to_numpy()
+        days = seconds // 86400
+        stats["start_time"] = ChatLog.format_time(int(seconds[0]))
+        stats["end_time"] = ChatLog.format_time(int(seconds[-1]))
+        stats["active_days"] = int(pd.unique(days).size)
+        stats["hour_histogram"] = np.bincount((seconds % 86400) // 3600, minlength=24).tolist()
+        # 1970-01-01 为周四，换算为周一为 0
+        stats["weekday_histogram"] = np.bincount((days + 3) % 7, minlength=7).tolist()
+        busiest = pd.Series(days).value_counts().head(5)
+        stats["busiest_days"] = [(ChatLog.format_time(int(day) * 86400)[:10], int(count)) for day, count in busiest.items()]
+
+        # 回复间隔：按时间排序后相邻两条消息作者不同时的时间差
+        authors = timed["author"].cat.codes.to_numpy()
+        gaps = np.diff(seconds)[authors[1:] != authors[:-1]]
+        if gaps.size:
+            stats["reply_gap_minutes"] = {
+                "median": round(float(np.median(gaps)) / 60, 1),
+                "p90": round(float(np.percentile(gaps, 90)) / 60, 1),
+                "mean": round(float(gaps.mean()) / 60, 1)
+            }
+
+    stats["top_keywords"], stats["distinct_messages"] = top_keywords(chat_log, keyword_limit)
+    return stats
+
+
+def format_stats(stats):
+    """将统计结果格式化为紧凑的文本块"""
+    lines = [f"消息总数: {stats['total_messages']}，不同消息内容: {stats['distinct_messages']}"]
+    if "start_time" in stats:
+        lines.append(f"时间范围: {stats['start_time']} 至 {stats['end_time']}，活跃天数: {stats['active_days']}")
+    lines.append("各作者消息数: " + "，".join(f"{author} {count}" for author, count in stats["author_counts"].items()))
+    if "hour_histogram" in stats:
+        lines.append("按小时分布(0-23时): " + " ".join(str(count) for count in stats["hour_histogram"]))
+        lines.append("按星期分布: " + "，".join(f"{day} {count}" for day, count in zip(WEEKDAYS, stats["weekday_histogram"])))
+        lines.append("最活跃日期: " + "，".join(f"{day} {count}" for day, count in stats["busiest_days"]))
+    if "reply_gap_minutes" in stats:
+        gap = stats["reply_gap_minutes"]
+        lines.append(f"回复间隔(分钟): 中位数 {gap['median']}，P90 {gap['p90']}，平均 {gap['mean']}")
+    lines.append("高频关键词: " + "，".join(f"{word}({count})" for word, count in stats["top_keywords"]))
+    return "\n".join(lines)
+
+
+def sample_lines(chat_log, sample_size=200):
+    """按时间顺序等间隔抽样，保证样本覆盖整个时间跨度"""
+    total = len(chat_log)
+    if total <= sample_size:
+        return list(chat_log.iter_lines())
+    positions = np.linspace(0, total - 1, sample_size).astype(np.int64)
+    return [chat_log.format_line(int(i)) for i in np.unique(positions)]
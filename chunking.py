@@ -0,0 +1,110 @@
+"""聊天记录分块工具：按 token 预算切分聊天记录，供分块（map-reduce）分析使用"""
+
+import math
+import zlib
+
+from token_estimate import estimate_tokens
+
+
+def split_text(text, max_tokens):
+    """将超出预算的单条文本按字符硬切分"""
+    max_chars = max(1, int(max_tokens / 0.6))
+    return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+
+def is_boundary(line, line_tokens, target_tokens):
+    """内容定义的切分点：由行内容的哈希决定，与该行在全文中的位置无关
+
+    每行成为切分点的概率与其 token 数成正比，使切分点之间平均相隔约 target_tokens。
+    """
+    threshold = min(1.0, line_tokens / target_tokens) * 0xFFFFFFFF
+    return zlib.crc32(line.encode("utf-8")) < threshold
+
+
+def split_chat_lines(lines, max_tokens):
+    """将聊天记录行按 token 预算顺序打包成若干块，每块为一段文本
+
+    块边界由内容决定：达到预算的四分之一后，遇到内容哈希满足条件的行即切分，
+    最多不超过预算。聊天记录局部修改时，只有受影响的块会变化，其余块保持不变，
+    从而可以命中分块级别的缓存。
+    """
+    min_tokens, target_tokens = _chunk_thresholds(max_tokens)
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    for line in lines:
+        line_tokens = estimate_tokens(line)
+
+        # 单行就超出预算时，先结束当前块，再把该行硬切分
+        if line_tokens > max_tokens:
+            if current:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(split_text(line, max_tokens))
+            continue
+
+        if current and current_tokens + line_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+
+        current.append(line)
+        current_tokens += line_tokens
+
+        if current_tokens >= min_tokens and is_boundary(line, line_tokens, target_tokens):
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _chunk_thresholds(max_tokens):
+    """split_chat_lines 的最小块大小和切分点的平均间隔"""
+    return max_tokens // 4, max(1, max_tokens // 2)
+
+
+def expected_chunk_tokens(max_tokens):
+    """split_chat_lines 切出的块的平均 token 数（用于请求前预估）
+
+    达到最小块大小后，切分点按 token 数以平均间隔 target 出现（近似指数分布），
+    到预算上限时强制切分，因此平均块大小为 min + target * (1 - e^(-(max - min) / target))，约为预算的 0.64。
+    """
+    min_tokens, target_tokens = _chunk_thresholds(max_tokens)
+    return min_tokens + target_tokens * (1 - math.exp(-(max_tokens - min_tokens) / target_tokens))
+
+
+def merge_levels(count, fan_in):
+    """count 份部分摘要逐级合并时各层的合并调用数（不含最后的生成调用），与 group_summaries 按个数分组一致
+
+    例如 199 份摘要、每组 8 份时为 [25, 4]：合并为 25 份、再合并为 4 份后一次生成最终结果。
+    """
+    levels = []
+    while count > fan_in:
+        count = math.ceil(count / fan_in)
+        levels.append(count)
+    return levels
+
+
+def group_summaries(summaries, max_tokens, fan_in):
+    """将部分摘要分组，每组不超过 fan_in 个且总 token 数不超过预算
+
+    每组至少两个（最后只剩一个时除外），使每一级合并后摘要数至少减半；
+    两个摘要就超出预算的组由调用方截断后发送。
+    """
+    groups = []
+    current = []
+    current_tokens = 0
+
+    for summary in summaries:
+        tokens = estimate_tokens(summary)
+        if len(current) >= 2 and (len(current) >= fan_in or current_tokens + tokens > max_tokens):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(summary)
+        current_tokens += tokens
+
+    if current:
+        groups.append(current)
+    return groups
@@ -0,0 +1,172 @@
+"""重复消息压缩：将完全相同和近似重复的消息合并为带计数、作者和时间范围的条目"""
+
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from chat_log import ChatLog
+
+WHITESPACE = re.compile(r"\s+")
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+# 说明合并格式的首行，随压缩后的聊天记录一起发送
+HEADER = "（重复或相似的消息已合并，格式为：[最早..最晚日期] ×出现次数 作者: 消息；未重复的消息保持原格式）"
+
+MINHASH_PERMUTATIONS = 32
+LSH_BANDS = 8
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+class MessageGroup:
+    """一组重复消息：出现次数、作者、写法及最早/最晚时间"""
+
+    def __init__(self):
+        self.count = 0
+        self.first = None
+        self.earliest = None
+        self.latest = None
+        self.authors = Counter()
+        self.variants = Counter()
+
+    def add(self, index, author, text, timestamp):
+        self.count += 1
+        self.authors[author] += 1
+        self.variants[text] += 1
+        if self.first is None:
+            self.first = index
+        if timestamp != ChatLog.MISSING_TIME:
+            self.earliest = timestamp if self.earliest is None else min(self.earliest, timestamp)
+            self.latest = timestamp if self.latest is None else max(self.latest, timestamp)
+
+    def merge(self, other):
+        self.count += other.count
+        self.authors.update(other.authors)
+        self.variants.update(other.variants)
+        self.first = min(self.first, other.first)
+        for timestamp in (other.earliest, other.latest):
+            if timestamp is not None:
+                self.earliest = timestamp if self.earliest is None else min(self.earliest, timestamp)
+                self.latest = timestamp if self.latest is None else max(self.latest, timestamp)
+
+
+def normalize(message):
+    return WHITESPACE.sub(" ", message.strip())
+
+
+def template_key(message):
+    """模板键：数字替换为占位符，只有数字不同的消息视为同一模板"""
+    return NUMBER.sub("#", message)
+
+
+class MinHasher:
+    """基于字符 3-gram 的 MinHash 签名"""
+
+    def __init__(self, permutations=MINHASH_PERMUTATIONS, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, permutations, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, permutations, dtype=np.uint64)
+
+    def signature(self, text, n=3):
+        shingles = {text[i:i + n] for i in range(max(1, len(text) - n + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # 32 位哈希乘以不超过 61 位的系数可能溢出 uint64，这里允许回绕，仍是固定的置换函数
+        values = (hashes[:, None] * self.a[None, :] + self.b[None, :]) % np.uint64(MERSENNE_PRIME)
+        return values.min(axis=0)
+
+
+def find_near_duplicates(texts, threshold=0.6):
+    """用 MinHash + LSH 分桶查找近似重复的文本，返回 (i, j) 对"""
+    hasher = MinHasher()
+    signatures = [hasher.signature(text) for text in texts]
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+
+    candidates = set()
+    for band in range(LSH_BANDS):
+        buckets = {}
+        for i, signature in enumerate(signatures):
+            key = signature[band * rows:(band + 1) * rows].tobytes()
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            for j in members[1:]:
+                candidates.add((members[0], j))
+
+    return [(i, j) for i, j in candidates
+            if np.mean(signatures[i] == signatures[j]) >= threshold]
+
+
+def compress_chat_log(chat_log, near_duplicates=True, min_length=4):
+    """压缩聊天记录，返回按首次出现顺序排列的文本行（首行为格式说明）
+
+    先按规范化后的内容合并完全相同的消息，再按数字模板合并只有数字不同的消息，
+    最后用 MinHash 合并近似重复的消息。出现一次的消息保持 "[时间] 作者: 消息" 格式。
+    """
+    groups = {}
+    for i in range(len(chat_log)):
+        text = normalize(chat_log.message(i))
+        key = template_key(text)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = MessageGroup()
+        group.add(i, chat_log.author(i), text, chat_log.timestamps[i])
+
+    merged = list(groups.values())
+    if near_duplicates:
+        keys = [key for key in groups if len(key) >= min_length]
+        parent = {key: key for key in keys}
+
+        def find(key):
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for i, j in find_near_duplicates(keys):
+            root_i, root_j = find(keys[i]), find(keys[j])
+            if root_i != root_j:
+                parent[root_j] = root_i
+
+        clusters = {}
+        for key in keys:
+            clusters.setdefault(find(key), []).append(groups[key])
+        merged = [group for key, group in groups.items() if len(key) < min_length]
+        for members in clusters.values():
+            members.sort(key=lambda group: -group.count)
+            for other in members[1:]:
+                members[0].merge(other)
+            merged.append(members[0])
+
+    merged.sort(key=lambda group: group.first)
+    lines = [HEADER]
+    for group in merged:
+        if group.count == 1:
+            lines.append(chat_log.format_line(group.first))
+        else:
+            lines.append(format_group(chat_log, group))
+    return lines
+
+
+def format_time_range(earliest, latest):
+    """紧凑的时间范围，如 03-01..03-20；同一天时显示到分钟"""
+    if earliest is None:
+        return "时间未知"
+    first, last = ChatLog.format_time(earliest), ChatLog.format_time(latest)
+    if first[:10] == last[:10]:
+        return f"{first[5:16]}..{last[11:16]}" if first != last else first[5:16]
+    if first[:4] != last[:4]:
+        return f"{first[:10]}..{last[:10]}"
+    return f"{first[5:10]}..{last[5:10]}"
+
+
+def format_group(chat_log, group, max_authors=3):
+    authors = [author for author, _ in group.authors.most_common(max_authors)]
+    author_text = "/".join(authors)
+    if len(group.authors) > max_authors:
+        author_text += f"等{len(group.authors)}人"
+
+    time_text = format_time_range(group.earliest, group.latest)
+
+    text = group.variants.most_common(1)[0][0]
+    if len(group.variants) > 1:
+        text += f"（含 {len(group.variants)} 种相似写法）"
+    return f"[{time_text}] ×{group.count} {author_text}: {text}"
@@ -0,0 +1,582 @@
+"""DeepSeek 分析器：封装对话请求、分块分析、并发调度与响应缓存，不依赖图形界面
+
+请求失败时抛出 resilience.AnalysisError 的子类，临时错误会自动退避重试；在可取消的任务中
+（见 cancellation）任务取消后抛出 resilience.CancelledError，进行中的请求随之中断。
+每次请求的耗时、首字延迟、输出速率和 token 用量记录在 metrics.METRICS 中。
+"""
+
+import time
+
+from openai import OpenAI
+
+from chunking import split_chat_lines, group_summaries, split_text
+from dispatch import RequestDispatcher, AdaptiveConcurrency
+from http_pool import get_shared_client, DEFAULT_POOL_SIZE, DEFAULT_KEEPALIVE_EXPIRY
+from metrics import METRICS
+from progress import ProgressTracker, STAGE_EXTRACT, STAGE_MERGE, STAGE_GENERATE, STAGE_WINDOWS
+from resilience import RetryPolicy, CircuitBreaker, call_with_retry, check_cancelled
+from response_cache import ResponseCache
+from token_estimate import (estimate_tokens, estimate_log_tokens, estimate_request, within_budget,
+                            describe_estimate, model_profile)
+
+
+class FeedbackSession:
+    """反馈会话：以首次分析的最终请求（系统提示词和聊天记录内容）为固定前缀，之后每轮改进
+    只在末尾追加上一轮的结果和新的反馈
+
+    每轮请求的前缀与上一轮逐字节相同，可命中 DeepSeek 的上下文硬盘缓存，
+    缓存命中的输入 token 计费更低、首字延迟更短；模型也能在改进时参考原始聊天记录。
+    """
+
+    FEEDBACK_TEMPLATE = "用户反馈：\n\n{feedback}\n\n请根据反馈改进上面的分析结果，输出改进后的完整分析结果。"
+
+    def __init__(self):
+        self.messages = []
+
+    @property
+    def started(self):
+        return bool(self.messages)
+
+    def start(self, messages, result):
+        self.messages = list(messages) + [{"role": "assistant", "content": result}]
+
+    def request(self, feedback):
+        """本轮改进要发送的消息：会话中已有的全部消息加上新的反馈"""
+        return self.messages + [{"role": "user", "content": self.FEEDBACK_TEMPLATE.format(feedback=feedback)}]
+
+    def append(self, request, result):
+        """本轮改进成功后记录请求和结果，作为下一轮的前缀"""
+        self.messages = list(request) + [{"role": "assistant", "content": result}]
+
+
+class DeepseekAnalyzer:
+    # 单次调用可直接发送的聊天记录 token 上限，超过后自动改用分块分析
+    SINGLE_CALL_TOKEN_LIMIT = 48000
+    # 分块分析时每块聊天记录的 token 预算
+    CHUNK_TOKEN_BUDGET = 24000
+    # 合并阶段每次最多合并的部分摘要数
+    REDUCE_FAN_IN = 8
+    # 统计摘要模式下随统计信息一起发送的抽样消息条数
+    STATS_SAMPLE_SIZE = 200
+    # 聚焦分析时每条命中消息前后附带的上下文消息条数
+    FOCUS_CONTEXT = 2
+    DEFAULT_BASE_URL = "https://api.deepseek.com"
+
+    def __init__(self, api_key, model="deepseek-chat", max_concurrency=4, rpm_limit=None, tpm_limit=None, cache=None,
+                 budget=None, model_profiles=None, request_timeout=120.0, max_retries=3, circuit_threshold=5,
+                 circuit_reset_seconds=30.0, adaptive_concurrency=True, base_url=None, http_pool_size=None, http2=False,
+                 keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY):
+        self.api_key = api_key
+        self.model = model
+        # 重试由 retry_policy 统一处理，关闭 SDK 自带的重试
+        # base_url 可指向其他 OpenAI 兼容服务，如本地模拟服务（mock_server.py）
+        self.base_url = base_url or self.DEFAULT_BASE_URL
+        # 相同连接参数的分析器共用一个连接池，重新创建分析器时复用已建立的连接
+        self.http = get_shared_client(http_pool_size or max(DEFAULT_POOL_SIZE, max_concurrency), http2,
+                                      keepalive_expiry)
+        self.client = OpenAI(api_key=api_key, base_url=self.base_url, timeout=request_timeout, max_retries=0,
+                             http_client=self.http.client)
+        self.dispatcher = RequestDispatcher(max_concurrency, rpm_limit, tpm_limit)
+        self.retry_policy = RetryPolicy(max_attempts=max_retries + 1)
+        self.breaker = CircuitBreaker(circuit_threshold, circuit_reset_seconds)
+        # 被限流（429）时并发数减半，之后随成功请求逐步恢复
+        self.concurrency = AdaptiveConcurrency(max_concurrency) if adaptive_concurrency else None
+        self.cache = cache
+        # 预算：max_input_tokens / max_seconds / max_cost，超出时自动改用更省的分析方式
+        self.budget = budget or {}
+        self.model_profiles = model_profiles
+    
+    def set_model(self, model):
+        self.model = model
+    
+    def warm_up(self):
+        """在后台提前建立到 API 服务的连接，启动后的第一次分析无需等待握手"""
+        return self.http.warm_up(self.base_url)
+    
+    def pool_stats(self):
+        """连接池统计：请求数、新建/复用的连接数和各 HTTP 版本的响应数"""
+        return self.http.stats.snapshot()
+    
+    def _request(self, func, can_retry=None):
+        """经熔断器和自适应并发限制执行一次请求，临时错误按退避策略重试"""
+        return call_with_retry(func, self.retry_policy, self.breaker, self.concurrency, can_retry)
+    
+    def _complete(self, messages, on_delta=None, progress=None):
+        """发送一次对话请求；提供 on_delta 时以流式方式请求，并将增量文本逐段回调。
+        完成后在 progress 中计入一个工作单元及输入、输出的 token 数
+        """
+        progress = progress or ProgressTracker()
+        # 相同模型和消息的请求直接返回缓存结果
+        if self.cache:
+            key = self.cache.make_key(self.model, messages)
+            cached = self.cache.get(key)
+            if cached is not None:
+                METRICS.increment("response_cache_hits_total", model=self.model)
+                if on_delta:
+                    on_delta(cached)
+                progress.advance(1)
+                return cached
+        
+        input_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        started = time.perf_counter()
+        if on_delta:
+            progress.begin_stream(model_profile(self.model, self.model_profiles)["output_tokens"])
+            
+            emitted = []
+            
+            def forward(delta):
+                if not emitted:
+                    emitted.append(time.perf_counter())
+                progress.stream_output(estimate_tokens(delta))
+                on_delta(delta)
+            
+            # 已输出部分内容后不再重试，避免重复输出
+            try:
+                content, usage = self._request(lambda: self._complete_stream(messages, forward), lambda: not emitted)
+            finally:
+                progress.end_stream()
+            # 输出 token 已在流式输出时计入
+            counts = self.usage_counts(usage, input_tokens, estimate_tokens(content or ""))
+            progress.advance(1, input_tokens=counts["input_tokens"], cached_tokens=counts["cached_tokens"])
+            self._record_usage(counts, started, emitted[0] if emitted else None)
+        else:
+            response = self._request(lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                stream=False
+            ))
+            content = response.choices[0].message.content
+            counts = self.usage_counts(response.usage, input_tokens, estimate_tokens(content or ""))
+            progress.advance(1, **counts)
+            self._record_usage(counts, started)
+        
+        if self.cache and content:
+            self.cache.put(key, content)
+        return content
+    
+    def _record_usage(self, counts, started, first_token=None):
+        """记录一次请求的耗时、首字延迟（仅流式）、输出速率和 token 用量"""
+        finished = time.perf_counter()
+        METRICS.observe("api_request_seconds", finished - started, model=self.model)
+        if first_token is not None:
+            METRICS.observe("api_first_token_seconds", first_token - started, model=self.model)
+        # 流式请求按首字之后的生成时间计算速率，非流式请求按整个请求计算
+        generating = finished - (first_token if first_token is not None else started)
+        if counts["output_tokens"] and generating > 0:
+            METRICS.observe("api_tokens_per_second", counts["output_tokens"] / generating, model=self.model)
+        METRICS.increment("api_requests_total", model=self.model)
+        for name in ("input_tokens", "cached_tokens", "output_tokens"):
+            METRICS.increment(f"api_{name}_total", counts[name], model=self.model)
+    
+    def _complete_stream(self, messages, on_delta):
+        """流式请求，返回 (完整内容, usage)；usage 在最后一个分片中返回，服务端不支持时为 None"""
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        
+        parts = []
+        usage = None
+        for chunk in stream:
+            # 连接未能中断时（如 HTTP/2）在分片之间检查是否已取消
+            check_cancelled()
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                on_delta(delta)
+        # 取消时中断连接，流式响应会提前结束，不能作为完整结果返回
+        check_cancelled()
+        return "".join(parts), usage
+    
+    @staticmethod
+    def usage_counts(usage, input_tokens=0, output_tokens=0):
+        """从响应的 usage 中读取输入、命中上下文缓存的输入和输出 token 数，缺失的项使用本地估算值
+        
+        DeepSeek 以 prompt_cache_hit_tokens 返回缓存命中数，OpenAI 兼容接口使用
+        prompt_tokens_details.cached_tokens。
+        """
+        if usage is None:
+            return {"input_tokens": input_tokens, "cached_tokens": 0, "output_tokens": output_tokens}
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)
+        if cached is None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = getattr(details, "cached_tokens", None) if details else None
+        return {
+            "input_tokens": usage.prompt_tokens or input_tokens,
+            "cached_tokens": cached or 0,
+            "output_tokens": usage.completion_tokens or output_tokens
+        }
+    
+    def complete_many(self, messages_list, progress=None):
+        """并发发送多个请求，受并发上限和限流约束，结果按输入顺序返回"""
+        return self.dispatcher.map(
+            lambda messages: self._complete(messages, progress=progress),
+            messages_list,
+            cost=lambda messages: sum(estimate_tokens(m["content"]) for m in messages)
+        )
+    
+    def _generate(self, messages, on_delta=None, progress=None, session=None):
+        """生成最终结果；提供 session 时以本次请求和结果作为反馈会话的固定前缀"""
+        result = self._complete(messages, on_delta, progress)
+        if session is not None:
+            session.start(messages, result)
+        return result
+    
+    def analyze_chat(self, chat_data, system_prompt=None, on_delta=None, progress=None, session=None):
+        progress = progress or ProgressTracker()
+        if not system_prompt:
+            system_prompt = "你是一个专业的聊天记录分析助手。请分析以下聊天记录，提取关键信息，并生成简洁的摘要。"
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"请分析以下聊天记录并提取关键信息：\n\n{chat_data}"}
+        ]
+        
+        progress.set_stage(STAGE_GENERATE, 1)
+        return self._generate(messages, on_delta, progress, session)
+    
+    def needs_chunking(self, chat_lines):
+        """判断聊天记录是否超出单次调用的 token 上限"""
+        total = 0
+        for line in chat_lines:
+            total += estimate_tokens(line)
+            if total > self.SINGLE_CALL_TOKEN_LIMIT:
+                return True
+        return False
+    
+    @staticmethod
+    def build_lines(chat_log, compress=False):
+        """构建发送给模型的聊天记录行，compress 时合并重复和近似重复的消息"""
+        if compress:
+            from compression import compress_chat_log
+            return compress_chat_log(chat_log)
+        return list(chat_log.iter_lines())
+    
+    def build_stats(self, chat_log):
+        """计算统计摘要并抽样消息，返回 (统计文本, 抽样行)"""
+        # 按需导入，避免未使用统计模式时加载 pandas
+        from chat_stats import compute_chat_stats, format_stats, sample_lines
+        return format_stats(compute_chat_stats(chat_log)), sample_lines(chat_log, self.STATS_SAMPLE_SIZE)
+    
+    def build_focused_lines(self, chat_log, rows, context=None):
+        """聚焦分析发送的聊天记录行：命中的消息及其上下文，按相关度截断到单次调用上限以内"""
+        from search_index import focused_lines
+        return focused_lines(chat_log, rows, self.FOCUS_CONTEXT if context is None else context,
+                             self.SINGLE_CALL_TOKEN_LIMIT, estimate_tokens)
+    
+    def estimate(self, input_tokens, mode="auto", model=None):
+        """估算指定输入规模在某个模型下的调用次数、耗时和费用"""
+        single_limit = float("inf") if mode == "single" else self.SINGLE_CALL_TOKEN_LIMIT
+        if mode == "chunked":
+            single_limit = 0
+        return estimate_request(model or self.model, input_tokens, single_limit, self.CHUNK_TOKEN_BUDGET,
+                                self.dispatcher.max_concurrency, self.model_profiles, self.REDUCE_FAN_IN)
+    
+    def plan(self, chat_log, mode="auto", compress=False, model=None, measured=None):
+        """请求前预估：按所选方式估算 token、耗时和费用，超出预算时依次尝试
+        压缩重复消息、分块并发（单次分析时）和统计摘要+抽样，选用第一个满足预算的方式
+
+        measured 为可选的字典，在多个模型下预估同一份聊天记录时共用，
+        与模型无关的压缩、统计摘要和 token 计数只计算一次。
+        """
+        measured = {} if measured is None else measured
+        
+        def measure(mode, compress):
+            """(token 数, 压缩后的行, 统计摘要)"""
+            key = "stats" if mode == "stats" else ("compressed" if compress else "plain")
+            if key not in measured:
+                if key == "stats":
+                    stats = self.build_stats(chat_log)
+                    stats_text, samples = stats
+                    tokens = estimate_tokens(stats_text) + sum(estimate_tokens(line) for line in samples)
+                    measured[key] = (tokens, None, stats)
+                elif key == "compressed":
+                    lines = self.build_lines(chat_log, True)
+                    measured[key] = (sum(estimate_tokens(line) for line in lines), lines, None)
+                else:
+                    measured[key] = (estimate_log_tokens(chat_log), None, None)
+            return measured[key]
+        
+        def evaluate(mode, compress):
+            tokens, lines, stats = measure(mode, compress)
+            candidate = {"mode": mode, "compress": compress, "lines": lines, "stats": stats}
+            candidate["estimate"] = self.estimate(tokens, mode, model)
+            return candidate
+        
+        plan = evaluate(mode, compress)
+        if not self.budget or not self.budget.get("auto_adjust", True) or within_budget(plan["estimate"], self.budget):
+            return plan
+        
+        alternatives = []
+        if mode != "stats" and not compress:
+            alternatives.append((mode, True))
+        if mode == "single":
+            alternatives.append(("chunked", True))
+        if mode != "stats":
+            alternatives.append(("stats", False))
+        
+        cheapest = plan
+        for alt_mode, alt_compress in alternatives:
+            candidate = evaluate(alt_mode, alt_compress)
+            candidate["adjusted"] = True
+            if within_budget(candidate["estimate"], self.budget):
+                return candidate
+            if candidate["estimate"]["cost"] < cheapest["estimate"]["cost"]:
+                cheapest = candidate
+        
+        # 所有方式都超出预算时使用费用最低的方式，并标记超出预算
+        cheapest["over_budget"] = True
+        return cheapest
+    
+    def describe_plan(self, plan):
+        """将预估结果格式化为一行说明，自动调整了分析方式时一并说明"""
+        text = describe_estimate(plan["estimate"])
+        if plan.get("adjusted"):
+            names = {"single": "单次分析", "chunked": "分块分析", "stats": "统计摘要+抽样"}
+            method = "+".join(filter(None, [names.get(plan["mode"]), "压缩重复消息" if plan["compress"] else None]))
+            text = f"超出预算，已改用{method}；{text}"
+        if plan.get("over_budget"):
+            text += "（仍超出预算）"
+        return text
+    
+    def analyze_log(self, chat_log, system_prompt=None, mode="auto", on_delta=None, compress=False, on_plan=None,
+                    progress=None, session=None):
+        """分析 ChatLog：先做请求前预估（on_plan 回调预估结果），stats 模式发送本地统计摘要和抽样消息，
+        其余模式发送聊天记录行；各阶段进度报告给 progress，最终请求记录到反馈会话 session
+        """
+        progress = progress or ProgressTracker()
+        with METRICS.timer("stage_seconds", stage="plan"):
+            plan = self.plan(chat_log, mode, compress)
+        progress.estimated_seconds = plan["estimate"]["seconds"]
+        if on_plan:
+            on_plan(plan)
+        
+        if plan["mode"] == "stats":
+            stats_text, samples = plan["stats"]
+            return self.analyze_stats(stats_text, samples, system_prompt, on_delta, progress, session)
+        
+        with METRICS.timer("stage_seconds", stage="build_prompt"):
+            lines = plan["lines"] if plan["lines"] is not None else self.build_lines(chat_log, plan["compress"])
+        return self.analyze_lines(lines, system_prompt, plan["mode"], on_delta, progress, session)
+    
+    def analyze_stats(self, stats_text, sample_lines, system_prompt=None, on_delta=None, progress=None,
+                      session=None):
+        """根据本地统计摘要和抽样消息进行分析，无需发送完整聊天记录"""
+        progress = progress or ProgressTracker()
+        if not system_prompt:
+            system_prompt = "你是一个专业的聊天记录分析助手。请分析以下聊天记录，提取关键信息，并生成简洁的摘要。"
+        
+        sample_text = "\n".join(sample_lines)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"以下是对一份聊天记录在本地计算的统计信息（数据准确，可直接引用）：\n\n{stats_text}\n\n以下是按时间顺序等间隔抽取的 {len(sample_lines)} 条消息样本：\n\n{sample_text}\n\n请结合统计信息和消息样本分析这份聊天记录并提取关键信息。"}
+        ]
+        progress.set_stage(STAGE_GENERATE, 1)
+        return self._generate(messages, on_delta, progress, session)
+    
+    def analyze_lines(self, chat_lines, system_prompt=None, mode="auto", on_delta=None, progress=None, session=None):
+        """按分析模式分析聊天记录行：auto 时超出单次调用上限的聊天记录改用分块分析"""
+        if mode == "auto":
+            chunked = self.needs_chunking(chat_lines)
+        else:
+            chunked = mode == "chunked"
+        
+        if chunked:
+            return self.analyze_chat_chunked(chat_lines, system_prompt, on_delta, progress, session)
+        chat_text = "\n".join(chat_lines) + "\n"
+        return self.analyze_chat(chat_text, system_prompt, on_delta, progress, session)
+    
+    def analyze_chat_chunked(self, chat_lines, system_prompt=None, on_delta=None, progress=None, session=None):
+        """分块分析：先逐块提取要点，再逐级合并为最终结果（仅最终合并阶段流式输出）"""
+        progress = progress or ProgressTracker()
+        chunks = split_chat_lines(chat_lines, self.CHUNK_TOKEN_BUDGET)
+        if len(chunks) <= 1:
+            return self.analyze_chat("\n".join(chunks), system_prompt, on_delta, progress, session)
+        
+        # 各块提取加最终合并各计一个单元，中间层合并在发生时再计入
+        progress.set_stage(STAGE_EXTRACT, len(chunks) + 1)
+        partials = self._extract_chunks(chunks, progress)
+        return self._reduce_summaries(partials, system_prompt, on_delta, progress, session)
+    
+    def analyze_incremental(self, previous_summary, chat_lines, system_prompt=None, on_delta=None, progress=None,
+                            session=None):
+        """增量分析：只发送上次分析之后新增的消息，与上次的分析结果合并为更新后的结果"""
+        progress = progress or ProgressTracker()
+        if not system_prompt:
+            system_prompt = "你是一个专业的聊天记录分析助手。请分析以下聊天记录，提取关键信息，并生成简洁的摘要。"
+        
+        # 新增内容本身超出上限时，先分块提取要点再合并
+        if self.needs_chunking(chat_lines):
+            chunks = split_chat_lines(chat_lines, self.CHUNK_TOKEN_BUDGET)
+            progress.set_stage(STAGE_EXTRACT, len(chunks) + 1)
+            summaries = self._merge_until_fits(self._extract_chunks(chunks, progress), progress)
+            new_content = f"以下是此后新增聊天记录按时间顺序分段提取的要点：\n\n{self._join_summaries(summaries)}"
+            progress.set_stage(STAGE_GENERATE)
+        else:
+            new_content = "以下是此后新增的聊天记录：\n\n" + "\n".join(chat_lines)
+            progress.set_stage(STAGE_GENERATE, 1)
+        
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"以下是此前对该聊天记录的分析结果：\n\n{previous_summary}\n\n{new_content}\n\n请结合此前的分析结果和新增内容，输出更新后的完整分析结果。"}
+        ]
+        return self._generate(messages, on_delta, progress, session)
+    
+    def analyze_focused(self, chat_log, query, rows, system_prompt=None, on_delta=None, progress=None, session=None,
+                        context=None):
+        """聚焦分析：只发送检索命中的消息（rows，按相关度排列）及其上下文，
+        超出单次调用上限时按相关度截断，不再分块
+        """
+        if not system_prompt:
+            system_prompt = "你是一个专业的聊天记录分析助手。请分析以下聊天记录，提取关键信息，并生成简洁的摘要。"
+        system_prompt += f"\n\n以下聊天记录是按主题“{query}”检索出的相关消息及其上下文，请只围绕该主题进行分析。"
+        
+        lines = self.build_focused_lines(chat_log, rows, context)
+        return self.analyze_chat("\n".join(lines) + "\n", system_prompt, on_delta, progress, session)
+    
+    def analyze_windows(self, windows, system_prompt=None, compress=False, on_window=None, progress=None):
+        """按时间窗口分析（见 timeline.TimeIndex.windows），返回与 windows 一一对应的分析结果
+        
+        各窗口并发请求，每完成一个窗口即回调 on_window(序号, 结果)；超出单次调用上限的窗口
+        在其余窗口完成后再按分块方式分析。
+        """
+        progress = progress or ProgressTracker()
+        if not system_prompt:
+            system_prompt = "你是一个专业的聊天记录分析助手。请分析以下时间段内的聊天记录，概括该时段的主要话题、进展、结论和待办事项。"
+        
+        results = [None] * len(windows)
+        single, chunked = [], []
+        for index, window in enumerate(windows):
+            lines = self.build_lines(window.chat_log, compress)
+            (chunked if self.needs_chunking(lines) else single).append((index, lines))
+        
+        def analyze_one(item):
+            index, lines = item
+            chat_text = "\n".join(lines)
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"以下是 {windows[index].label} 的聊天记录：\n\n{chat_text}"}
+            ]
+            results[index] = self._complete(messages, progress=progress)
+            if on_window:
+                on_window(index, results[index])
+        
+        progress.set_stage(STAGE_WINDOWS, len(single))
+        self.dispatcher.map(analyze_one, single, cost=lambda item: sum(estimate_tokens(line) for line in item[1]))
+        for index, lines in chunked:
+            results[index] = self.analyze_chat_chunked(lines, system_prompt, progress=progress)
+            if on_window:
+                on_window(index, results[index])
+        return results
+    
+    def _extract_chunks(self, chunks, progress=None):
+        """map 阶段：并发提取各块要点"""
+        return self.complete_many([
+            [
+                {"role": "system", "content": "你是一个专业的聊天记录分析助手。请提取以下聊天记录片段中的关键信息，保留人物、时间、事件和数量等细节，便于后续与其他片段合并。"},
+                {"role": "user", "content": f"以下是聊天记录的第 {i + 1}/{len(chunks)} 部分：\n\n{chunk}"}
+            ]
+            for i, chunk in enumerate(chunks)
+        ], progress)
+    
+    def _reduce_summaries(self, summaries, system_prompt=None, on_delta=None, progress=None, session=None):
+        """reduce 阶段：部分摘要过多时分组逐级合并，最后按系统提示词生成最终结果"""
+        if not system_prompt:
+            system_prompt = "你是一个专业的聊天记录分析助手。请分析以下聊天记录，提取关键信息，并生成简洁的摘要。"
+        
+        progress = progress or ProgressTracker()
+        summaries = self._merge_until_fits(summaries, progress)
+        progress.set_stage(STAGE_GENERATE)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"以下是按时间顺序对一份较长聊天记录分段提取的要点，请据此完成对整份聊天记录的分析：\n\n{self._join_summaries(summaries)}"}
+        ]
+        return self._generate(messages, on_delta, progress, session)
+    
+    def _merge_until_fits(self, summaries, progress=None):
+        """部分摘要超出单次调用上限时分组逐级合并，直到可在一次调用中发送；每组至少两份，每一级摘要数至少减半"""
+        progress = progress or ProgressTracker()
+        while True:
+            groups = group_summaries(summaries, self.SINGLE_CALL_TOKEN_LIMIT, self.REDUCE_FAN_IN)
+            if len(groups) == 1:
+                break
+            
+            progress.set_stage(STAGE_MERGE, len(groups))
+            # 中间层并发合并，保留细节供上层继续合并
+            summaries = self.complete_many([
+                [
+                    {"role": "system", "content": "你是一个专业的聊天记录分析助手。请将以下多份聊天记录片段摘要合并为一份，去除重复内容，保留关键细节。"},
+                    {"role": "user", "content": self._join_summaries(self._fit_summaries(group))}
+                ]
+                for group in groups
+            ], progress)
+        
+        return self._fit_summaries(groups[0])
+    
+    def _fit_summaries(self, summaries):
+        """一组部分摘要超出单次调用上限时，将超出平均份额的摘要截断，使整组可在一次调用中发送"""
+        if sum(estimate_tokens(summary) for summary in summaries) <= self.SINGLE_CALL_TOKEN_LIMIT:
+            return summaries
+        # estimate_tokens 对每段文本多计 1 个 token
+        share = self.SINGLE_CALL_TOKEN_LIMIT // len(summaries) - 1
+        return [split_text(summary, share)[0] if estimate_tokens(summary) > share else summary
+                for summary in summaries]
+    
+    def _join_summaries(self, summaries):
+        return "\n\n".join(f"【第 {i + 1} 部分】\n{summary}" for i, summary in enumerate(summaries))
+    
+    def improve_analysis(self, original_analysis, feedback, on_delta=None, progress=None, session=None):
+        """根据反馈改进分析结果；session 已开始时在反馈会话中追加一轮，否则只发送原分析结果和反馈"""
+        progress = progress or ProgressTracker()
+        if session is not None and session.started:
+            messages = session.request(feedback)
+            progress.set_stage(STAGE_GENERATE, 1)
+            result = self._complete(messages, on_delta, progress)
+            session.append(messages, result)
+            return result
+        
+        messages = [
+            {"role": "system", "content": "你是一个专业的聊天记录分析助手。请根据用户的反馈改进你的分析。"},
+            {"role": "user", "content": f"原始分析：\n\n{original_analysis}\n\n用户反馈：\n\n{feedback}\n\n请根据反馈改进分析结果。"}
+        ]
+        
+        progress.set_stage(STAGE_GENERATE, 1)
+        return self._complete(messages, on_delta, progress)
+
+
+def create_analyzer(api_key, model, config, cache_dir):
+    """根据配置创建分析器，并发、限流和缓存参数可在配置文件中设置"""
+    cache = None
+    if config.get("cache_enabled", True):
+        cache = ResponseCache(
+            cache_dir,
+            max_memory_entries=config.get("cache_memory_entries", 256),
+            max_disk_bytes=config.get("cache_max_mb", 200) * 1024 * 1024,
+            max_age_seconds=config.get("cache_max_age_days", 30) * 24 * 3600
+        )
+    
+    return DeepseekAnalyzer(
+        api_key,
+        model,
+        max_concurrency=config.get("max_concurrency", 4),
+        rpm_limit=config.get("rpm_limit"),
+        tpm_limit=config.get("tpm_limit"),
+        cache=cache,
+        budget=config.get("budget"),
+        model_profiles=config.get("model_profiles"),
+        request_timeout=config.get("request_timeout", 120),
+        max_retries=config.get("max_retries", 3),
+        circuit_threshold=config.get("circuit_threshold", 5),
+        circuit_reset_seconds=config.get("circuit_reset_seconds", 30),
+        adaptive_concurrency=config.get("adaptive_concurrency", True),
+        base_url=config.get("base_url"),
+        http_pool_size=config.get("http_pool_size"),
+        http2=config.get("http2", False),
+        keepalive_expiry=config.get("keepalive_expiry", DEFAULT_KEEPALIVE_EXPIRY)
+    )
@@ -0,0 +1,122 @@
+"""并发请求调度：限制并发数（可按限流情况自适应调整），并按每分钟请求数/token 数进行令牌桶限流
+
+等待名额或令牌时当前任务被取消（见 cancellation）会抛出 resilience.CancelledError。
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cancellation import current_token
+from resilience import check_cancelled
+
+# 等待并发名额时检查任务是否已取消的间隔（秒）
+CANCEL_POLL_INTERVAL = 0.2
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟配额，按秒匀速补充"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """阻塞直到取得 amount 个令牌（超过容量的请求按容量计）"""
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            token = current_token()
+            if token is None:
+                time.sleep(wait)
+            elif token.wait(wait):
+                check_cancelled()
+
+
+class RateLimiter:
+    """同时限制每分钟请求数（RPM）和每分钟 token 数（TPM），为 None 时不限制"""
+
+    def __init__(self, rpm_limit=None, tpm_limit=None):
+        self.requests = TokenBucket(rpm_limit) if rpm_limit else None
+        self.tokens = TokenBucket(tpm_limit) if tpm_limit else None
+
+    def acquire(self, tokens=0):
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens and tokens:
+            self.tokens.acquire(tokens)
+
+
+class AdaptiveConcurrency:
+    """AIMD 自适应并发限制：每次成功将上限提高 1/limit（约每轮加 1），
+    被限流时减半，上限在 [minimum, maximum] 之间
+    """
+
+    def __init__(self, maximum, minimum=1):
+        self.maximum = max(1, int(maximum))
+        self.minimum = max(1, min(int(minimum), self.maximum))
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        token = current_token()
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                if token is None:
+                    self.condition.wait()
+                else:
+                    self.condition.wait(CANCEL_POLL_INTERVAL)
+                    check_cancelled()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(float(self.minimum), self.limit / 2)
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class RequestDispatcher:
+    """用线程池并发执行多个请求，结果按提交顺序返回"""
+
+    def __init__(self, max_concurrency=4, rpm_limit=None, tpm_limit=None):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.limiter = RateLimiter(rpm_limit, tpm_limit)
+
+    def map(self, func, items, cost=None):
+        """对每个 item 调用 func，cost(item) 返回该请求预计消耗的 token 数
+
+        各请求在调用线程的上下文副本中执行，调用线程所属任务的取消令牌在并发线程中同样生效；
+        任务取消后尚未开始的请求不再发送。
+        """
+        items = list(items)
+
+        def run(item):
+            check_cancelled()
+            self.limiter.acquire(cost(item) if cost else 0)
+            return func(item)
+
+        if len(items) <= 1 or self.max_concurrency == 1:
+            return [run(item) for item in items]
+
+        contexts = [contextvars.copy_context() for _ in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(items))) as executor:
+            return list(executor.map(lambda context, item: context.run(run, item), contexts, items))
@@ -1,64 +1,199 @@
+"""生成示例聊天数据：按批向量化生成并逐批写入 CSV，内存占用与总条数无关
+
+指定 --start 时，相同的参数和随机种子总是生成相同的文件（与进程数无关），可用于压测和回归测试。
+
+用法示例：
+    python generate_sample_data.py -n 1000
+    python generate_sample_data.py -n 10000000 -o big.csv --authors 200 --days 365 --workers 4
+"""
+
+import argparse
 import csv
-import random
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+AUTHORS = ["张三", "李四", "王五", "赵六", "钱七"]
+
+# 各话题的常用消息，重复消息从中抽取；{n}、{p}、{feature} 按行随机填充
+TOPIC_MESSAGES = {
+    "项目进度": [
+        "我们的项目进度如何？",
+        "模块{n}已经完成了{p}%",
+        "我们需要加快进度，截止日期快到了",
+        "今天的任务已经完成",
+        "我们可能需要延期交付"
+    ],
+    "技术问题": [
+        "我在实现{feature}功能时遇到了问题",
+        "这个bug很难修复，我需要帮助",
+        "我找到了一个更好的解决方案",
+        "我们应该使用哪个框架？",
+        "代码质量需要提高"
+    ],
+    "团队协作": [
+        "我们需要更好的沟通",
+        "下周二开会讨论项目进展",
+        "请大家及时更新任务状态",
+        "我需要前端团队的支持",
+        "谁能帮我review一下代码？"
+    ],
+    "客户反馈": [
+        "客户对新功能很满意",
+        "客户报告了一个严重的bug",
+        "客户希望增加一个新特性",
+        "我们需要改进用户体验",
+        "客户投诉系统响应太慢"
+    ],
+    "产品设计": [
+        "新的UI设计稿已经完成",
+        "我们需要重新考虑产品定位",
+        "用户调研结果显示我们需要简化流程",
+        "竞品分析报告已经发到邮箱",
+        "产品路线图需要更新"
+    ]
+}
+TEMPLATES = [message for messages in TOPIC_MESSAGES.values() for message in messages]
+FEATURES = ['登录', '注册', '支付', '数据分析', '报表']
+
+# 非重复消息由以下词语随机组合而成
+WORDS = ("项目 进度 问题 客户 需求 功能 测试 上线 版本 接口 数据 文档 设计 方案 会议 评审 计划 风险 "
+         "优化 性能 服务 部署 反馈 体验 流程 团队 沟通 支持 确认 安排 调整 处理 完成 开始 继续 今天 "
+         "明天 下午 周末 尽快 已经 还是 可以 需要 我们 大家 这个 那个 应该 觉得 看看 一下 没有 问题 "
+         "好的 收到 谢谢 辛苦 稍等 马上 同步 更新 提交 合并 回滚 修复 排查 日志 监控 告警").split()
+
+# 每批默认行数
+BATCH_SIZE = 100000
+
+
+class GeneratorOptions:
+    """生成参数：条数、作者数、时间范围、重复消息比例和消息长度分布"""
+
+    def __init__(self, count=1000, authors=5, days=30, start=None, duplicate_ratio=0.8, mean_length=12.0,
+                 length_sigma=0.6, seed=0):
+        self.count = int(count)
+        self.authors = max(1, int(authors))
+        self.days = days
+        # 起始时间（秒），默认为当前时间往前 days 天；按整秒对齐保证可复现
+        self.start = int(start if start is not None else time.time() - days * 86400)
+        self.duplicate_ratio = min(1.0, max(0.0, duplicate_ratio))
+        # 非重复消息的长度（字）服从对数正态分布，均值为 mean_length
+        self.mean_length = mean_length
+        self.length_sigma = length_sigma
+        self.seed = seed
+
+
+def author_names(count):
+    """前几位作者沿用示例中的名字，其余按编号命名"""
+    names = AUTHORS[:count]
+    names.extend(f"成员{i:04d}" for i in range(len(names) + 1, count + 1))
+    return names
+
+
+def zipf_weights(count, exponent=1.0):
+    """按排名递减的权重，少数作者/消息占多数，更接近真实聊天"""
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def generate_batch(options, batch_index, batch_size):
+    """生成第 batch_index 批（从 batch_index * batch_size 开始）的 (时间, 作者, 消息) 三列
+
+    每批使用由种子和批号派生的独立随机数生成器，结果与批的生成顺序和所在进程无关。
+    """
+    begin = batch_index * batch_size
+    size = min(batch_size, options.count - begin)
+    rng = np.random.default_rng([options.seed, batch_index])
+
+    # 时间：将时间范围均分给每条消息，在各自的时间槽内随机偏移，整体按时间递增
+    slot = options.days * 86400 / max(1, options.count)
+    offsets = (np.arange(begin, begin + size) + rng.random(size)) * slot
+    seconds = (options.start + offsets).astype("int64").astype("datetime64[s]")
+    times = np.char.replace(np.datetime_as_string(seconds, unit="s"), "T", " ")
+
+    names = np.array(author_names(options.authors), dtype=object)
+    authors = names[rng.choice(options.authors, size, p=zipf_weights(options.authors))]
+
+    messages = np.empty(size, dtype=object)
+    duplicate = rng.random(size) < options.duplicate_ratio
+
+    # 重复消息：按热度从常用消息中抽取，并填充数字，形成完全相同或只有数字不同的消息
+    dup_count = int(duplicate.sum())
+    templates = rng.choice(len(TEMPLATES), dup_count, p=zipf_weights(len(TEMPLATES), 0.8))
+    numbers = rng.integers(1, 6, dup_count)
+    percents = rng.integers(50, 101, dup_count)
+    features = rng.integers(0, len(FEATURES), dup_count)
+    messages[duplicate] = [
+        TEMPLATES[t].format(n=n, p=p, feature=FEATURES[f]) if "{" in TEMPLATES[t] else TEMPLATES[t]
+        for t, n, p, f in zip(templates.tolist(), numbers.tolist(), percents.tolist(), features.tolist())
+    ]
+
+    # 非重复消息：按对数正态分布的长度随机组合词语
+    unique_count = size - dup_count
+    mu = np.log(options.mean_length) - options.length_sigma ** 2 / 2
+    lengths = np.clip(rng.lognormal(mu, options.length_sigma, unique_count), 2, 2000)
+    word_counts = np.maximum(1, (lengths / 2).astype("int64"))
+    words = np.array(WORDS, dtype=object)[rng.integers(0, len(WORDS), int(word_counts.sum()))]
+    bounds = np.concatenate(([0], np.cumsum(word_counts))).tolist()
+    messages[~duplicate] = ["".join(words[bounds[i]:bounds[i + 1]]) for i in range(unique_count)]
+
+    return times, authors, messages
+
+
+def render_batch(args):
+    """生成一批数据并格式化为 CSV 文本（供多进程调用）"""
+    options, batch_index, batch_size = args
+    times, authors, messages = generate_batch(options, batch_index, batch_size)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(zip(times.tolist(), authors.tolist(), messages.tolist()))
+    return buffer.getvalue()
+
+
+def iter_csv_batches(options, batch_size=BATCH_SIZE, workers=1):
+    """按顺序产出各批的 CSV 文本；workers > 1 时多进程并行生成，同时最多保留 2 * workers 批"""
+    batches = (options.count + batch_size - 1) // batch_size
+    tasks = ((options, index, batch_size) for index in range(batches))
+    if workers <= 1 or batches <= 1:
+        for task in tasks:
+            yield render_batch(task)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = []
+        for task in tasks:
+            pending.append(executor.submit(render_batch, task))
+            if len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def write_chat_csv(path, options, batch_size=BATCH_SIZE, workers=1):
+    """生成聊天记录并逐批写入 CSV 文件，返回文件大小（字节）"""
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        file.write("时间,作者,消息\r\n")
+        for text in iter_csv_batches(options, batch_size, workers):
+            file.write(text)
+    return os.path.getsize(path)
+
+
 # 生成示例聊天数据
-def generate_sample_chat_data(num_messages=1000):
-    authors = ["张三", "李四", "王五", "赵六", "钱七"]
-    topics = ["项目进度", "技术问题", "团队协作", "客户反馈", "产品设计"]
-    
-    messages = []
-    start_time = datetime.now() - timedelta(days=30)
-    
-    for i in range(num_messages):
-        time_stamp = (start_time + timedelta(minutes=random.randint(1, 60*24*30))).strftime("%Y-%m-%d %H:%M:%S")
-        author = random.choice(authors)
-        topic = random.choice(topics)
-        
-        if topic == "项目进度":
-            message = random.choice([
-                "我们的项目进度如何？",
-                f"模块{random.randint(1, 5)}已经完成了{random.randint(50, 100)}%",
-                "我们需要加快进度，截止日期快到了",
-                "今天的任务已经完成",
-                "我们可能需要延期交付"
-            ])
-        elif topic == "技术问题":
-            message = random.choice([
-                f"我在实现{random.choice(['登录', '注册', '支付', '数据分析', '报表'])}功能时遇到了问题",
-                "这个bug很难修复，我需要帮助",
-                "我找到了一个更好的解决方案",
-                "我们应该使用哪个框架？",
-                "代码质量需要提高"
-            ])
-        elif topic == "团队协作":
-            message = random.choice([
-                "我们需要更好的沟通",
-                "下周二开会讨论项目进展",
-                "请大家及时更新任务状态",
-                "我需要前端团队的支持",
-                "谁能帮我review一下代码？"
-            ])
-        elif topic == "客户反馈":
-            message = random.choice([
-                "客户对新功能很满意",
-                "客户报告了一个严重的bug",
-                "客户希望增加一个新特性",
-                "我们需要改进用户体验",
-                "客户投诉系统响应太慢"
-            ])
-        else:  # 产品设计
-            message = random.choice([
-                "新的UI设计稿已经完成",
-                "我们需要重新考虑产品定位",
-                "用户调研结果显示我们需要简化流程",
-                "竞品分析报告已经发到邮箱",
-                "产品路线图需要更新"
-            ])
-        
-        messages.append([time_stamp, author, message])
-    
-    return messages
+def generate_sample_chat_data(num_messages=1000, seed=0):
+    """生成 [时间, 作者, 消息] 行组成的列表，适合少量数据；大量数据请使用 write_chat_csv"""
+    options = GeneratorOptions(num_messages, seed=seed)
+    rows = []
+    for index in range((options.count + BATCH_SIZE - 1) // BATCH_SIZE):
+        times, authors, messages = generate_batch(options, index, BATCH_SIZE)
+        rows.extend(map(list, zip(times.tolist(), authors.tolist(), messages.tolist())))
+    return rows
+
 
 # 将数据保存为CSV文件
 def save_to_csv(data, filename="sample_chat_data.csv"):
@@ -66,9 +201,41 @@ def save_to_csv(data, filename="sample_chat_data.csv"):
         writer = csv.writer(file)
         writer.writerow(["时间", "作者", "消息"])
         writer.writerows(data)
-    
+
     print(f"已生成示例数据并保存到 {filename}")
 
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="生成示例聊天记录 CSV")
+    parser.add_argument("-n", "--count", type=int, default=1000, help="消息条数")
+    parser.add_argument("-o", "--output", default=os.path.join(BASE_DIR, "sample_chat_data.csv"), help="输出文件")
+    parser.add_argument("--authors", type=int, default=5, help="作者人数")
+    parser.add_argument("--days", type=float, default=30, help="时间跨度（天）")
+    parser.add_argument("--start", help="起始时间，如 2024-01-01 或 2024-01-01 08:00:00，默认为当前时间往前 --days 天")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.8, help="从常用消息中抽取（重复或近似重复）的比例")
+    parser.add_argument("--mean-length", type=float, default=12, help="非重复消息的平均长度（字）")
+    parser.add_argument("--length-sigma", type=float, default=0.6, help="消息长度对数正态分布的 sigma，越大长短差异越大")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，相同参数和种子生成相同的数据")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="每批生成的行数（随机数按批派生，改变批大小会得到不同的数据）")
+    parser.add_argument("--workers", type=int, default=1, help="并行生成的进程数")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = None
+    if args.start:
+        start = (datetime.fromisoformat(args.start) - datetime(1970, 1, 1)) // timedelta(seconds=1)
+    options = GeneratorOptions(args.count, args.authors, args.days, start, args.duplicate_ratio, args.mean_length,
+                               args.length_sigma, args.seed)
+
+    started = time.monotonic()
+    size = write_chat_csv(args.output, options, max(1, args.batch_size), args.workers)
+    seconds = time.monotonic() - started
+    print(f"已生成 {options.count} 条示例数据并保存到 {args.output}"
+          f"（{size / 1048576:.1f} MB，用时 {seconds:.1f} 秒）", file=sys.stderr)
+    return 0
+
+
 if __name__ == "__main__":
-    data = generate_sample_chat_data(1000)
-    save_to_csv(data, "d:/AI/project/Automated_feedback/sample_chat_data.csv")
\ No newline at end of file
+    sys.exit(main())
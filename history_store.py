@@ -0,0 +1,193 @@
+"""分析历史记录存储：JSONL 数据文件只追加写入，另以索引文件记录每条记录的偏移量"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from metrics import METRICS
+
+
+class HistoryStore:
+    """追加写入的历史记录存储
+
+    数据文件每行一条 JSON 记录；索引文件每行记录 id、时间、类型及其在数据文件中的
+    字节偏移和长度。启动时只读取索引，记录正文在需要时按偏移量读取。每次追加都会
+    刷新并同步到磁盘，写入中断时会在下次打开时截断不完整的尾部并重建缺失的索引。
+    """
+
+    # 索引中保存的字段；source 用于增量分析时按来源查找记录而无需读取正文
+    INDEX_FIELDS = ("id", "timestamp", "type", "source")
+    # 内存中保留的最近读取的记录正文数
+    BODY_CACHE_SIZE = 64
+
+    def __init__(self, data_file, index_file=None):
+        self.data_file = data_file
+        self.index_file = index_file or os.path.splitext(data_file)[0] + ".idx"
+        self.entries = []
+        self.lock = threading.Lock()
+        # 最近读取的记录正文，按最近使用顺序淘汰
+        self.body_cache = OrderedDict()
+        self._open()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _open(self):
+        if not os.path.exists(self.data_file):
+            open(self.data_file, 'ab').close()
+        self.entries = self._load_index()
+        data_size = self._truncate_partial_tail()
+
+        # 丢弃指向数据文件之外的索引项（数据被截断的情况）
+        while self.entries and self.entries[-1]["offset"] + self.entries[-1]["length"] > data_size:
+            self.entries.pop()
+
+        # 数据已写入但索引未写入时（写索引前中断），扫描尾部补全索引
+        indexed_end = self.entries[-1]["offset"] + self.entries[-1]["length"] if self.entries else 0
+        if indexed_end < data_size:
+            recovered = self._scan(indexed_end)
+            self.entries.extend(recovered)
+            self._rewrite_index()
+
+        self.data = open(self.data_file, 'ab')
+        self.index = open(self.index_file, 'ab')
+
+    def _load_index(self):
+        entries = []
+        if not os.path.exists(self.index_file):
+            return entries
+        with open(self.index_file, 'rb') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # 索引损坏时以数据文件为准重建
+                    return []
+        return entries
+
+    def _truncate_partial_tail(self):
+        """截断数据文件末尾未以换行结束的不完整记录，返回截断后的文件大小"""
+        with open(self.data_file, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return 0
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return size
+
+            # 从末尾向前查找最后一个换行符
+            pos = size
+            block = 4096
+            while pos > 0:
+                start = max(0, pos - block)
+                f.seek(start)
+                chunk = f.read(pos - start)
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    pos = start + newline + 1
+                    break
+                pos = start
+            f.truncate(pos)
+            return pos
+
+    def _scan(self, offset):
+        """从指定偏移开始扫描数据文件，为每条完整记录生成索引项"""
+        entries = []
+        next_id = self.entries[-1]["id"] + 1 if self.entries else 1
+        with open(self.data_file, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    offset += len(line)
+                    continue
+                record.setdefault("id", next_id)
+                entries.append(self._make_entry(record, offset, len(line)))
+                next_id = record["id"] + 1
+                offset += len(line)
+        return entries
+
+    def _make_entry(self, record, offset, length):
+        entry = {field: record.get(field) for field in self.INDEX_FIELDS}
+        entry["offset"] = offset
+        entry["length"] = length
+        return entry
+
+    def _rewrite_index(self):
+        tmp_path = self.index_file + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            for entry in self.entries:
+                f.write(self._encode(entry))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_file)
+
+    @staticmethod
+    def _encode(obj):
+        return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def append(self, record, sync=True):
+        """追加一条记录，返回其索引项（耗时记录为 stage_seconds{stage="history_save"}）"""
+        with self.lock, METRICS.timer("stage_seconds", stage="history_save"):
+            record = dict(record)
+            record["id"] = self.entries[-1]["id"] + 1 if self.entries else 1
+            line = self._encode(record)
+
+            offset = self.data.seek(0, os.SEEK_END)
+            self.data.write(line)
+            self.data.flush()
+            if sync:
+                os.fsync(self.data.fileno())
+
+            entry = self._make_entry(record, offset, len(line))
+            self.index.write(self._encode(entry))
+            self.index.flush()
+
+            self.entries.append(entry)
+            return entry
+
+    def get(self, position):
+        """按位置读取完整记录（从数据文件中按偏移量读取）"""
+        entry = self.entries[position]
+        record = self.body_cache.get(entry["id"])
+        if record is not None:
+            self.body_cache.move_to_end(entry["id"])
+            return record
+
+        with open(self.data_file, 'rb') as f:
+            f.seek(entry["offset"])
+            record = json.loads(f.read(entry["length"]))
+
+        self.body_cache[entry["id"]] = record
+        if len(self.body_cache) > self.BODY_CACHE_SIZE:
+            self.body_cache.popitem(last=False)
+        return record
+
+    def iter_reversed(self, **filters):
+        """从新到旧依次读取记录，filters 按索引字段过滤（无需读取不匹配记录的正文）"""
+        for position in range(len(self.entries) - 1, -1, -1):
+            entry = self.entries[position]
+            if all(entry.get(field) == value for field, value in filters.items()):
+                yield self.get(position)
+
+    def migrate_from_json(self, json_file):
+        """从旧版 results.json（整体写入的 JSON 列表）导入历史记录，仅在存储为空时执行"""
+        if self.entries or not os.path.exists(json_file):
+            return 0
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except ValueError:
+            return 0
+
+        for record in records:
+            self.append(record, sync=False)
+        if records:
+            os.fsync(self.data.fileno())
+        return len(records)
+
+    def close(self):
+        self.data.close()
+        self.index.close()
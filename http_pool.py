@@ -0,0 +1,221 @@
+"""共享的 HTTP 连接池：所有分析器共用长连接，避免每次创建客户端都重新进行 DNS、TCP 和 TLS 握手
+
+同一组连接参数（连接池大小、是否启用 HTTP/2、空闲连接保持时间）只创建一个 httpx.Client，
+重新保存 API 设置或切换模型后仍复用已建立的连接。PoolStats 统计新建与复用的连接数，用于调整连接池大小。
+在可取消的任务中（见 cancellation）发出的请求，任务取消时会中断所用的连接。
+"""
+
+import functools
+import threading
+
+import httpx
+from openai import DefaultHttpxClient
+
+from cancellation import abort_stream, current_token
+from resilience import CancelledError
+
+# 连接池默认大小，实际取该值与最大并发数中的较大者
+DEFAULT_POOL_SIZE = 10
+# 空闲连接保持时间（秒），需长于两次分析之间的间隔，预热的连接才有意义
+DEFAULT_KEEPALIVE_EXPIRY = 120.0
+# 预热请求的超时时间（秒）
+WARM_UP_TIMEOUT = 10.0
+
+
+def http2_available():
+    """HTTP/2 需要安装 h2（pip install httpx[http2]）"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PoolStats:
+    """连接池计数：请求数、新建的连接数、复用已有连接的请求数及各 HTTP 版本的响应数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.opened = 0
+        self.reused = 0
+        self.versions = {}
+
+    def record(self, opened, http_version=None):
+        with self.lock:
+            self.requests += 1
+            if opened:
+                self.opened += 1
+            else:
+                self.reused += 1
+            if http_version:
+                self.versions[http_version] = self.versions.get(http_version, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "opened": self.opened,
+                "reused": self.reused,
+                "reuse_rate": round(self.reused / self.requests, 3) if self.requests else None,
+                "http_versions": dict(self.versions)
+            }
+
+
+class TrackedStream(httpx.SyncByteStream):
+    """响应正文的包装，关闭时调用 on_close"""
+
+    def __init__(self, stream, on_close):
+        self.stream = stream
+        self.on_close = on_close
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.on_close()
+
+
+class CountingTransport(httpx.BaseTransport):
+    """包装 httpx.HTTPTransport，通过 httpcore 的 trace 扩展判断每个请求是否新建了连接
+
+    当前上下文有取消令牌时改由 send_cancellable 发送，任务取消时中断请求。
+    """
+
+    def __init__(self, transport, stats):
+        self.transport = transport
+        self.stats = stats
+
+    def handle_request(self, request):
+        token = current_token()
+        if token is None:
+            return self.send(request)
+        return self.send_cancellable(request, token)
+
+    def send_cancellable(self, request, token):
+        """在单独的线程中发送请求，调用线程等待响应或任务取消
+
+        新建的连接建立后即在令牌上登记中断回调，复用的连接在收到响应头后登记，响应关闭时取消登记。
+        收到响应头之前被取消时调用线程立即抛出 CancelledError，迟到的响应到达后直接关闭，
+        连接不再归还连接池。
+        """
+        finished = threading.Event()
+        lock = threading.Lock()
+        outcome = {}
+        aborts = []
+
+        def watch(stream):
+            abort = functools.partial(abort_stream, stream)
+            aborts.append(abort)
+            token.register(abort)
+
+        def release():
+            for abort in aborts:
+                token.unregister(abort)
+
+        def send():
+            try:
+                result = self.send(request, watch)
+            except Exception as e:
+                result = e
+            with lock:
+                outcome["result"] = result
+                abandoned = outcome.get("abandoned", False)
+            finished.set()
+            if abandoned and isinstance(result, httpx.Response):
+                result.close()
+
+        token.register(finished.set)
+        threading.Thread(target=send, name="http-request", daemon=True).start()
+        finished.wait()
+        token.unregister(finished.set)
+        with lock:
+            result = outcome.get("result")
+            outcome["abandoned"] = result is None
+        if result is None:
+            release()
+            raise CancelledError()
+        if isinstance(result, Exception):
+            release()
+            raise result
+
+        stream = result.extensions.get("network_stream")
+        if stream is not None:
+            watch(stream)
+        return httpx.Response(result.status_code, headers=result.headers,
+                              stream=TrackedStream(result.stream, release), extensions=result.extensions)
+
+    def send(self, request, on_connect=None):
+        """发送请求并统计连接复用情况；on_connect(stream) 在新建连接后调用"""
+        opened = []
+        previous = request.extensions.get("trace")
+
+        def trace(name, info):
+            if name.endswith(("connect_tcp.complete", "connect_unix_socket.complete")):
+                opened.append(name)
+                if on_connect and info.get("return_value") is not None:
+                    on_connect(info["return_value"])
+            if previous:
+                previous(name, info)
+
+        request.extensions["trace"] = trace
+        response = self.transport.handle_request(request)
+        version = response.extensions.get("http_version")
+        self.stats.record(bool(opened), version.decode("ascii") if isinstance(version, bytes) else version)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class SharedHttpClient:
+    """一组连接参数对应的共享客户端及其统计"""
+
+    def __init__(self, pool_size, http2, keepalive_expiry):
+        self.pool_size = pool_size
+        # 未安装 h2 时退回 HTTP/1.1
+        self.http2 = http2 and http2_available()
+        self.stats = PoolStats()
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                              keepalive_expiry=keepalive_expiry)
+        transport = httpx.HTTPTransport(http2=self.http2, limits=limits)
+        # 超时由 OpenAI 客户端按请求设置
+        self.client = DefaultHttpxClient(transport=CountingTransport(transport, self.stats))
+
+    def warm_up(self, url):
+        """在后台线程中向 url 发送一个 HEAD 请求，提前建立连接并放入连接池，返回该线程"""
+        def run():
+            try:
+                self.client.head(url, timeout=WARM_UP_TIMEOUT)
+            except httpx.HTTPError:
+                # 预热失败不影响之后的正常请求
+                pass
+
+        thread = threading.Thread(target=run, name="http-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+
+_shared_clients = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_client(pool_size=DEFAULT_POOL_SIZE, http2=False, keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY):
+    """返回相同参数共用的 SharedHttpClient，首次调用时创建"""
+    key = (int(pool_size), bool(http2), float(keepalive_expiry))
+    with _shared_lock:
+        shared = _shared_clients.get(key)
+        if shared is None:
+            shared = _shared_clients[key] = SharedHttpClient(*key)
+        return shared
+
+
+def close_shared_clients():
+    """关闭所有共享客户端（程序退出时调用）"""
+    with _shared_lock:
+        for shared in _shared_clients.values():
+            shared.client.close()
+        _shared_clients.clear()
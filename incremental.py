@@ -0,0 +1,31 @@
+"""增量分析：记录已分析位置（水位线），后续只发送新增的消息"""
+
+
+def make_watermark(chat_log, source):
+    """生成水位线：来源、已分析条数、最后一条的时间和已分析内容的摘要"""
+    count = len(chat_log)
+    return {
+        "source": source,
+        "count": count,
+        "last_time": chat_log.time(count - 1) if count else "",
+        "fingerprint": chat_log.fingerprint(count)
+    }
+
+
+def resume_position(chat_log, watermark):
+    """返回应从哪一条开始增量分析；聊天记录不是在上次内容之后追加的则返回 None"""
+    count = watermark.get("count", 0)
+    if count > len(chat_log):
+        return None
+    if chat_log.fingerprint(count) != watermark.get("fingerprint"):
+        return None
+    return count
+
+
+def latest_analysis(records, source):
+    """在按时间从新到旧排列的记录中，查找同一来源最近一次带水位线的分析记录"""
+    for record in records:
+        watermark = record.get("watermark")
+        if watermark and watermark.get("source") == source and record.get("result"):
+            return record
+    return None
@@ -0,0 +1,202 @@
+"""分析任务队列：按优先级排队，限制同时运行的任务数，可取消排队中和运行中的任务
+
+不依赖图形界面：任务的实际执行由 start_job 回调负责（图形界面中为启动工作线程），
+任务结束后调用 JobQueue.finish。所有方法应在同一线程（如界面线程）中调用。
+取消运行中的任务通过任务的 CancelToken 中断进行中的请求（见 cancellation）。
+"""
+
+import heapq
+import itertools
+import time
+
+from cancellation import CancelToken
+from metrics import METRICS
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: "高", PRIORITY_NORMAL: "普通", PRIORITY_LOW: "低"}
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+STATE_NAMES = {QUEUED: "排队中", RUNNING: "运行中", DONE: "已完成", FAILED: "失败", CANCELLED: "已取消"}
+# 默认同时运行的任务数，各任务的请求仍共用分析器的并发限制
+DEFAULT_MAX_RUNNING = 2
+
+
+class Job:
+    """一个分析任务：kind 为任务类型（如 analysis、improve），title 为显示的说明
+
+    group 相同的任务依次运行（如基于同一反馈会话的多次改进）；payload 供 start_job 使用。
+    progress 为最近一次的进度快照（见 progress.ProgressTracker），error 为失败原因。
+    """
+
+    def __init__(self, kind, title, priority=PRIORITY_NORMAL, group=None, payload=None):
+        self.id = None
+        self.kind = kind
+        self.title = title
+        self.priority = priority
+        self.group = group
+        self.payload = payload
+        self.state = QUEUED
+        # 最近一次入队的序号，队列中序号不同的旧条目已失效
+        self.sequence = None
+        self.token = CancelToken()
+        self.progress = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+    @property
+    def cancelling(self):
+        """已请求取消、仍在等待工作线程退出"""
+        return self.state == RUNNING and self.token.cancelled
+
+    def elapsed(self):
+        """运行耗时（秒），尚未开始时为 None"""
+        if self.started is None:
+            return None
+        return (self.finished or time.time()) - self.started
+
+
+class JobQueue:
+    """按优先级（数值小的优先）和提交顺序调度任务，同时运行的任务不超过 max_running 个
+
+    start_job(job) 启动任务，on_change(job) 在任务状态变化时调用，用于刷新界面；
+    on_discard(job) 在排队中的任务被取消时调用，用于释放任务的 payload（运行中的任务由 finish 报告结束）。
+    """
+
+    def __init__(self, start_job, max_running=DEFAULT_MAX_RUNNING, on_change=None, on_discard=None):
+        self.start_job = start_job
+        self.max_running = max(1, int(max_running))
+        self.on_change = on_change
+        self.on_discard = on_discard
+        # 提交顺序的全部任务（含已结束的），供界面展示
+        self.jobs = []
+        self.running = []
+        # 排队中的任务：(priority, 序号, job)，改变优先级时以新序号重新入堆，序号与 job.sequence 不同的旧条目在出堆时跳过
+        self.pending = []
+        self.ids = itertools.count(1)
+        self.sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def submit(self, job):
+        job.id = next(self.ids)
+        self.jobs.append(job)
+        self._enqueue(job)
+        self._changed(job)
+        self._dispatch()
+        return job
+
+    def queued(self):
+        """排队中的任务，按运行顺序排列"""
+        return [entry[2] for entry in sorted(self.pending) if self._current(entry)]
+
+    def set_priority(self, job, priority):
+        """调整排队中任务的优先级，运行中或已结束的任务不受影响"""
+        if job.state != QUEUED or job.priority == priority:
+            return False
+        job.priority = priority
+        self._enqueue(job)
+        self._changed(job)
+        self._dispatch()
+        return True
+
+    def cancel(self, job):
+        """取消任务：排队中的任务直接移出队列；运行中的任务中断请求，等待 finish 报告结束"""
+        if job.state == QUEUED:
+            job.token.cancel()
+            self._end(job, CANCELLED)
+            if self.on_discard:
+                self.on_discard(job)
+            return True
+        if job.state == RUNNING and not job.token.cancelled:
+            job.token.cancel()
+            self._changed(job)
+            return True
+        return False
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            self.cancel(job)
+
+    def finish(self, job, state, error=None):
+        """任务结束（DONE / FAILED / CANCELLED）时调用；已取消的任务以失败结束时记为已取消"""
+        if job.state != RUNNING:
+            return
+        if state == FAILED and job.token.cancelled:
+            state = CANCELLED
+        job.error = error
+        self.running.remove(job)
+        self._end(job, state)
+        self._dispatch()
+
+    def update_progress(self, job, snapshot):
+        job.progress = snapshot
+        self._changed(job)
+
+    def set_max_running(self, max_running):
+        self.max_running = max(1, int(max_running))
+        self._dispatch()
+
+    def clear_finished(self):
+        """从列表中移除已结束的任务"""
+        self.jobs = [job for job in self.jobs if job.active]
+
+    def _enqueue(self, job):
+        job.sequence = next(self.sequence)
+        heapq.heappush(self.pending, (job.priority, job.sequence, job))
+
+    @staticmethod
+    def _current(entry):
+        """堆中的条目是否为排队中任务的最新条目"""
+        _, sequence, job = entry
+        return job.state == QUEUED and sequence == job.sequence
+
+    def _runnable(self, job):
+        return job.group is None or all(other.group != job.group for other in self.running)
+
+    def _dispatch(self):
+        """按优先级启动排队的任务，直到达到同时运行的上限；同组已有任务在运行的暂时跳过"""
+        skipped = []
+        while len(self.running) < self.max_running and self.pending:
+            entry = heapq.heappop(self.pending)
+            job = entry[2]
+            if not self._current(entry):
+                continue
+            if not self._runnable(job):
+                skipped.append(entry)
+                continue
+            job.state = RUNNING
+            job.started = time.time()
+            self.running.append(job)
+            METRICS.observe("job_wait_seconds", job.started - job.submitted, kind=job.kind)
+            self._changed(job)
+            try:
+                self.start_job(job)
+            except Exception as e:
+                self.running.remove(job)
+                job.error = f"{type(e).__name__}: {e}"
+                self._end(job, FAILED)
+        for entry in skipped:
+            heapq.heappush(self.pending, entry)
+
+    def _end(self, job, state):
+        job.state = state
+        job.finished = time.time()
+        METRICS.increment("jobs_total", kind=job.kind, state=state)
+        self._changed(job)
+
+    def _changed(self, job):
+        if self.on_change:
+            self.on_change(job)
@@ -0,0 +1,196 @@
+"""历史记录、聊天记录预览、时间线和任务队列的列表模型：只在视图需要时生成可见行的内容，滚动成本与总条数无关"""
+
+import os
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+
+from job_queue import PRIORITY_NAMES, STATE_NAMES, RUNNING, FAILED
+from progress import format_progress
+
+
+class HistoryListModel(QAbstractListModel):
+    """按从新到旧的顺序展示 HistoryStore 中的记录
+
+    行文本只依赖内存中的索引项，不读取记录正文；行按批加载（canFetchMore/fetchMore），
+    视图滚动到末尾时再加载下一批。
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.loaded = min(len(store), self.BATCH_SIZE)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < len(self.store)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(self.BATCH_SIZE, len(self.store) - self.loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def position(self, index):
+        """视图中的行对应的存储位置（第 0 行为最新的记录）"""
+        return len(self.store) - 1 - index.row()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self.loaded:
+            return None
+        entry = self.store.entries[self.position(index)]
+        if role == Qt.DisplayRole:
+            type_text = "分析" if entry["type"] == "analysis" else "改进"
+            return f"{entry['timestamp']} - {type_text}结果"
+        if role == Qt.ToolTipRole and entry.get("source"):
+            return entry["source"] if entry["source"] == "manual" else os.path.basename(entry["source"])
+        return None
+
+    def record_appended(self):
+        """存储末尾追加了一条记录后调用，新记录显示在第一行"""
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.loaded += 1
+        self.endInsertRows()
+
+    def reload(self):
+        self.beginResetModel()
+        self.loaded = min(len(self.store), self.BATCH_SIZE)
+        self.endResetModel()
+
+
+class ChatLogModel(QAbstractListModel):
+    """聊天记录预览：每行为一条 "[时间] 作者: 消息"，只在绘制时按下标从 ChatLog 读取"""
+
+    # 单行显示的最大字符数，完整内容见悬停提示
+    MAX_DISPLAY_CHARS = 300
+
+    def __init__(self, chat_log, parent=None):
+        super().__init__(parent)
+        self.chat_log = chat_log
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.chat_log)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.chat_log):
+            return None
+        if role == Qt.DisplayRole:
+            line = self.chat_log.format_line(index.row())
+            if len(line) > self.MAX_DISPLAY_CHARS:
+                line = line[:self.MAX_DISPLAY_CHARS] + "…"
+            return line.replace("\n", " ⏎ ")
+        if role == Qt.ToolTipRole:
+            return self.chat_log.message(index.row())
+        return None
+
+    def set_log(self, chat_log):
+        self.beginResetModel()
+        self.chat_log = chat_log
+        self.endResetModel()
+
+    def extend(self, chunk):
+        """将 chunk 追加到当前聊天记录，只通知视图新增的行"""
+        if not chunk:
+            return
+        start = len(self.chat_log)
+        self.beginInsertRows(QModelIndex(), start, start + len(chunk) - 1)
+        self.chat_log.extend(chunk)
+        self.endInsertRows()
+
+
+class TimelineModel(QAbstractListModel):
+    """时间线：每行一个时间窗口，显示时间范围、消息数和分析结果的第一行，结果随各窗口完成逐行更新"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.windows = []
+        self.summaries = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.windows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.windows):
+            return None
+        window, summary = self.windows[index.row()], self.summaries[index.row()]
+        if role == Qt.DisplayRole:
+            first_line = next((line for line in (summary or "").splitlines() if line.strip()), "")
+            status = first_line.strip()[:80] if summary is not None else "分析中…"
+            return f"{window.label}（{len(window.chat_log)} 条）  {status}"
+        if role == Qt.ToolTipRole and summary:
+            return summary
+        return None
+
+    def set_windows(self, windows):
+        self.beginResetModel()
+        self.windows = list(windows)
+        self.summaries = [None] * len(self.windows)
+        self.endResetModel()
+
+    def set_summary(self, row, summary):
+        self.summaries[row] = summary
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def summary(self, index):
+        return self.summaries[index.row()] if index.isValid() else None
+
+
+class JobListModel(QAbstractListModel):
+    """任务队列（见 job_queue.JobQueue）：每行一个任务，显示编号、优先级、说明、状态和进度，按提交顺序排列"""
+
+    def __init__(self, queue, parent=None):
+        super().__init__(parent)
+        self.queue = queue
+        # 视图已知的行数，新任务提交后在 job_changed 中通知插入
+        self.count = len(queue.jobs)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.count
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self.count:
+            return None
+        job = self.queue.jobs[index.row()]
+        if role == Qt.DisplayRole:
+            status = "正在取消" if job.cancelling else STATE_NAMES[job.state]
+            if job.state == RUNNING and job.progress:
+                status += f" {job.progress['percent']}%"
+            elapsed = job.elapsed()
+            if elapsed is not None:
+                status += f"（{elapsed:.1f} 秒）"
+            return f"#{job.id} [{PRIORITY_NAMES[job.priority]}] {job.title} - {status}"
+        if role == Qt.ToolTipRole:
+            if job.state == FAILED and job.error:
+                return job.error
+            if job.progress:
+                return format_progress(job.progress)
+        return None
+
+    def job(self, index):
+        return self.queue.jobs[index.row()] if index.isValid() else None
+
+    def job_changed(self, job):
+        """任务状态或进度变化后调用，新提交的任务追加到末尾"""
+        jobs = self.queue.jobs
+        if job not in jobs:
+            return
+        row = jobs.index(job)
+        if row >= self.count:
+            self.beginInsertRows(QModelIndex(), self.count, row)
+            self.count = row + 1
+            self.endInsertRows()
+        else:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def reload(self):
+        """任务列表整体变化（如清除已结束的任务）后调用"""
+        self.beginResetModel()
+        self.count = len(self.queue.jobs)
+        self.endResetModel()
@@ -0,0 +1,269 @@
+"""性能指标：各阶段耗时与 API 用量的滚动分位数统计，可导出为 JSON 和 Prometheus 文本格式
+
+各模块通过全局的 METRICS 记录指标，例如：
+
+    with METRICS.timer("stage_seconds", stage="csv_parse"):
+        ...
+    METRICS.increment("api_output_tokens_total", 120, model="deepseek-chat")
+
+耗时类指标保留最近 HISTOGRAM_WINDOW 个样本计算 p50/p95/p99，次数和总和为累计值。
+RunProfiler 可对单次分析运行进行 cProfile（CPU）和 tracemalloc（内存）采样并写入文件。
+"""
+
+import cProfile
+import io
+import json
+import math
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+# 指标名前缀（Prometheus 导出时使用）
+PREFIX = "chat_analyzer_"
+# 每个指标保留的最近样本数，分位数按这些样本计算
+HISTOGRAM_WINDOW = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 各指标的说明，导出 Prometheus 格式时作为 HELP
+METRIC_HELP = {
+    "stage_seconds": "各阶段耗时（秒）",
+    "api_request_seconds": "单次 API 请求耗时（秒，含网络等待和重试）",
+    "api_first_token_seconds": "流式请求的首字延迟（秒）",
+    "api_tokens_per_second": "输出速率（token/秒）",
+    "api_requests_total": "API 请求次数",
+    "api_input_tokens_total": "输入 token 数",
+    "api_cached_tokens_total": "命中服务端上下文缓存的输入 token 数",
+    "api_output_tokens_total": "输出 token 数",
+    "response_cache_hits_total": "命中本地响应缓存的请求数",
+    "job_wait_seconds": "任务从提交到开始运行的排队时间（秒）",
+    "jobs_total": "按类型和结束状态统计的任务数",
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=None):
+    """Prometheus 标签，如 {stage="csv_parse",quantile="0.5"}"""
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escape = lambda value: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in items) + "}"
+
+
+class Histogram:
+    """滚动窗口的样本分布：最近 window 个样本用于计算分位数，count / total 为累计值"""
+
+    def __init__(self, window=HISTOGRAM_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self):
+        """按最近样本计算各分位数（最近秩法），没有样本时为 None"""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: None for q in QUANTILES}
+        return {q: ordered[max(0, math.ceil(q * len(ordered)) - 1)] for q in QUANTILES}
+
+    def snapshot(self):
+        quantiles = self.quantiles()
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "p50": quantiles[0.5],
+            "p95": quantiles[0.95],
+            "p99": quantiles[0.99],
+        }
+
+
+class Metrics:
+    """线程安全的指标集合：observe 记录一个样本，increment 累加计数，timer 计时一段代码"""
+
+    def __init__(self, window=HISTOGRAM_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.window)
+            histogram.observe(value)
+
+    def increment(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """记录 with 代码块的耗时（秒），代码块抛出异常时同样记录"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """所有指标的当前值：{"summaries": [...], "counters": [...]}，每项带 name 和 labels"""
+        with self.lock:
+            summaries = [dict(name=name, labels=dict(labels), **histogram.snapshot())
+                         for (name, labels), histogram in sorted(self.histograms.items())]
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+        return {"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "summaries": summaries, "counters": counters}
+
+    def to_prometheus(self):
+        """Prometheus 文本格式：耗时类指标为 summary（含分位数），计数为 counter"""
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name, type_):
+            if name not in declared:
+                declared.add(name)
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {PREFIX}{name} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {PREFIX}{name} {type_}")
+
+        for item in snapshot["summaries"]:
+            name, labels = item["name"], sorted(item["labels"].items())
+            declare(name, "summary")
+            for quantile in QUANTILES:
+                value = item[f"p{int(quantile * 100)}"]
+                if value is not None:
+                    lines.append(f"{PREFIX}{name}{_format_labels(labels, ('quantile', quantile))} {value:.6g}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {item['sum']:.6g}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {item['count']}")
+        for item in snapshot["counters"]:
+            name, labels = item["name"], sorted(item["labels"].items())
+            declare(name, "counter")
+            lines.append(f"{PREFIX}{name}{_format_labels(labels)} {item['value']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, json_file):
+        """写入 JSON 文件，并在同名 .prom 文件中写入 Prometheus 文本格式；均先写临时文件再替换"""
+        prom_file = os.path.splitext(json_file)[0] + ".prom"
+        directory = os.path.dirname(os.path.abspath(json_file))
+        os.makedirs(directory, exist_ok=True)
+        for path, content in ((json_file, json.dumps(self.snapshot(), ensure_ascii=False, indent=2)),
+                              (prom_file, self.to_prometheus())):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return json_file, prom_file
+
+
+# 全局指标集合
+METRICS = Metrics()
+
+
+def format_summary(snapshot):
+    """将指标快照格式化为多行说明，如 "stage_seconds[csv_parse]: 12 次 · p50 0.041 · p95 0.052 · p99 0.060" """
+    lines = []
+    for item in snapshot["summaries"]:
+        labels = ",".join(str(value) for value in item["labels"].values())
+        name = f"{item['name']}[{labels}]" if labels else item["name"]
+        quantiles = " · ".join(f"{q} {item[q]:.3f}" for q in ("p50", "p95", "p99") if item[q] is not None)
+        lines.append(f"{name}: {item['count']} 次 · {quantiles}")
+    for item in snapshot["counters"]:
+        labels = ",".join(str(value) for value in item["labels"].values())
+        name = f"{item['name']}[{labels}]" if labels else item["name"]
+        lines.append(f"{name}: {item['value']}")
+    return "\n".join(lines)
+
+
+class RunProfiler:
+    """对单次分析运行进行可选的 CPU 和内存采样
+
+    with RunProfiler(directory, "analysis") as profiler: ...
+    结束后在 directory 中写入 <时间>-<名称>.prof（cProfile 数据，可用 snakeviz 等查看）
+    和同名 .txt（耗时最多的函数和分配内存最多的代码行），文件路径见 profiler.files。
+    cProfile 只采样进入 with 的线程，并发请求线程中的耗时见 api_request_seconds。
+    """
+
+    TOP_FUNCTIONS = 30
+    TOP_ALLOCATIONS = 20
+
+    def __init__(self, directory, name="analysis", cpu=True, memory=True):
+        self.directory = directory
+        self.name = name
+        self.cpu = cpu
+        self.memory = memory
+        self.profile = None
+        self.started_tracing = False
+        self.files = []
+
+    def __enter__(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        if self.cpu:
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:
+                # 已有其他采样在进行（如同时运行的另一次分析），本次只记录内存
+                self.profile = None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.profile:
+            self.profile.disable()
+        report = []
+        memory_snapshot = None
+        if self.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            memory_snapshot = tracemalloc.take_snapshot()
+            report.append(f"内存：当前 {current / 1048576:.1f} MB，峰值 {peak / 1048576:.1f} MB")
+            if self.started_tracing:
+                tracemalloc.stop()
+
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S') + f"{time.time() % 1:.3f}"[1:]
+        base = os.path.join(self.directory, f"{stamp}-{self.name}")
+        if self.profile:
+            self.profile.dump_stats(base + ".prof")
+            self.files.append(base + ".prof")
+            stream = io.StringIO()
+            pstats.Stats(self.profile, stream=stream).sort_stats("cumulative").print_stats(self.TOP_FUNCTIONS)
+            report.append(stream.getvalue())
+        if memory_snapshot is not None:
+            report.append("分配内存最多的代码行：")
+            for stat in memory_snapshot.statistics("lineno")[:self.TOP_ALLOCATIONS]:
+                report.append(str(stat))
+        with open(base + ".txt", 'w', encoding='utf-8') as f:
+            f.write("\n".join(report) + "\n")
+        self.files.append(base + ".txt")
+        return False
+
+
+@contextmanager
+def maybe_profile(directory, name="analysis"):
+    """directory 为空时不采样，否则以 RunProfiler 采样，产出 profiler 或 None"""
+    if not directory:
+        yield None
+        return
+    with RunProfiler(directory, name) as profiler:
+        yield profiler
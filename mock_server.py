@@ -0,0 +1,304 @@
+"""本地模拟的 OpenAI 兼容接口，用于在没有 API Key 的情况下测试和压测
+
+支持普通与流式（SSE）的 /chat/completions 请求，可配置首字延迟、输出速度、
+流式分片间隔和错误注入，并模拟 DeepSeek 的上下文缓存（按消息前缀统计命中的输入 token）。将分析器的 base_url 指向该服务即可：
+
+    python mock_server.py --port 8765 --latency 0.2 --error-rate 0.05
+    python batch_analyze.py data.csv --api-key test --base-url http://127.0.0.1:8765
+
+也可在进程内启动（见 start_mock_server），基准测试即以此方式运行。
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from token_estimate import estimate_tokens
+
+# 模拟输出的文本片段，按需重复到指定长度
+REPLY_TEXT = "【模拟分析结果】本段聊天记录主要讨论了项目进度、技术问题和客户反馈，团队成员分工明确。"
+
+
+class MockOptions:
+    """模拟服务的行为参数"""
+
+    def __init__(self, latency=0.0, output_tokens=200, tokens_per_second=0.0, chunk_tokens=8,
+                 error_rate=0.0, error_statuses=(429, 500), retry_after=None, seed=None):
+        # 收到请求到返回第一个字节的延迟（秒）
+        self.latency = latency
+        # 每次回复的输出 token 数
+        self.output_tokens = output_tokens
+        # 输出速度（token/秒），0 表示不限速
+        self.tokens_per_second = tokens_per_second
+        # 流式输出时每个分片包含的 token 数
+        self.chunk_tokens = max(1, chunk_tokens)
+        # 按比例随机返回 error_statuses 中的错误，429 响应可带 Retry-After
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def pick_error(self):
+        if not self.error_rate or not self.error_statuses:
+            return None
+        with self.lock:
+            if self.random.random() >= self.error_rate:
+                return None
+            return self.random.choice(self.error_statuses)
+
+
+class MockStats:
+    """服务端计数：请求数、错误数、输入/输出 token 数"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, error=False, prompt_tokens=0, completion_tokens=0):
+        with self.lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens
+            }
+
+
+class PrefixCache:
+    """模拟服务端上下文缓存：请求开头的若干条消息与此前某次请求完全相同时，这部分输入计为缓存命中"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.prefixes = set()
+
+    def lookup(self, messages):
+        """返回本次请求命中缓存的输入 token 数，并记录本次请求的各个前缀"""
+        digest = hashlib.sha256()
+        hit_tokens = tokens = 0
+        keys = []
+        for message in messages:
+            digest.update(json.dumps(message, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+            tokens += estimate_tokens(str(message.get("content", "")))
+            keys.append((digest.hexdigest(), tokens))
+        with self.lock:
+            for key, prefix_tokens in keys:
+                if key not in self.prefixes:
+                    break
+                hit_tokens = prefix_tokens
+            self.prefixes.update(key for key, _ in keys)
+        return hit_tokens
+
+
+def reply_pieces(output_tokens, chunk_tokens):
+    """按 token 数生成模拟回复并切分为流式分片（中文约 0.6 token/字）"""
+    chars = max(1, int(output_tokens / 0.6))
+    text = "".join(itertools.islice(itertools.cycle(REPLY_TEXT), chars))
+    step = max(1, int(chunk_tokens / 0.6))
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和正文分两次写出，关闭 Nagle 算法避免与延迟确认叠加产生约 40ms 的额外延迟
+    disable_nagle_algorithm = True
+    ids = itertools.count(1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        # 客户端预热连接时使用，保持连接不关闭
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "not_found"}})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+            return
+
+        options, stats = self.server.options, self.server.stats
+        if options.latency:
+            time.sleep(options.latency)
+
+        status = options.pick_error()
+        if status:
+            stats.record(error=True)
+            headers = {}
+            if status == 429 and options.retry_after is not None:
+                headers["Retry-After"] = str(options.retry_after)
+            self.send_json(status, {"error": {"message": f"mock error {status}", "type": "mock_error"}}, headers)
+            return
+
+        messages = request.get("messages", [])
+        prompt_tokens = sum(estimate_tokens(str(m.get("content", ""))) for m in messages)
+        cached_tokens = self.server.prefix_cache.lookup(messages)
+        pieces = reply_pieces(options.output_tokens, options.chunk_tokens)
+        # 同时给出 DeepSeek 与 OpenAI 两种格式的缓存命中字段
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": options.output_tokens,
+            "total_tokens": prompt_tokens + options.output_tokens,
+            "prompt_cache_hit_tokens": cached_tokens,
+            "prompt_cache_miss_tokens": prompt_tokens - cached_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+        stats.record(prompt_tokens=prompt_tokens, completion_tokens=options.output_tokens)
+
+        completion_id = f"mock-{next(self.ids)}"
+        model = request.get("model", "mock")
+        if request.get("stream"):
+            self.stream_reply(completion_id, model, pieces, usage, request.get("stream_options") or {})
+        else:
+            if options.tokens_per_second:
+                time.sleep(options.output_tokens / options.tokens_per_second)
+            self.send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(pieces)},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+
+    def stream_reply(self, completion_id, model, pieces, usage, stream_options):
+        options = self.server.options
+        interval = options.chunk_tokens / options.tokens_per_second if options.tokens_per_second else 0
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta, finish_reason=None):
+            body = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            self.wfile.write(b"data: " + json.dumps(body, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+        try:
+            chunk({"role": "assistant", "content": ""})
+            for piece in pieces:
+                if interval:
+                    time.sleep(interval)
+                chunk({"content": piece})
+            chunk({}, "stop")
+            if stream_options.get("include_usage"):
+                body = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model, "choices": [], "usage": usage}
+                self.wfile.write(b"data: " + json.dumps(body).encode("utf-8") + b"\n\n")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开（如取消请求）
+            pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开（如取消请求）
+            pass
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options=None):
+        super().__init__(address, MockHandler)
+        self.options = options or MockOptions()
+        self.stats = MockStats()
+        self.prefix_cache = PrefixCache()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_mock_server(host="127.0.0.1", port=0, **options):
+    """在后台线程中启动模拟服务（port 为 0 时自动分配端口），返回 MockServer，用完调用 shutdown()"""
+    server = MockServer((host, port), MockOptions(**options))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="启动本地模拟的 OpenAI 兼容接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="首字延迟（秒）")
+    parser.add_argument("--output-tokens", type=int, default=200, help="每次回复的输出 token 数")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="输出速度，0 表示不限速")
+    parser.add_argument("--chunk-tokens", type=int, default=8, help="流式输出每个分片的 token 数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回错误的比例（0-1）")
+    parser.add_argument("--error-statuses", default="429,500", help="注入的错误状态码，逗号分隔")
+    parser.add_argument("--retry-after", type=float, help="429 响应携带的 Retry-After 秒数")
+    parser.add_argument("--seed", type=int, help="错误注入的随机种子")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = MockServer((args.host, args.port), MockOptions(
+        latency=args.latency,
+        output_tokens=args.output_tokens,
+        tokens_per_second=args.tokens_per_second,
+        chunk_tokens=args.chunk_tokens,
+        error_rate=args.error_rate,
+        error_statuses=[int(status) for status in args.error_statuses.split(",") if status.strip()],
+        retry_after=args.retry_after,
+        seed=args.seed
+    ))
+    print(f"模拟服务已启动: {server.url}（Ctrl+C 退出）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats.snapshot(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""进度与遥测：按阶段记录已完成/总单元数、处理的字节数和 token 数，并估算剩余时间
+
+ProgressTracker 可在多个线程中同时更新，回调按最小间隔节流，避免高频更新阻塞界面线程。
+"""
+
+import threading
+import time
+
+# 分析流程的各个阶段
+STAGE_IMPORT = "导入"
+STAGE_PREPARE = "准备"
+STAGE_EXTRACT = "提取要点"
+STAGE_MERGE = "合并要点"
+STAGE_GENERATE = "生成结果"
+STAGE_WINDOWS = "分析时间窗口"
+STAGE_DONE = "完成"
+
+# 流式输出时单个调用在完成前最多计入的进度比例
+STREAM_PROGRESS_CAP = 0.95
+
+
+class ProgressTracker:
+    """记录进度并以快照字典回调：stage、done、total、percent、bytes、input_tokens、
+    cached_tokens（命中服务端上下文缓存的输入 token）、output_tokens、elapsed、eta（秒，未知时为 None）
+
+    total 为整个任务的工作单元数（如 API 调用次数或字节数），阶段切换不清零，
+    进度条因此单调前进。
+    """
+
+    def __init__(self, callback=None, interval=0.1, estimated_seconds=None):
+        self.callback = callback
+        self.interval = interval
+        self.estimated_seconds = estimated_seconds
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.last_emit = 0.0
+        self.stage = STAGE_PREPARE
+        self.done = 0.0
+        self.total = 0
+        self.nbytes = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        # 进行中的流式调用：已输出 token 数与预计输出 token 数
+        self.stream_tokens = 0
+        self.expected_output = 0
+
+    def set_stage(self, stage, units=0):
+        """进入新阶段，units 为该阶段新增的工作单元数"""
+        with self.lock:
+            self.stage = stage
+            self.total += units
+        self._emit(force=True)
+
+    def advance(self, units=1, nbytes=0, input_tokens=0, output_tokens=0, cached_tokens=0):
+        """完成 units 个工作单元，并累计处理的字节数和 token 数"""
+        with self.lock:
+            self.done = min(self.total, self.done + units) if self.total else self.done + units
+            self.nbytes += nbytes
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+            self.output_tokens += output_tokens
+            finished = self.total and self.done >= self.total
+        self._emit(force=bool(finished))
+
+    def begin_stream(self, expected_output):
+        """开始一个流式调用，expected_output 为预计输出的 token 数"""
+        with self.lock:
+            self.stream_tokens = 0
+            self.expected_output = max(1, expected_output)
+
+    def stream_output(self, tokens):
+        """流式调用收到新的输出，按已输出 token 数计入当前单元的部分进度"""
+        with self.lock:
+            self.stream_tokens += tokens
+            self.output_tokens += tokens
+        self._emit()
+
+    def end_stream(self):
+        """流式调用结束，清除当前单元的部分进度（输出 token 已在 stream_output 中累计）"""
+        with self.lock:
+            self.stream_tokens = 0
+            self.expected_output = 0
+
+    def finish(self):
+        with self.lock:
+            self.stage = STAGE_DONE
+            self.done = self.total
+            self.stream_tokens = 0
+            self.expected_output = 0
+        self._emit(force=True)
+
+    def snapshot(self):
+        with self.lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        elapsed = time.monotonic() - self.started
+        done = self.done
+        if self.expected_output:
+            done += min(STREAM_PROGRESS_CAP, self.stream_tokens / self.expected_output)
+        done = min(done, self.total) if self.total else done
+
+        # 完成比例过小时按实际速率推算误差大，优先使用请求前的预估耗时
+        if self.total and done >= self.total:
+            eta = 0.0
+        elif self.total and (done >= self.total * 0.1 or (done > 0 and not self.estimated_seconds)):
+            eta = elapsed * (self.total - done) / done
+        elif self.estimated_seconds:
+            eta = max(0.0, self.estimated_seconds - elapsed)
+        else:
+            eta = None
+
+        return {
+            "stage": self.stage,
+            "done": done,
+            "total": self.total,
+            "percent": int(done * 100 / self.total) if self.total else 0,
+            "bytes": self.nbytes,
+            "input_tokens": self.input_tokens,
+            "cached_tokens": self.cached_tokens,
+            "output_tokens": self.output_tokens,
+            "elapsed": round(elapsed, 1),
+            "eta": None if eta is None else round(eta, 1)
+        }
+
+    def _emit(self, force=False):
+        """节流回调：距上次回调不足 interval 秒时跳过（阶段切换和完成时总是回调）"""
+        if not self.callback:
+            return
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.last_emit < self.interval:
+                return
+            self.last_emit = now
+            snapshot = self._snapshot()
+        self.callback(snapshot)
+
+
+def format_progress(snapshot):
+    """将进度快照格式化为一行说明，如 "提取要点 3/10 · 输入 12000 tokens · 剩余约 20 秒" """
+    parts = [snapshot["stage"]]
+    if snapshot["bytes"]:
+        parts.append(f"{snapshot['bytes'] / 1048576:.1f} MB")
+    elif snapshot["total"]:
+        parts[0] += f" {int(snapshot['done'])}/{snapshot['total']}"
+    if snapshot["input_tokens"]:
+        text = f"输入 {snapshot['input_tokens']} tokens"
+        if snapshot["cached_tokens"]:
+            text += f"（缓存命中 {snapshot['cached_tokens']}）"
+        parts.append(text)
+    if snapshot["output_tokens"]:
+        parts.append(f"输出 {snapshot['output_tokens']} tokens")
+    if snapshot["eta"] is not None and snapshot["stage"] != STAGE_DONE:
+        parts.append(f"剩余约 {int(snapshot['eta'] + 0.5)} 秒")
+    elif snapshot["stage"] == STAGE_DONE:
+        parts.append(f"用时 {snapshot['elapsed']} 秒")
+    return " · ".join(parts)
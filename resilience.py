@@ -0,0 +1,238 @@
+"""API 请求的容错层：错误分类、带抖动的指数退避重试和熔断器
+
+请求失败时抛出 AnalysisError 的子类，而不是返回错误字符串，调用方据此决定提示或重试。
+"""
+
+import email.utils
+import random
+import threading
+import time
+
+import openai
+
+from cancellation import current_token
+
+
+class AnalysisError(Exception):
+    """分析请求失败的基类"""
+    retryable = False
+
+
+class TransientError(AnalysisError):
+    """可重试的临时错误（网络中断、超时、服务端 5xx），retry_after 为服务端建议的等待秒数"""
+    retryable = True
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RequestTimeoutError(TransientError):
+    pass
+
+
+class RateLimitedError(TransientError):
+    """请求过于频繁（429），同时会降低并发数"""
+    pass
+
+
+class PermanentError(AnalysisError):
+    """重试也无法成功的错误，如 API Key 无效或请求参数错误"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(AnalysisError):
+    """熔断器打开：连续失败过多，暂停发送请求"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CancelledError(AnalysisError):
+    """任务已被取消（见 cancellation.CancelToken），进行中的请求已中断"""
+
+    def __init__(self, message="任务已取消"):
+        super().__init__(message)
+
+
+def check_cancelled():
+    """当前任务已被取消时抛出 CancelledError"""
+    token = current_token()
+    if token is not None and token.cancelled:
+        raise CancelledError()
+
+
+def parse_retry_after(headers):
+    """解析 retry-after-ms / Retry-After 响应头（秒数或 HTTP 日期），无法解析时返回 None"""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error):
+    """将 OpenAI SDK 抛出的异常转换为对应的 AnalysisError 子类，其他异常原样返回"""
+    if isinstance(error, AnalysisError):
+        return error
+    if isinstance(error, openai.APITimeoutError):
+        return RequestTimeoutError(f"请求超时: {error}")
+    if isinstance(error, openai.APIConnectionError):
+        return TransientError(f"网络连接失败: {error}")
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+        retry_after = parse_retry_after(getattr(error.response, "headers", None))
+        if status == 429:
+            return RateLimitedError(f"请求过于频繁 (429): {error.message}", retry_after)
+        if status >= 500 or status in (408, 409):
+            return TransientError(f"服务暂时不可用 ({status}): {error.message}", retry_after)
+        return PermanentError(f"请求被拒绝 ({status}): {error.message}", status)
+    return error
+
+
+class RetryPolicy:
+    """带完全抖动的指数退避：第 n 次重试前等待 [0, min(max_delay, base_delay * 2^n)] 内的随机时间，
+    服务端给出 Retry-After 时至少等待该时间
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            return max(backoff, min(retry_after, self.max_delay * 4))
+        return backoff
+
+
+class CircuitBreaker:
+    """熔断器：连续 failure_threshold 次临时错误后打开，reset_timeout 秒内直接拒绝请求；
+    之后进入半开状态放行一个试探请求，成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError(f"连续请求失败，已暂停发送请求，请在 {max(1, int(remaining + 0.5))} 秒后重试",
+                                   max(0.0, remaining))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """试探请求未能说明服务是否恢复（被取消、程序错误等）时调用：回到打开状态且无需再等待，
+        下一个请求重新试探；不在半开状态时不做任何事
+        """
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic() - self.reset_timeout
+
+
+def call_with_retry(func, policy, breaker=None, concurrency=None, can_retry=None, sleep=time.sleep):
+    """调用 func，临时错误按 policy 退避重试，返回 func 的结果或抛出 AnalysisError
+
+    breaker 为熔断器；concurrency 为自适应并发限制（见 dispatch.AdaptiveConcurrency），
+    每次尝试前获取名额，被限流时降低并发数；can_retry() 返回 False 时不再重试
+    （如流式输出已回调部分内容）。当前任务被取消时（见 cancellation）抛出 CancelledError，
+    不再重试，退避等待也会提前结束。
+    """
+    token = current_token()
+    attempt = 0
+    while True:
+        check_cancelled()
+        if breaker:
+            breaker.before_call()
+        if concurrency:
+            try:
+                concurrency.acquire()
+            except CancelledError:
+                if breaker:
+                    breaker.release_probe()
+                raise
+        try:
+            result = func()
+        except Exception as e:
+            error = classify_error(e)
+            if concurrency:
+                concurrency.release(throttled=isinstance(error, RateLimitedError))
+            # 取消时中断连接引起的错误不计入熔断器
+            if token is not None and token.cancelled:
+                if breaker:
+                    breaker.release_probe()
+                raise CancelledError() from e
+            if not isinstance(error, AnalysisError) or not error.retryable:
+                if breaker:
+                    # 服务端作出了响应（如 4xx）说明服务可用，其他错误放弃本次试探
+                    if getattr(error, "status_code", None) is not None:
+                        breaker.record_success()
+                    else:
+                        breaker.release_probe()
+                if not isinstance(error, AnalysisError):
+                    raise
+                raise error from (None if error is e else e)
+            cause = None if error is e else e
+            if breaker:
+                breaker.record_failure()
+            attempt += 1
+            if attempt >= policy.max_attempts or (can_retry and not can_retry()):
+                raise error from cause
+            delay = policy.delay(attempt - 1, error.retry_after)
+            if token is not None:
+                if token.wait(delay):
+                    raise CancelledError() from cause
+            else:
+                sleep(delay)
+            continue
+
+        if concurrency:
+            concurrency.release()
+        if breaker:
+            breaker.record_success()
+        return result
@@ -0,0 +1,147 @@
+"""响应缓存：以 (模型, 消息) 的哈希为键，内存 LRU 在前、磁盘存储在后"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    def __init__(self, cache_dir, max_memory_entries=256, max_disk_bytes=200 * 1024 * 1024,
+                 max_age_seconds=30 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age_seconds = max_age_seconds
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.puts_since_prune = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.prune()
+
+    @staticmethod
+    def make_key(model, messages):
+        """计算缓存键：模型与完整消息列表（含系统提示词和用户内容）的 SHA-256"""
+        payload = json.dumps([model, messages], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def _expired(self, created):
+        return self.max_age_seconds and time.time() - created > self.max_age_seconds
+
+    def get(self, key):
+        """查询缓存，未命中或已过期时返回 None"""
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and not self._expired(entry["created"]):
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return entry["content"]
+            self.memory.pop(key, None)
+
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        with self.lock:
+            if entry is None or self._expired(entry["created"]):
+                if entry is not None:
+                    self._remove_file(path)
+                self.misses += 1
+                return None
+            self._remember(key, entry)
+            self.hits += 1
+            self.disk_hits += 1
+
+        # 刷新修改时间，供按大小清理时按最近使用排序
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["content"]
+
+    def put(self, key, content):
+        entry = {"created": time.time(), "content": content}
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # 先写临时文件再替换，避免中断时留下损坏的缓存文件
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self._remember(key, entry)
+            self.puts_since_prune += 1
+            should_prune = self.puts_since_prune >= 64
+        if should_prune:
+            self.prune()
+
+    def _remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def prune(self):
+        """清理磁盘缓存：删除过期条目，总大小超限时按最近使用时间从旧到新删除"""
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if self._expired(stat.st_mtime):
+                    self._remove_file(path)
+                else:
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        if self.max_disk_bytes and total > self.max_disk_bytes:
+            files.sort()
+            for _, size, path in files:
+                if total <= self.max_disk_bytes:
+                    break
+                self._remove_file(path)
+                total -= size
+
+        with self.lock:
+            self.puts_since_prune = 0
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                self._remove_file(os.path.join(root, name))
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "memory_entries": len(self.memory),
+                "hit_rate": self.hits / total if total else 0.0
+            }
@@ -0,0 +1,245 @@
+"""聊天记录全文检索：导入时建立内存倒排索引，按主题检索相关消息，供聚焦分析只发送检索到的内容
+
+中文按相邻两字切分（单字的中文片段保留单字），英文和数字按单词切分并转为小写。
+查询中以空格分隔的各个词为"或"的关系，每个词的全部切分结果都出现的消息才算命中该词，
+随后按 BM25 打分排序，并逐条核对消息确实包含该词，排除切分结果分散出现的误命中。
+"""
+
+import math
+import re
+import time
+from array import array
+
+import numpy as np
+
+from chat_log import ChatLog
+from metrics import METRICS
+
+LATIN_WORD = re.compile(r"[a-z0-9_]+")
+ASCII_WORD = re.compile(r"[A-Za-z0-9_]+")
+CJK_RUN = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 默认返回的命中条数
+DEFAULT_LIMIT = 200
+
+
+def tokenize(text):
+    """切分为去重后的检索词：中文双字（单字片段保留单字）和小写的英文/数字单词"""
+    text = text.lower()
+    tokens = set(LATIN_WORD.findall(text))
+    for run in CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.add(run)
+        else:
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class SearchResult:
+    """检索结果：按相关度从高到低排列的行号及分数；candidates 为过滤后的候选行数（核对前）"""
+
+    def __init__(self, rows, scores, candidates, seconds):
+        self.rows = rows
+        self.scores = scores
+        self.candidates = candidates
+        self.seconds = seconds
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class SearchIndex:
+    """倒排索引：检索词 -> 包含该词的行号（升序）
+
+    可按导入的分块逐块追加（add），行号按追加顺序连续编号，与分块拼接成的 ChatLog 下标一致；
+    检索时传入该 ChatLog 读取消息正文、作者和时间。
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.postings = {}
+        # 各行消息的字数，用于 BM25 的长度归一化
+        self.lengths = array('i')
+        self.total_length = 0
+
+    @classmethod
+    def build(cls, chat_log):
+        index = cls()
+        index.add(chat_log)
+        return index
+
+    def add(self, chat_log):
+        """追加一个分块（ChatLog）中的全部消息
+
+        中文部分向量化处理：整块消息一次解码为码位数组，同一消息中相邻的两个汉字编码为一个整数，
+        按（检索词, 行号）去重排序后整段追加到倒排表；英文和数字单词数量较少，逐个处理。
+        """
+        count = len(chat_log)
+        if not count:
+            return
+        with METRICS.timer("stage_seconds", stage="search_index"):
+            self._add(chat_log, count)
+
+    def _add(self, chat_log, count):
+        base = self.size
+        # 由 UTF-8 的首字节数得到各消息的字数，无需逐条解码
+        raw = np.frombuffer(chat_log.buffer, dtype=np.uint8)
+        char_ends = np.concatenate(([0], np.cumsum((raw & 0xC0) != 0x80)))
+        bounds = char_ends[np.frombuffer(chat_log.offsets, dtype=np.int64)]
+        lengths = np.diff(bounds).astype(np.int32)
+        self.lengths.frombytes(lengths.tobytes())
+        self.total_length += int(lengths.sum())
+        self.size += count
+
+        text = chat_log.buffer.decode("utf-8")
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        owner = np.repeat(np.arange(base, base + count, dtype=np.int32), lengths)
+        cjk = ((codes >= 0x3400) & (codes <= 0x9FFF)) | ((codes >= 0xF900) & (codes <= 0xFAFF))
+
+        # 双字：同一消息中相邻的两个汉字；单字：前后都不是同一消息中汉字的孤立汉字
+        pair = cjk[:-1] & cjk[1:] & (owner[:-1] == owner[1:])
+        single = cjk & ~np.concatenate(([False], pair)) & ~np.concatenate((pair, [False]))
+        keys = np.concatenate(((codes[:-1][pair] << 21) | codes[1:][pair], codes[single]))
+        rows = np.concatenate((owner[:-1][pair], owner[single]))
+
+        if len(keys):
+            order = np.lexsort((rows, keys))
+            keys, rows = keys[order], rows[order]
+            keep = np.concatenate(([True], (keys[1:] != keys[:-1]) | (rows[1:] != rows[:-1])))
+            keys, rows = keys[keep], rows[keep]
+            starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1, [len(keys)])).tolist()
+            for begin, end in zip(starts[:-1], starts[1:]):
+                key = int(keys[begin])
+                token = chr(key >> 21) + chr(key & 0x1FFFFF) if key >> 21 else chr(key)
+                self._posting(token).frombytes(rows[begin:end].tobytes())
+
+        # 各消息首尾相接，跨越消息边界的匹配在边界处拆开
+        word_rows = {}
+        for match in ASCII_WORD.finditer(text):
+            begin, stop = match.span()
+            first, last = int(owner[begin]), int(owner[stop - 1])
+            if first == last:
+                word_rows.setdefault(match.group().lower(), []).append(first)
+                continue
+            for row in range(first, last + 1):
+                part = text[max(begin, int(bounds[row - base])):min(stop, int(bounds[row - base + 1]))]
+                if part:
+                    word_rows.setdefault(part.lower(), []).append(row)
+        for token, token_rows in word_rows.items():
+            self._posting(token).extend(sorted(set(token_rows)))
+
+    def _posting(self, token):
+        posting = self.postings.get(token)
+        if posting is None:
+            posting = self.postings[token] = array('i')
+        return posting
+
+    def _rows(self, token):
+        posting = self.postings.get(token)
+        if posting is None:
+            return np.empty(0, dtype=np.int32)
+        return np.frombuffer(posting, dtype=np.int32)
+
+    def _term_rows(self, term):
+        """包含 term 全部检索词的行号；单个汉字同时匹配含该字的双字检索词"""
+        tokens = tokenize(term)
+        if not tokens:
+            return np.empty(0, dtype=np.int32)
+        result = None
+        for token in sorted(tokens, key=lambda t: len(self.postings.get(t, ()))):
+            if len(token) == 1 and CJK_RUN.fullmatch(token):
+                related = [self._rows(key) for key in self.postings if token in key]
+                rows = np.unique(np.concatenate(related)) if related else np.empty(0, dtype=np.int32)
+            else:
+                rows = self._rows(token)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    def search(self, chat_log, query, authors=None, start=None, end=None, limit=DEFAULT_LIMIT):
+        """检索 chat_log（需包含建立索引的全部行）中与 query 相关的消息
+
+        authors 为作者名列表；start / end 为时间范围 [start, end) 的秒数，任一端可为 None。
+        返回最多 limit 条的 SearchResult，limit 为 None 时返回全部命中。
+        """
+        started = time.perf_counter()
+        terms = [term for term in query.split() if tokenize(term)]
+        empty = SearchResult(np.empty(0, dtype=np.int64), np.empty(0), 0, 0.0)
+        if not terms or not self.size:
+            return empty
+
+        average_length = self.total_length / self.size or 1.0
+        term_rows = [self._term_rows(term) for term in terms]
+        candidates = term_rows[0] if len(term_rows) == 1 else np.unique(np.concatenate(term_rows))
+
+        # 作者和时间过滤在候选行上向量化完成
+        if authors:
+            codes = [chat_log.author_index[name] for name in authors if name in chat_log.author_index]
+            author_codes = np.frombuffer(chat_log.author_codes, dtype=np.int32)
+            candidates = candidates[np.isin(author_codes[candidates], codes)]
+        if start is not None or end is not None:
+            stamps = np.frombuffer(chat_log.timestamps, dtype=np.int64)[candidates]
+            keep = stamps != ChatLog.MISSING_TIME
+            if start is not None:
+                keep &= stamps >= start
+            if end is not None:
+                keep &= stamps < end
+            candidates = candidates[keep]
+        if not len(candidates):
+            return SearchResult(empty.rows, empty.scores, 0, time.perf_counter() - started)
+
+        # BM25：每个命中的词按词频 1 计分，短消息得分更高
+        lengths = np.frombuffer(self.lengths, dtype=np.int32)[candidates]
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+        scores = np.zeros(len(candidates))
+        for term, rows in zip(terms, term_rows):
+            df = len(rows)
+            idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            matched = np.isin(candidates, rows, assume_unique=True)
+            scores += matched * idf * (BM25_K1 + 1) / (1 + norm)
+
+        # 分数相同时较新的消息在前
+        order = np.lexsort((-candidates, -scores))
+        lowered = [term.lower() for term in terms]
+        hits, hit_scores = [], []
+        for position in order:
+            row = int(candidates[position])
+            message = chat_log.message(row).lower()
+            if any(term in message for term in lowered):
+                hits.append(row)
+                hit_scores.append(float(scores[position]))
+                if limit is not None and len(hits) >= limit:
+                    break
+        seconds = time.perf_counter() - started
+        METRICS.observe("stage_seconds", seconds, stage="search")
+        return SearchResult(np.array(hits, dtype=np.int64), np.array(hit_scores), len(candidates), seconds)
+
+
+def focused_lines(chat_log, rows, context=2, token_budget=None, count_tokens=None):
+    """按相关度依次取命中行及其前后各 context 条消息，按时间顺序拼接为聊天记录行
+
+    不相邻的片段之间插入省略说明；提供 token_budget 和 count_tokens 时，加入下一个片段会超出预算即停止。
+    """
+    selected = set()
+    used = 0
+    for row in rows:
+        window = [i for i in range(max(0, row - context), min(len(chat_log), row + context + 1))
+                  if i not in selected]
+        if token_budget is not None and count_tokens:
+            cost = sum(count_tokens(chat_log.format_line(i)) for i in window)
+            if selected and used + cost > token_budget:
+                break
+            used += cost
+        selected.update(window)
+
+    lines = []
+    previous = -1
+    for i in sorted(selected):
+        if previous >= 0 and i > previous + 1:
+            lines.append(f"……（省略 {i - previous - 1} 条消息）……")
+        lines.append(chat_log.format_line(i))
+        previous = i
+    return lines
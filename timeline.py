@@ -0,0 +1,144 @@
+"""按时间窗口划分聊天记录：时间戳只排序一次建立索引，日期范围和时间窗口均通过二分查找定位
+
+聊天记录的时间戳在导入时已解析为秒数（见 ChatLog），TimeIndex 在此基础上建立升序索引；
+文件本身按时间排列时直接使用原有顺序，不复制数据。
+"""
+
+import time
+
+import numpy as np
+
+from chat_log import ChatLog
+
+DAY = 86400
+WEEK = 7 * DAY
+# 1970-01-01 是星期四，按周划分时以星期一零点为起点
+WEEK_OFFSET = 4 * DAY
+WINDOW_NAMES = {"day": DAY, "week": WEEK}
+
+
+def window_seconds(window):
+    """解析窗口长度："day"、"week"、"6h"、"3d" 或秒数"""
+    if isinstance(window, (int, float)):
+        seconds = int(window)
+    elif window in WINDOW_NAMES:
+        seconds = WINDOW_NAMES[window]
+    else:
+        text = str(window).strip().lower()
+        scale = {"h": 3600, "d": DAY, "w": WEEK}.get(text[-1:], 1)
+        try:
+            seconds = int(float(text.rstrip("hdw")) * scale)
+        except ValueError:
+            raise ValueError(f"无法识别的时间窗口: {window}") from None
+    if seconds <= 0:
+        raise ValueError(f"时间窗口必须大于 0: {window}")
+    return seconds
+
+
+def day_start(day):
+    """date 当天零点对应的秒数（与 ChatLog 的时间戳一致，按字面时间计算）"""
+    return (day.toordinal() - 719163) * DAY
+
+
+class TimeWindow:
+    """一个时间窗口：[start, end) 秒数范围及其中按时间排列的聊天记录"""
+
+    def __init__(self, start, end, chat_log):
+        self.start = start
+        self.end = end
+        self.chat_log = chat_log
+
+    @property
+    def label(self):
+        """如 "2024-03-01"、"2024-03-04 ~ 2024-03-10" 或 "2024-03-01 06:00 ~ 12:00" """
+        first, last = time.gmtime(self.start), time.gmtime(self.end - 1)
+        if self.start % DAY == 0 and self.end % DAY == 0:
+            if self.end - self.start == DAY:
+                return time.strftime("%Y-%m-%d", first)
+            return f"{time.strftime('%Y-%m-%d', first)} ~ {time.strftime('%Y-%m-%d', last)}"
+        end_format = "%H:%M" if first[:3] == time.gmtime(self.end)[:3] else "%Y-%m-%d %H:%M"
+        return f"{time.strftime('%Y-%m-%d %H:%M', first)} ~ {time.strftime(end_format, time.gmtime(self.end))}"
+
+
+class TimeIndex:
+    """聊天记录的时间索引
+
+    keys 为升序排列的时间戳，order[i] 为 keys[i] 所在的行号；聊天记录本身已按时间排列时
+    order 为 None。无法解析时间的行不进入索引，数量见 missing。
+    """
+
+    def __init__(self, chat_log):
+        self.chat_log = chat_log
+        # 建立索引时的条数，聊天记录之后有追加时需重新建立
+        self.size = len(chat_log)
+        stamps = np.frombuffer(chat_log.timestamps, dtype=np.int64) if chat_log else np.empty(0, np.int64)
+        valid = stamps != ChatLog.MISSING_TIME
+        self.missing = int(len(stamps) - valid.sum())
+        if not self.missing and bool(np.all(stamps[1:] >= stamps[:-1])):
+            self.order = None
+            self.keys = stamps.copy()
+        else:
+            rows = np.flatnonzero(valid)
+            self.order = rows[np.argsort(stamps[rows], kind="stable")]
+            self.keys = stamps[self.order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def first(self):
+        return int(self.keys[0]) if len(self.keys) else None
+
+    @property
+    def last(self):
+        return int(self.keys[-1]) if len(self.keys) else None
+
+    def bounds(self, start=None, end=None):
+        """[start, end) 时间范围在 keys 中对应的位置区间，二分查找"""
+        lo = 0 if start is None else int(np.searchsorted(self.keys, start, "left"))
+        hi = len(self.keys) if end is None else int(np.searchsorted(self.keys, end, "left"))
+        return lo, max(lo, hi)
+
+    def rows(self, lo, hi):
+        """keys[lo:hi] 对应的聊天记录，按时间排列"""
+        if self.order is None:
+            return self.chat_log.slice(lo, hi)
+        return self.chat_log.take(self.order[lo:hi])
+
+    def select(self, start=None, end=None):
+        """取出 [start, end) 时间范围内的聊天记录"""
+        return self.rows(*self.bounds(start, end))
+
+    def windows(self, window="day", start=None, end=None):
+        """按窗口长度划分 [start, end) 范围内的聊天记录，返回非空窗口的 TimeWindow 列表
+
+        按天从零点对齐，按周从星期一零点对齐；自定义长度从范围内第一天（指定 start 时为 start 当天）
+        的零点起依次划分，不能整除一天的长度（如 5 小时）也从该日零点开始。
+        """
+        size = window_seconds(window)
+        lo, hi = self.bounds(start, end)
+        if lo >= hi:
+            return []
+        if size % WEEK == 0:
+            offset = WEEK_OFFSET
+        else:
+            first = int(self.keys[lo]) if start is None else start
+            offset = first // DAY * DAY
+
+        ids = (self.keys[lo:hi] - offset) // size
+        # 窗口编号变化的位置即各窗口在 keys 中的起点
+        starts = np.concatenate(([0], np.flatnonzero(ids[1:] != ids[:-1]) + 1)) + lo
+        ends = np.append(starts[1:], hi)
+        windows = []
+        for begin, stop in zip(starts.tolist(), ends.tolist()):
+            window_start = int(ids[begin - lo]) * size + offset
+            windows.append(TimeWindow(window_start, window_start + size, self.rows(begin, stop)))
+        return windows
+
+
+def format_timeline(windows, summaries):
+    """将各窗口的分析结果按时间顺序拼接为时间线文本"""
+    return "\n\n".join(
+        f"## {window.label}（{len(window.chat_log)} 条消息）\n\n{summary}"
+        for window, summary in zip(windows, summaries)
+    )
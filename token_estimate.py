@@ -0,0 +1,142 @@
+"""请求前的本地 token 估算，以及按模型估算耗时和费用"""
+
+import math
+from collections import Counter
+
+import numpy as np
+
+# DeepSeek 官方给出的换算比例：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token
+CJK_TOKEN_RATIO = 0.6
+LATIN_TOKEN_RATIO = 0.3
+# "[YYYY-MM-DD HH:MM:SS] " + ": " + 换行，每行固定的 ASCII 字符数
+LINE_OVERHEAD_CHARS = 25
+
+# 各模型的价格（元 / 百万 token）与耗时参数，可在配置文件中覆盖
+MODEL_PROFILES = {
+    "deepseek-chat": {
+        "input_price": 2.0,
+        "cached_input_price": 0.5,
+        "output_price": 8.0,
+        "first_token_seconds": 1.5,
+        "prefill_tokens_per_second": 4000.0,
+        "output_tokens_per_second": 30.0,
+        "output_tokens": 1000
+    },
+    "deepseek-reasoner": {
+        "input_price": 4.0,
+        "cached_input_price": 1.0,
+        "output_price": 16.0,
+        "first_token_seconds": 5.0,
+        "prefill_tokens_per_second": 3000.0,
+        "output_tokens_per_second": 25.0,
+        # 含推理过程输出的 token
+        "output_tokens": 3000
+    }
+}
+
+
+def count_tokens(chars, utf8_bytes):
+    """由字符数和 UTF-8 字节数估算 token 数
+
+    ASCII 字符占 1 字节，常用中日韩字符占 3 字节，因此多出的字节数的一半即为
+    非 ASCII 字符数的近似值，无需逐字符判断。
+    """
+    wide = max(0, (utf8_bytes - chars) // 2)
+    narrow = chars - wide
+    return int(wide * CJK_TOKEN_RATIO + narrow * LATIN_TOKEN_RATIO) + 1
+
+
+def estimate_tokens(text):
+    """估算文本的 token 数，O(n) 且只依赖字符串的内置操作"""
+    return count_tokens(len(text), len(text.encode('utf-8')))
+
+
+def estimate_log_tokens(chat_log):
+    """估算 ChatLog 按 "[时间] 作者: 消息" 格式展开后的 token 数，无需逐行拼接文本"""
+    lines = len(chat_log)
+    if not lines:
+        return 0
+    # 字符数即非续字节（10xxxxxx 以外）的字节数，无需解码整个缓冲区
+    chars = int(np.count_nonzero((np.frombuffer(chat_log.buffer, dtype=np.uint8) & 0xC0) != 0x80))
+    tokens = count_tokens(chars, len(chat_log.buffer))
+    tokens += int(lines * LINE_OVERHEAD_CHARS * LATIN_TOKEN_RATIO)
+    for code, count in Counter(chat_log.author_codes).items():
+        tokens += estimate_tokens(chat_log.authors[code]) * count
+    return tokens
+
+
+def model_profile(model, overrides=None):
+    profile = dict(MODEL_PROFILES.get(model, MODEL_PROFILES["deepseek-chat"]))
+    if overrides:
+        profile.update(overrides.get(model, {}))
+    return profile
+
+
+def estimate_request(model, input_tokens, single_limit, chunk_budget, concurrency=1, profile_overrides=None,
+                     fan_in=8):
+    """估算一次分析的调用次数、输出 token、耗时（秒）和费用（元）
+
+    输入超过单次调用上限时按分块分析估算：块数按 chunking.split_chat_lines 的平均块大小计算，
+    各块并发提取要点（按并发数分批），部分摘要每 fan_in 份逐级合并，最后一次调用生成结果。
+    """
+    # chunking 依赖本模块，按需导入
+    from chunking import expected_chunk_tokens, merge_levels
+    
+    profile = model_profile(model, profile_overrides)
+    output_per_call = profile["output_tokens"]
+
+    def call_seconds(tokens_in, tokens_out):
+        return (profile["first_token_seconds"]
+                + tokens_in / profile["prefill_tokens_per_second"]
+                + tokens_out / profile["output_tokens_per_second"])
+
+    if input_tokens <= single_limit:
+        calls = 1
+        total_input = input_tokens
+        total_output = output_per_call
+        seconds = call_seconds(input_tokens, output_per_call)
+    else:
+        chunks = math.ceil(input_tokens / expected_chunk_tokens(chunk_budget))
+        rounds = math.ceil(chunks / max(1, concurrency))
+        chunk_tokens = input_tokens / chunks
+        calls = chunks
+        total_input = input_tokens
+        seconds = rounds * call_seconds(chunk_tokens, output_per_call)
+        # 逐级合并：每层的输入为上一层的全部部分摘要，同一层的合并调用并发进行
+        summaries = chunks
+        for groups in merge_levels(chunks, fan_in):
+            merge_input = summaries * output_per_call
+            calls += groups
+            total_input += merge_input
+            seconds += math.ceil(groups / max(1, concurrency)) * call_seconds(merge_input / groups, output_per_call)
+            summaries = groups
+        reduce_input = summaries * output_per_call
+        calls += 1
+        total_input += reduce_input
+        total_output = output_per_call * calls
+        seconds += call_seconds(reduce_input, output_per_call)
+
+    cost = (total_input * profile["input_price"] + total_output * profile["output_price"]) / 1000000
+    return {
+        "model": model,
+        "input_tokens": int(input_tokens),
+        "calls": calls,
+        "output_tokens": int(total_output),
+        "seconds": round(seconds, 1),
+        "cost": round(cost, 4)
+    }
+
+
+def within_budget(estimate, budget):
+    """检查估算结果是否满足预算（budget 中为 None 或缺失的项不限制）"""
+    limits = (
+        ("max_input_tokens", estimate["input_tokens"]),
+        ("max_seconds", estimate["seconds"]),
+        ("max_cost", estimate["cost"])
+    )
+    return all(not budget.get(key) or value <= budget[key] for key, value in limits)
+
+
+def describe_estimate(estimate):
+    return (f"预计输入 {estimate['input_tokens']} tokens，{estimate['calls']} 次调用，"
+            f"约 {estimate['seconds']} 秒，约 ¥{estimate['cost']:.4f}（{estimate['model']}）")